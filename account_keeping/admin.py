@@ -16,6 +16,22 @@ class AccountAdmin(admin.ModelAdmin):
 admin.site.register(models.Account, AccountAdmin)
 
 
+class MonthlyBalanceAdmin(admin.ModelAdmin):
+    list_display = ['account', 'month', 'balance']
+    list_filter = ['account']
+    date_hierarchy = 'month'
+admin.site.register(models.MonthlyBalance, MonthlyBalanceAdmin)
+
+
+class MonthSummaryAdmin(admin.ModelAdmin):
+    list_display = [
+        'month', 'branch', 'base_currency', 'income', 'expenses', 'new',
+        'outstanding', 'balance', 'uses_fallback_rate']
+    list_filter = ['branch', 'base_currency', 'uses_fallback_rate']
+    date_hierarchy = 'month'
+admin.site.register(models.MonthSummary, MonthSummaryAdmin)
+
+
 class InvoiceAdmin(admin.ModelAdmin):
     list_display = [
         'invoice_type', 'invoice_date', 'invoice_number', 'description',
@@ -48,3 +64,19 @@ class TransactionAdmin(admin.ModelAdmin):
     search_fields = [
         'invoice_number', 'invoice__invoice_number', 'description']
 admin.site.register(models.Transaction, TransactionAdmin)
+
+
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = [
+        'creation_date', 'user', 'branch', 'start', 'end', 'export_format',
+        'status', 'progress', 'total']
+    list_filter = ['status', 'export_format', 'branch']
+admin.site.register(models.ExportJob, ExportJobAdmin)
+
+
+class ImportCheckpointAdmin(admin.ModelAdmin):
+    list_display = [
+        'update_date', 'account', 'importer', 'filename', 'position',
+        'finished']
+    list_filter = ['importer', 'finished', 'account']
+admin.site.register(models.ImportCheckpoint, ImportCheckpointAdmin)
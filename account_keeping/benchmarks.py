@@ -0,0 +1,241 @@
+"""
+Benchmarks of the views, the export and the importer.
+
+Each benchmark runs against synthetic ledgers of several scales (see
+``generator``). Each run is measured by its wall-clock time and its number of
+queries. The first run of a benchmark is the cold one. Later runs profit from
+cached rates and month summaries.
+
+"""
+from collections import OrderedDict
+import csv
+import datetime
+import os
+import platform
+import random
+import tempfile
+import time
+
+import django
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils.encoding import force_bytes
+from django.utils.six import StringIO
+
+from . import __version__
+from . import freckle_api
+from . import generator
+from . import importers
+from . import models
+from . import rates
+
+#: Settings of the benchmarks. A private cache keeps the benchmarks from
+#: touching the caches of the site and the fake Freckle client keeps the
+#: network out of the numbers.
+BENCHMARK_SETTINGS = {
+    'CACHES': {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'account-keeping-benchmarks',
+        },
+    },
+    'ACCOUNT_KEEPING_FRECKLE_CLIENT':
+        'account_keeping.freckle_api.FakeFreckleClient',
+    'ACCOUNT_KEEPING_FRECKLE_BACKGROUND_REFRESH': False,
+    'ACCOUNT_KEEPING_EXPORT_RUNNER': 'account_keeping.jobs.queue_job',
+}
+
+
+def get_median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+class BenchmarkSuite(object):
+    """
+    Runs all benchmarks at the given scales and returns a report.
+
+    The ledger of each scale is created in a transaction, that is rolled back
+    afterwards, so the scales don't influence each other. Run the suite
+    against an empty (i.e. a test) database.
+
+    :param scales: Names of the ``generator.SCALES`` or dicts of volumes.
+    :param repeat: Number of runs of each benchmark.
+    :param seed: Seed of the synthetic ledgers.
+    :param log: Optional callable, that receives progress messages.
+
+    """
+    benchmarks = ['month', 'year', 'alltime', 'index', 'payees', 'export',
+                  'importer']
+
+    def __init__(self, scales=None, repeat=3, seed=0, log=None):
+        self.scales = scales or ['small']
+        self.repeat = repeat
+        self.seed = seed
+        self.log = log or (lambda message: None)
+
+    def get_environment(self):
+        return OrderedDict([
+            ('account_keeping', __version__),
+            ('django', django.get_version()),
+            ('python', platform.python_version()),
+            ('database', connection.vendor),
+            ('platform', platform.platform()),
+        ])
+
+    def measure(self, function, setup=None):
+        """
+        Runs the function ``repeat`` times and returns the numbers.
+
+        The optional setup callable runs before each run and isn't measured.
+        Its return value is passed to the function.
+
+        """
+        result = OrderedDict([('seconds', []), ('queries', [])])
+        for index in range(self.repeat):
+            argument = setup() if setup else None
+            with CaptureQueriesContext(connection) as queries:
+                started = time.time()
+                status = function(argument)
+                seconds = time.time() - started
+            result['seconds'].append(round(seconds, 6))
+            result['queries'].append(len(queries))
+            result['status'] = status
+        result['median_seconds'] = round(get_median(result['seconds']), 6)
+        return result
+
+    def get_page(self, url, data=None):
+        if data is None:
+            response = self.client.get(url)
+        else:
+            response = self.client.post(url, data)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response.status_code
+
+    def bench_month(self):
+        return self.measure(lambda arg: self.get_page(reverse(
+            'account_keeping_month', kwargs={
+                'year': self.last_month.year,
+                'month': self.last_month.month})))
+
+    def bench_year(self):
+        return self.measure(lambda arg: self.get_page(reverse(
+            'account_keeping_year', kwargs={'year': self.last_month.year})))
+
+    def bench_alltime(self):
+        return self.measure(lambda arg: self.get_page(reverse(
+            'account_keeping_all')))
+
+    def bench_index(self):
+        return self.measure(lambda arg: self.get_page(reverse(
+            'account_keeping_index')))
+
+    def bench_payees(self):
+        return self.measure(lambda arg: self.get_page(reverse(
+            'account_keeping_payees')))
+
+    def bench_export(self):
+        return self.measure(lambda arg: self.get_page(
+            reverse('account_keeping_export'), {
+                'start': self.first_month.strftime('%Y-%m-%d'),
+                'end': self.end.strftime('%Y-%m-%d'),
+                'format': 'csv',
+            }))
+
+    def bench_importer(self):
+        """Imports an MMEX file with a row per transaction of one account."""
+        account = models.Account.objects.first()
+        rows = models.Transaction.objects.filter(
+            account=account, parent__isnull=True).count()
+        path = self.write_mmex_file(rows)
+        try:
+            def setup():
+                # A new account each time, so that nothing is skipped
+                return models.Account.objects.create(
+                    name='Import', slug='import', branch=account.branch,
+                    currency=account.currency)
+
+            def run(new_account):
+                importers.import_file(
+                    importers.get_importer('mmex'), path, new_account)
+                return 'ok'
+            result = self.measure(run, setup)
+        finally:
+            os.remove(path)
+        result['rows'] = rows
+        return result
+
+    def write_mmex_file(self, rows):
+        rng = random.Random(self.seed)
+        output = StringIO()
+        writer = csv.writer(output)
+        for index in range(rows):
+            date = self.first_month + datetime.timedelta(
+                days=rng.randint(0, (self.end - self.first_month).days))
+            writer.writerow([
+                date.strftime('%d/%m/%Y'),
+                'Payee {0}'.format(rng.randint(0, 99)),
+                rng.choice(['Withdrawal', 'Deposit']),
+                '{0:.2f}'.format(rng.randint(500, 50000) / 100.0),
+                'Category {0}'.format(rng.randint(0, 9)),
+                '', '', 'Row {0}'.format(index),
+            ])
+        with tempfile.NamedTemporaryFile(
+                suffix='.csv', delete=False) as file_:
+            file_.write(force_bytes(output.getvalue()))
+        return file_.name
+
+    def run_scale(self, name, counts):
+        """Creates the ledger of the scale and runs all benchmarks."""
+        result = OrderedDict()
+        with transaction.atomic():
+            started = time.time()
+            result['counts'] = generator.LedgerGenerator(
+                seed=self.seed, **counts).generate()
+            result['generate_seconds'] = round(time.time() - started, 6)
+            months = models.Transaction.objects.dates(
+                'transaction_date', 'month')
+            self.first_month, self.last_month = months.first(), months.last()
+            self.end = models.Transaction.objects.latest(
+                'transaction_date').transaction_date
+            user = User.objects.create(username='benchmark', is_superuser=True)
+            self.client = Client()
+            self.client.force_login(user)
+            freckle_api.refresh_unpaid_invoices()
+            result['benchmarks'] = OrderedDict()
+            for benchmark in self.benchmarks:
+                result['benchmarks'][benchmark] = getattr(
+                    self, 'bench_{0}'.format(benchmark))()
+                self.log('{0} {1}: {2:.1f} ms, {3} queries'.format(
+                    name, benchmark,
+                    result['benchmarks'][benchmark]['median_seconds'] * 1000,
+                    result['benchmarks'][benchmark]['queries'][-1]))
+            transaction.set_rollback(True)
+        # The primary keys of the rolled back objects are used again
+        rates.rate_cache.invalidate()
+        return result
+
+    def run(self):
+        """Returns the report of all scales."""
+        report = OrderedDict([
+            ('created', datetime.datetime.now().isoformat()),
+            ('environment', self.get_environment()),
+            ('seed', self.seed),
+            ('repeat', self.repeat),
+            ('scales', OrderedDict()),
+        ])
+        with override_settings(**BENCHMARK_SETTINGS):
+            for index, scale in enumerate(self.scales):
+                if isinstance(scale, dict):
+                    name, counts = 'custom-{0}'.format(index), scale
+                else:
+                    name, counts = scale, generator.SCALES[scale]
+                report['scales'][name] = self.run_scale(name, counts)
+        return report
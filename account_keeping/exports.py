@@ -0,0 +1,239 @@
+"""Streaming exports of transactions for the account_keeping app."""
+import csv
+import tempfile
+
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce
+from django.utils import six
+from django.utils.encoding import force_bytes
+
+try:
+    from openpyxl import Workbook
+except ImportError:  # pragma: nocover
+    Workbook = None
+
+try:
+    import pyarrow
+    from pyarrow import parquet
+except ImportError:  # pragma: nocover
+    pyarrow = None
+
+from . import models
+
+#: Number of rows after which the progress callback is called
+PROGRESS_INTERVAL = 1000
+
+#: Number of rows, that are held in memory per row group of a Parquet file
+PARQUET_CHUNK_SIZE = 10000
+
+#: Columns of the Parquet exports. Each column is a tuple of the column
+#: name, the lookup of the value and the type (``cents``, ``date``, ``int``
+#: or ``string``). Amounts are stored in cents, so that they don't lose
+#: precision.
+TRANSACTION_COLUMNS = [
+    ('id', 'pk', 'int'),
+    ('account', 'account__slug', 'string'),
+    ('parent_id', 'parent_id', 'int'),
+    ('transaction_type', 'transaction_type', 'string'),
+    ('transaction_date', 'transaction_date', 'date'),
+    ('description', 'description', 'string'),
+    ('invoice_number', 'invoice_number', 'string'),
+    ('payee', 'payee__name', 'string'),
+    ('category', 'category__name', 'string'),
+    ('currency', 'currency__iso_code', 'string'),
+    ('amount_net_cents', 'amount_net', 'cents'),
+    ('vat_cents', 'vat', 'cents'),
+    ('amount_gross_cents', 'amount_gross', 'cents'),
+    ('value_gross_cents', 'value_gross', 'cents'),
+    ('balance_cents', 'ledger_balance', 'cents'),
+    ('invoice_id', 'invoice_id', 'int'),
+    ('invoice_invoice_number', 'invoice__invoice_number', 'string'),
+    ('invoice_date', 'invoice__invoice_date', 'date'),
+    ('invoice_payment_date', 'invoice__payment_date', 'date'),
+]
+
+INVOICE_COLUMNS = [
+    ('id', 'pk', 'int'),
+    ('branch', 'branch__slug', 'string'),
+    ('invoice_type', 'invoice_type', 'string'),
+    ('invoice_date', 'invoice_date', 'date'),
+    ('invoice_number', 'invoice_number', 'string'),
+    ('description', 'description', 'string'),
+    ('currency', 'currency__iso_code', 'string'),
+    ('amount_net_cents', 'amount_net', 'cents'),
+    ('vat_cents', 'vat', 'cents'),
+    ('amount_gross_cents', 'amount_gross', 'cents'),
+    ('value_gross_cents', 'value_gross', 'cents'),
+    ('payment_date', 'payment_date', 'date'),
+]
+
+
+class Echo(object):
+    """File-like object, that returns what is written instead of storing it."""
+    def write(self, value):
+        return value
+
+
+def get_transactions(start, end, branch=None):
+    """Returns the transactions, that should be exported."""
+    txns = models.Transaction.objects.filter(
+        transaction_date__gte=start,
+        transaction_date__lte=end,
+    )
+    if branch:
+        txns = txns.filter(Q(account__branch=branch) | Q(invoice__branch=branch))
+    return txns.order_by('-transaction_date', '-pk')
+
+
+def get_invoices(start, end, branch=None):
+    """Returns the invoices, that should be exported."""
+    invoices = models.Invoice.objects.filter(
+        invoice_date__gte=start,
+        invoice_date__lte=end,
+    )
+    if branch:
+        invoices = invoices.filter(branch=branch)
+    return invoices.order_by('-invoice_date', '-pk')
+
+
+def get_rows(transactions, progress=None):
+    """
+    Yields the header and one row per transaction.
+
+    The columns are the ones of ``TransactionResource``. The queryset is
+    iterated without caching the objects, so memory usage does not depend
+    on the number of transactions. The balances are stored on the
+    transactions, so no additional queries are needed per row.
+
+    :param progress: Optional callable, that is called with the number of
+      exported transactions every ``PROGRESS_INTERVAL`` rows.
+
+    """
+    resource = models.TransactionResource()
+    yield resource.get_export_headers()
+    transactions = transactions.select_related(
+        'parent', 'invoice', 'payee', 'category', 'currency')
+    for count, transaction in enumerate(transactions.iterator(), 1):
+        yield resource.export_resource(transaction)
+        if progress and count % PROGRESS_INTERVAL == 0:
+            progress(count)
+
+
+def stream_csv(transactions, progress=None):
+    """
+    Yields the transactions as lines of a CSV file.
+
+    The csv module of Python 2 can't handle unicode, so the cells are
+    encoded as UTF-8 there.
+
+    """
+    writer = csv.writer(Echo())
+    for row in get_rows(transactions, progress):
+        if six.PY2:  # pragma: nocover
+            row = [
+                force_bytes(cell) if isinstance(cell, six.text_type) else cell
+                for cell in row]
+        yield writer.writerow(row)
+
+
+def write_csv(transactions, output, progress=None):
+    """Writes the transactions into the given binary file."""
+    for line in stream_csv(transactions, progress):
+        output.write(force_bytes(line))
+
+
+def write_xlsx(transactions, output=None, progress=None):
+    """
+    Writes the transactions into an XLSX file and returns it.
+
+    The workbook is created in write-only mode, which flushes each row to
+    disk instead of keeping the whole sheet in memory. If no output file is
+    given, a temporary file is used.
+
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    for row in get_rows(transactions, progress):
+        sheet.append(row)
+    if output is None:
+        output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+
+def to_cents(value):
+    if value is None:
+        return None
+    return int(value * 100)
+
+
+def get_parquet_schema(columns):
+    """Returns the ``pyarrow`` schema of the given columns."""
+    types = {
+        'cents': pyarrow.int64(),
+        'date': pyarrow.date32(),
+        'int': pyarrow.int64(),
+        'string': pyarrow.string(),
+    }
+    return pyarrow.schema([
+        pyarrow.field(name, types[column_type])
+        for name, lookup, column_type in columns])
+
+
+def write_parquet(queryset, columns, output, progress=None):
+    """
+    Writes the given queryset into a Parquet file.
+
+    Only the values of the columns are fetched, so no model instances are
+    created. Every ``PARQUET_CHUNK_SIZE`` rows are written as one row group,
+    so memory usage does not depend on the number of rows.
+
+    :param queryset: A queryset of transactions or invoices.
+    :param columns: ``TRANSACTION_COLUMNS`` or ``INVOICE_COLUMNS``.
+    :param output: A path or binary file.
+    :param progress: Optional callable, that is called with the number of
+      exported rows every ``PROGRESS_INTERVAL`` rows.
+
+    Returns the number of exported rows.
+
+    """
+    if queryset.model is models.Transaction:
+        # Children are not part of the ledger, they get the balance of their
+        # parent instead
+        queryset = queryset.annotate(
+            ledger_balance=Coalesce(F('parent__balance'), F('balance')))
+    schema = get_parquet_schema(columns)
+    converters = [
+        to_cents if column_type == 'cents' else None
+        for name, lookup, column_type in columns]
+    rows = queryset.values_list(
+        *[lookup for name, lookup, column_type in columns]).iterator()
+    writer = parquet.ParquetWriter(output, schema)
+
+    def write_chunk(chunk):
+        arrays = []
+        for index, converter in enumerate(converters):
+            values = [row[index] for row in chunk]
+            if converter:
+                values = [converter(value) for value in values]
+            arrays.append(pyarrow.array(
+                values, type=schema.field(index).type))
+        writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+
+    count = 0
+    chunk = []
+    try:
+        for row in rows:
+            chunk.append(row)
+            count += 1
+            if progress and count % PROGRESS_INTERVAL == 0:
+                progress(count)
+            if len(chunk) == PARQUET_CHUNK_SIZE:
+                write_chunk(chunk)
+                chunk = []
+        if chunk or not count:
+            write_chunk(chunk)
+    finally:
+        writer.close()
+    return count
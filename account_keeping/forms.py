@@ -3,6 +3,7 @@ from django import forms
 from django.core.urlresolvers import reverse
 from django.utils.translation import ugettext_lazy as _
 
+from . import exports
 from . import models
 
 
@@ -84,3 +85,31 @@ class ExportForm(forms.Form):
     end = forms.DateField(
         label=_('End'),
     )
+
+    format = forms.ChoiceField(
+        label=_('Format'),
+        choices=[],
+        required=False,
+    )
+
+    background = forms.BooleanField(
+        label=_('Run in background'),
+        help_text=_('Recommended for large exports. You will be redirected'
+                    ' to a page with the progress and the download link.'),
+        required=False,
+    )
+
+    def __init__(self, *args, **kwargs):
+        super(ExportForm, self).__init__(*args, **kwargs)
+        choices = [
+            ('xls', _('Excel 97-2003 (.xls)')),
+            ('csv', _('CSV (.csv)')),
+        ]
+        if exports.Workbook:
+            choices.append(('xlsx', _('Excel (.xlsx)')))
+        if exports.pyarrow:
+            choices.append(('parquet', _('Parquet (.parquet)')))
+        self.fields['format'].choices = choices
+
+    def clean_format(self):
+        return self.cleaned_data.get('format') or 'xls'
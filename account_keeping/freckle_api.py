@@ -1,16 +1,206 @@
-"""API calls against letsfreckle.com"""
+"""
+API calls against letsfreckle.com
+
+The list of unpaid invoices is cached. Stale lists are served while a
+background thread (or the ``refresh_freckle_invoices`` command) fetches the
+current one, so that pages never wait for Freckle.
+
+"""
+import json
+import threading
+import time
+
 from django.conf import settings
+from django.core.cache import caches
+from django.utils import six
+from django.utils.module_loading import import_string
 from django.utils.translation import ugettext_lazy as _
 
+import requests
 try:
     from freckle_client.client import FreckleClientV2
-    client = FreckleClientV2(settings.ACCOUNT_KEEPING_FRECKLE_ACCESS_TOKEN)
 except ImportError:  # pragma: nocover
-    client = None
-from requests.exceptions import ConnectionError, HTTPError
+    FreckleClientV2 = None
 
 from . import models
 
+#: Number of invoice numbers per query. Stays below the limit of 999
+#: parameters of SQLite.
+CHUNK_SIZE = 500
+
+CACHE_KEY = 'account_keeping_freckle_unpaid_invoices'
+LOCK_KEY = 'account_keeping_freckle_refresh_lock'
+
+
+def get_timeout():
+    """Returns the number of seconds to wait for each response of Freckle."""
+    return getattr(settings, 'ACCOUNT_KEEPING_FRECKLE_TIMEOUT', 10)
+
+
+if FreckleClientV2 is not None:
+    class FreckleClient(FreckleClientV2):
+        """
+        Client of ``freckle_client``, that doesn't wait forever.
+
+        The original client sends its requests without a timeout, so a hanging
+        connection would block the refresh (and its lock) indefinitely.
+
+        """
+        @staticmethod
+        def _make_request(http_method, url, headers=None, query_params=None,
+                          post_args=None):
+            results = []
+            while url:
+                response = requests.request(
+                    http_method, url, params=query_params, headers=headers,
+                    data=json.dumps(post_args), timeout=get_timeout())
+                response.raise_for_status()
+                if not response.content:
+                    return None
+                results.extend(response.json())
+                next_link = response.links.get('next')
+                if not next_link:
+                    break
+                url = next_link['url']
+            return results
+
+    client = FreckleClient(settings.ACCOUNT_KEEPING_FRECKLE_ACCESS_TOKEN)
+else:  # pragma: nocover
+    client = None
+
+
+class FakeFreckleClient(object):
+    """
+    Local stand-in for the Freckle client, i.e. for tests and development.
+
+    Returns the dicts of ``invoices``, that match the given query params.
+
+    """
+    invoices = []
+
+    def __init__(self, access_token=None):
+        self.access_token = access_token
+
+    def fetch_json(self, path, query_params=None):
+        if path != 'invoices':
+            return []
+        return [
+            invoice for invoice in self.invoices
+            if all(invoice.get(key) == value
+                   for key, value in (query_params or {}).items())]
+
+
+def get_client():
+    """
+    Returns the client of the ``ACCOUNT_KEEPING_FRECKLE_CLIENT`` setting.
+
+    The setting is a dotted path to a client class, which is instantiated
+    with the access token. Defaults to the client of ``freckle_client``.
+
+    """
+    path = getattr(settings, 'ACCOUNT_KEEPING_FRECKLE_CLIENT', None)
+    if path:
+        return import_string(path)(
+            getattr(settings, 'ACCOUNT_KEEPING_FRECKLE_ACCESS_TOKEN', None))
+    return client
+
+
+def get_cache():
+    return caches[getattr(
+        settings, 'ACCOUNT_KEEPING_FRECKLE_CACHE_BACKEND', 'default')]
+
+
+def get_cache_timeout():
+    """Returns the number of seconds after which the cached list is stale."""
+    return getattr(settings, 'ACCOUNT_KEEPING_FRECKLE_CACHE_TIMEOUT', 300)
+
+
+def refresh_unpaid_invoices():
+    """
+    Fetches the unpaid invoices from Freckle and caches them.
+
+    If Freckle can't be reached or answers with invalid data, the previous
+    invoices are kept and the error is cached with them, so the next attempt is made after the cache
+    timeout.
+
+    Returns the new cache entry.
+
+    """
+    cache = get_cache()
+    entry = cache.get(CACHE_KEY) or {'invoices': None}
+    entry.update({'fetched': time.time(), 'error': False})
+    try:
+        entry['invoices'] = get_client().fetch_json(
+            'invoices', query_params={'state': 'unpaid'})
+    except (requests.exceptions.RequestException, ValueError):
+        entry['error'] = True
+    # The entry never expires, so a stale list can be served while the
+    # current one is fetched
+    cache.set(CACHE_KEY, entry, None)
+    return entry
+
+
+def _refresh_and_unlock():
+    try:
+        refresh_unpaid_invoices()
+    finally:
+        get_cache().delete(LOCK_KEY)
+
+
+def schedule_refresh():
+    """
+    Refreshes the cached invoices in a background thread.
+
+    Only one refresh runs at a time (per cache). Nothing happens, if
+    ``ACCOUNT_KEEPING_FRECKLE_BACKGROUND_REFRESH`` is ``False``, i.e. because
+    the ``refresh_freckle_invoices`` command runs periodically.
+
+    Returns the started thread or ``None``.
+
+    """
+    if not getattr(
+            settings, 'ACCOUNT_KEEPING_FRECKLE_BACKGROUND_REFRESH', True):
+        return None
+    # The lock expires, in case the refreshing process dies
+    if not get_cache().add(LOCK_KEY, True, 60):
+        return None
+    thread = threading.Thread(target=_refresh_and_unlock)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def get_invoice_numbers_with_transactions(invoice_numbers, branch=None):
+    """
+    Returns the set of the given invoice numbers, that have transactions.
+
+    The invoice numbers are resolved in chunks of ``CHUNK_SIZE``, so this
+    needs one query for up to ``CHUNK_SIZE`` invoice numbers. They are
+    compared as text, because Freckle returns numeric references as
+    integers. Databases with a case-insensitive collation (i.e. MySQL)
+    return invoice numbers in another case than the given ones, which are
+    then mapped back to the given ones.
+
+    """
+    invoice_numbers = list(set(
+        six.text_type(number) for number in invoice_numbers
+        if number is not None))
+    matched = set()
+    for index in range(0, len(invoice_numbers), CHUNK_SIZE):
+        chunk = invoice_numbers[index:index + CHUNK_SIZE]
+        invoices = models.Invoice.objects.filter(
+            invoice_number__in=chunk, transactions__isnull=False)
+        if branch:
+            invoices = invoices.filter(branch=branch)
+        found = set(invoices.order_by().values_list(
+            'invoice_number', flat=True).distinct())
+        matched.update(found.intersection(chunk))
+        folded = set(number.lower() for number in found.difference(chunk))
+        if folded:
+            matched.update(
+                number for number in chunk if number.lower() in folded)
+    return matched
+
 
 def get_unpaid_invoices_with_transactions(branch=None):
     """
@@ -20,25 +210,28 @@ def get_unpaid_invoices_with_transactions(branch=None):
     unpaid in freckle, or the invoice has been fully paid and should be set to
     paid in freckle as well.
 
+    The invoices are read from the cache. If the cached list is stale or
+    missing, a refresh is scheduled and the stale list is used meanwhile.
+    Without any cached list, the result contains ``pending``.
+
     """
-    if not client:  # pragma: nocover
+    if not get_client():  # pragma: nocover
         return None
+    entry = get_cache().get(CACHE_KEY)
+    if entry is None or entry['fetched'] + get_cache_timeout() < time.time():
+        schedule_refresh()
+    if entry is None or entry['invoices'] is None:
+        if entry and entry['error']:
+            return {'error': _('Wasn\'t able to connect to Freckle.')}
+        return {'pending': True}
     result = {}
-    try:
-        unpaid_invoices = client.fetch_json(
-            'invoices', query_params={'state': 'unpaid'})
-    except (ConnectionError, HTTPError):  # pragma: nocover
-        result.update({'error': _('Wasn\'t able to connect to Freckle.')})
-    else:
-        invoices = []
-        for invoice in unpaid_invoices:
-            invoice_with_transactions = models.Invoice.objects.filter(
-                invoice_number=invoice['reference'],
-                transactions__isnull=False)
-            if branch:
-                invoice_with_transactions = invoice_with_transactions.filter(
-                    branch=branch)
-            if invoice_with_transactions:
-                invoices.append(invoice)
-        result.update({'invoices': invoices})
+    if entry['error']:
+        result['error'] = _('Wasn\'t able to connect to Freckle.')
+    unpaid_invoices = entry['invoices']
+    matched = get_invoice_numbers_with_transactions(
+        [invoice['reference'] for invoice in unpaid_invoices], branch)
+    result['invoices'] = [
+        invoice for invoice in unpaid_invoices
+        if invoice['reference'] is not None and
+        six.text_type(invoice['reference']) in matched]
     return result
@@ -0,0 +1,334 @@
+"""
+Deterministic generator of synthetic ledgers, i.e. for benchmarks.
+
+The same seed and start month always create the same ledger. All objects
+are inserted in bulk and the balances are computed at the end, just like
+after an import.
+
+"""
+from collections import OrderedDict
+from decimal import Decimal
+import datetime
+import random
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from currency_history.models import Currency, CurrencyRate, CurrencyRateHistory
+from dateutil import relativedelta
+
+from . import models
+from . import rates
+from . import utils
+from .importers.backend import bulk_create_with_pks
+
+#: Volumes of the predefined scales. ``invoices`` are created per branch and
+#: month, ``transactions`` (without invoice) and ``splits`` (transactions
+#: with 2-4 children) per account and month.
+SCALES = OrderedDict([
+    ('small', {
+        'branches': 1,
+        'accounts': 2,
+        'currencies': 2,
+        'payees': 20,
+        'categories': 10,
+        'months': 3,
+        'invoices': 10,
+        'transactions': 20,
+        'splits': 2,
+    }),
+    ('medium', {
+        'branches': 2,
+        'accounts': 3,
+        'currencies': 3,
+        'payees': 200,
+        'categories': 30,
+        'months': 12,
+        'invoices': 50,
+        'transactions': 100,
+        'splits': 10,
+    }),
+    ('large', {
+        'branches': 4,
+        'accounts': 5,
+        'currencies': 4,
+        'payees': 1000,
+        'categories': 50,
+        'months': 24,
+        'invoices': 200,
+        'transactions': 400,
+        'splits': 40,
+    }),
+])
+
+CURRENCIES = [
+    ('EUR', 'Euro'),
+    ('USD', 'US Dollar'),
+    ('GBP', 'Pound Sterling'),
+    ('CHF', 'Swiss Franc'),
+    ('JPY', 'Yen'),
+    ('SGD', 'Singapore Dollar'),
+]
+
+WITHDRAWAL = models.Transaction.TRANSACTION_TYPES['withdrawal']
+DEPOSIT = models.Transaction.TRANSACTION_TYPES['deposit']
+
+
+class LedgerGenerator(object):
+    """
+    Creates a synthetic ledger.
+
+    :param seed: Seed of the random numbers.
+    :param start: First month of the ledger. Defaults to the month, that
+      makes the ledger end with the current month.
+    :param prefix: Prefix of the slugs and invoice numbers, so that several
+      ledgers can be created in the same database.
+    :param counts: Volumes, that differ from the ``small`` scale.
+
+    """
+    def __init__(self, seed=0, start=None, prefix='synthetic', **counts):
+        self.random = random.Random(seed)
+        self.counts = dict(SCALES['small'], **counts)
+        self.prefix = prefix
+        if start is None:
+            start = utils.get_month(datetime.date.today()) - \
+                relativedelta.relativedelta(months=self.counts['months'] - 1)
+        self.months = [
+            utils.get_month(start) + relativedelta.relativedelta(months=index)
+            for index in range(self.counts['months'])]
+        self.end = self.months[-1] + relativedelta.relativedelta(
+            months=1, days=-1)
+        self.invoice_count = 0
+
+    def get_amount(self, minimum, maximum):
+        return Decimal(self.random.randint(
+            minimum * 100, maximum * 100)) / 100
+
+    def get_date(self, month):
+        return month + datetime.timedelta(days=self.random.randint(0, 27))
+
+    def get_pks(self, model, names):
+        """Returns a list of the pks of the given names, created if needed."""
+        existing = dict(model.objects.filter(name__in=names).values_list(
+            'name', 'pk'))
+        missing = [name for name in names if name not in existing]
+        if missing:
+            model.objects.bulk_create([model(name=name) for name in missing])
+            existing.update(model.objects.filter(
+                name__in=missing).values_list('name', 'pk'))
+        return [existing[name] for name in names]
+
+    def create_currencies(self):
+        """Returns the currencies, starting with the base currency."""
+        base = getattr(settings, 'BASE_CURRENCY', 'EUR')
+        codes = [(base, base)] + [
+            item for item in CURRENCIES if item[0] != base]
+        currencies = []
+        for iso_code, title in codes[:self.counts['currencies']]:
+            currencies.append(Currency.objects.get_or_create(
+                iso_code=iso_code, defaults={'title': title})[0])
+        return currencies
+
+    def create_rates(self, currencies):
+        """Creates a rate into the base currency for each month."""
+        histories = []
+        for currency in currencies[1:]:
+            rate = CurrencyRate.objects.get_or_create(
+                from_currency=currency, to_currency=currencies[0])[0]
+            value = self.random.uniform(0.5, 1.5)
+            for month in self.months:
+                value *= self.random.uniform(0.97, 1.03)
+                history = CurrencyRateHistory(
+                    rate=rate, value=round(value, 6), tracked_by='generator')
+                history.month = month
+                histories.append(history)
+        bulk_create_with_pks(CurrencyRateHistory, histories)
+        for history in histories:
+            # ``date`` is set automatically on insert
+            date = datetime.datetime.combine(history.month, datetime.time())
+            if settings.USE_TZ:
+                date = timezone.make_aware(date)
+            CurrencyRateHistory.objects.filter(pk=history.pk).update(
+                date=date)
+        return len(histories)
+
+    def create_invoice(self, branch, account, month):
+        self.invoice_count += 1
+        invoice = models.Invoice(
+            branch=branch,
+            invoice_type=DEPOSIT if self.random.random() < 0.7
+            else WITHDRAWAL,
+            invoice_date=self.get_date(month),
+            invoice_number='{0}-{1:06d}'.format(
+                self.prefix, self.invoice_count),
+            currency_id=account.currency_id,
+            amount_net=self.get_amount(50, 5000),
+            vat=self.random.choice([0, 7, 19]),
+        )
+        invoice.set_amount_fields()
+        invoice.set_value_fields('invoice_type')
+        return invoice
+
+    def create_transaction(self, account, transaction_type, date, amount,
+                           **kwargs):
+        txn = models.Transaction(
+            account=account,
+            transaction_type=transaction_type,
+            transaction_date=date,
+            payee_id=self.random.choice(self.payees),
+            category_id=self.random.choice(self.categories),
+            currency_id=account.currency_id,
+            amount_gross=amount,
+            **kwargs)
+        txn.set_amount_fields()
+        txn.set_value_fields('transaction_type')
+        return txn
+
+    def create_month(self, branch, accounts, month):
+        """
+        Creates the invoices and transactions of a branch in a month.
+
+        60% of the invoices are paid, 20% are paid partially and 20% remain
+        unpaid. Some of the unpaid ones are paid by the children of split
+        transactions.
+
+        Returns the number of invoices and transactions.
+
+        """
+        invoices = []
+        for index in range(self.counts['invoices']):
+            account = self.random.choice(accounts)
+            invoice = self.create_invoice(branch, account, month)
+            invoice.account = account
+            invoice.state = self.random.random()
+            if invoice.state < 0.6:
+                invoice.payment_date = min(
+                    invoice.invoice_date + datetime.timedelta(
+                        days=self.random.randint(0, 40)), self.end)
+            invoices.append(invoice)
+        bulk_create_with_pks(models.Invoice, invoices)
+
+        transactions = []
+        for invoice in invoices:
+            if invoice.state < 0.8:
+                amount = invoice.amount_gross
+                if invoice.state >= 0.6:
+                    amount = (amount * Decimal(self.random.uniform(
+                        0.2, 0.8))).quantize(Decimal('0.01'))
+                transactions.append(self.create_transaction(
+                    invoice.account, invoice.invoice_type,
+                    invoice.payment_date or self.get_date(month), amount,
+                    invoice=invoice, invoice_number=invoice.invoice_number))
+        unpaid = [invoice for invoice in invoices if invoice.state >= 0.8]
+        parents = []
+        for account in accounts:
+            for index in range(self.counts['transactions']):
+                transactions.append(self.create_transaction(
+                    account,
+                    WITHDRAWAL if self.random.random() < 0.65 else DEPOSIT,
+                    self.get_date(month), self.get_amount(5, 500),
+                    description='Transaction {0}'.format(index)))
+            for index in range(self.counts['splits']):
+                # The children pay unpaid invoices in the same currency
+                same_currency = [
+                    invoice for invoice in unpaid
+                    if invoice.currency_id == account.currency_id]
+                children = []
+                for child in range(self.random.randint(2, 4)):
+                    invoice = same_currency.pop() if same_currency else None
+                    if invoice is not None:
+                        unpaid.remove(invoice)
+                    children.append(self.create_transaction(
+                        account, DEPOSIT,
+                        self.get_date(month), invoice and invoice.amount_gross
+                        or self.get_amount(5, 500), invoice=invoice,
+                        invoice_number=invoice and invoice.invoice_number
+                        or ''))
+                parent = self.create_transaction(
+                    account, DEPOSIT, self.get_date(month),
+                    sum(child.amount_gross for child in children),
+                    description='Split transaction {0}'.format(index))
+                parents.append((parent, children))
+                transactions.append(parent)
+        bulk_create_with_pks(models.Transaction, transactions)
+        children = []
+        for parent, parent_children in parents:
+            for child in parent_children:
+                child.parent_id = parent.pk
+                children.append(child)
+        models.Transaction.objects.bulk_create(children)
+        return len(invoices), len(transactions) + len(children)
+
+    def generate(self):
+        """Creates the ledger and returns the number of created objects."""
+        with transaction.atomic():
+            currencies = self.create_currencies()
+            result = OrderedDict([
+                ('currencies', len(currencies)),
+                ('rates', self.create_rates(currencies)),
+                ('branches', 0),
+                ('accounts', 0),
+                ('payees', self.counts['payees']),
+                ('categories', self.counts['categories']),
+                ('invoices', 0),
+                ('transactions', 0),
+            ])
+            self.payees = self.get_pks(models.Payee, [
+                'Payee {0}'.format(index)
+                for index in range(self.counts['payees'])])
+            self.categories = self.get_pks(models.Category, [
+                'Category {0}'.format(index)
+                for index in range(self.counts['categories'])])
+            all_accounts = []
+            for branch_index in range(self.counts['branches']):
+                branch = models.Branch.objects.create(
+                    name='Branch {0}'.format(branch_index),
+                    slug='{0}-branch-{1}'.format(self.prefix, branch_index),
+                    currency=currencies[0])
+                accounts = []
+                for index in range(self.counts['accounts']):
+                    # The first account of each branch is in the base
+                    # currency
+                    accounts.append(models.Account.objects.create(
+                        name='Account {0}-{1}'.format(branch_index, index),
+                        slug='{0}-account-{1}-{2}'.format(
+                            self.prefix, branch_index, index),
+                        branch=branch,
+                        currency=self.random.choice(currencies)
+                        if index else currencies[0],
+                        initial_amount=self.get_amount(0, 10000)))
+                for month in self.months:
+                    invoices, transactions = self.create_month(
+                        branch, accounts, month)
+                    result['invoices'] += invoices
+                    result['transactions'] += transactions
+                all_accounts += accounts
+                result['branches'] += 1
+            result['accounts'] = len(all_accounts)
+            # The bulk inserts bypass the signals and ``save()`` methods
+            for account in all_accounts:
+                account.update_balances()
+            models.MonthSummary.objects.invalidate()
+        rates.rate_cache.invalidate()
+        return result
+
+
+def generate_ledger(scale='small', seed=0, start=None, prefix='synthetic',
+                    **counts):
+    """
+    Creates a synthetic ledger of the given scale.
+
+    :param scale: Name of one of the ``SCALES``.
+    :param counts: Volumes, that differ from the scale.
+
+    Returns a dict with the number of created objects.
+
+    """
+    try:
+        scale_counts = SCALES[scale]
+    except KeyError:
+        raise ValueError('Unknown scale "{0}". Choose one of: {1}'.format(
+            scale, ', '.join(SCALES)))
+    return LedgerGenerator(
+        seed, start, prefix, **dict(scale_counts, **counts)).generate()
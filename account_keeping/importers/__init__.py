@@ -0,0 +1,13 @@
+"""
+Importers for bank statements and exports of other applications.
+
+Each importer reads a file as a stream of records. ``backend.import_file``
+writes them in batches into an account. Register your own importers with
+the ``register`` decorator or the ``ACCOUNT_KEEPING_IMPORTERS`` setting.
+
+"""
+from .base import BaseImporter, get_importer, get_importers, register  # NOQA
+from .backend import import_file  # NOQA
+
+# Register the built-in importers
+from . import camt, csv_profiles, mmex, mt940, ofx  # NOQA
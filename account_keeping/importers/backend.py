@@ -0,0 +1,326 @@
+"""Batched writes of imported transactions, shared by all importers."""
+from collections import deque
+import datetime
+import os
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:  # pragma: nocover
+    ProcessPoolExecutor = None
+
+from django.db import connection, transaction
+from django.db.models import Max
+
+from currency_history.models import Currency
+
+from .. import models
+from .. import utils
+
+
+class ConcurrentInsertError(Exception):
+    """Raised, if rows were inserted concurrently to a bulk insert."""
+
+
+def bulk_create_with_pks(model, objects):
+    """
+    Inserts the given objects and sets their primary keys.
+
+    Only some databases return the primary keys of bulk inserts. For the
+    others, we read the new primary keys in the order of insertion. If other
+    rows were inserted concurrently, their primary keys can interleave with
+    ours. We detect this by the number of new primary keys, roll back the
+    bulk insert and insert the objects one at a time instead.
+
+    The ``save()`` methods of the objects are not called either way.
+
+    """
+    if connection.features.can_return_ids_from_bulk_insert:
+        return model.objects.bulk_create(objects)
+    try:
+        with transaction.atomic():
+            last_pk = model.objects.aggregate(Max('pk'))['pk__max'] or 0
+            model.objects.bulk_create(objects)
+            pks = list(model.objects.filter(pk__gt=last_pk).order_by(
+                'pk').values_list('pk', flat=True))
+            if len(pks) != len(objects):
+                raise ConcurrentInsertError()
+    except ConcurrentInsertError:
+        for obj in objects:
+            obj.save_base(force_insert=True)
+        return objects
+    for obj, pk in zip(objects, pks):
+        obj.pk = pk
+    return objects
+
+
+class BatchWriter(object):
+    """
+    Inserts the transactions of one account in batches.
+
+    Payees, categories and currencies are cached in dicts, so that each
+    batch needs a fixed number of queries. Missing payees and categories are
+    created in bulk.
+
+    :param account: The ``Account`` of the new transactions.
+    :param currency: The default ``Currency``. Defaults to the currency of
+      the account.
+    :param vat: The VAT of all transactions (i.e. 19).
+    :param create_invoices: If ``True``, an invoice is created for each
+      transaction.
+    :param default_payee: Name of the payee of rows without payee.
+    :param default_category: Name of the category of rows without category.
+
+    """
+    def __init__(self, account, currency=None, vat=0, create_invoices=False,
+                 default_payee='Unknown', default_category='Uncategorized'):
+        self.account = account
+        self.currency = currency or account.currency
+        self.vat = vat
+        self.create_invoices = create_invoices
+        self.default_payee = default_payee
+        self.default_category = default_category
+        self.branch = models.Branch.objects.first()
+        # The first object of each name wins, just like ``get_or_create``
+        self.payees = dict(models.Payee.objects.order_by('-pk').values_list(
+            'name', 'pk'))
+        self.categories = dict(models.Category.objects.order_by(
+            '-pk').values_list('name', 'pk'))
+        self.currencies = dict(Currency.objects.values_list('iso_code', 'pk'))
+        self.first_date = None
+
+    def get_pks(self, model, cache, names):
+        """Creates the missing objects of the given names in bulk."""
+        missing = set(names) - set(cache)
+        if missing:
+            model.objects.bulk_create([model(name=name) for name in missing])
+            cache.update(model.objects.filter(name__in=missing).order_by(
+                '-pk').values_list('name', 'pk'))
+        return cache
+
+    def get_currency_pk(self, iso_code):
+        if not iso_code:
+            return self.currency.pk
+        try:
+            return self.currencies[iso_code]
+        except KeyError:
+            raise ValueError('The currency {0} does not exist.'.format(
+                iso_code))
+
+    def write_batch(self, records, importer, checkpoint, position,
+                    rows=None):
+        """
+        Inserts the transactions of the given records.
+
+        Records, that have already been imported into the account, are
+        skipped by their fingerprint. The checkpoint is moved to the given
+        position within the same transaction.
+
+        :param records: A list of tuples of the fingerprint and the record.
+        :param rows: The processed records, if they have been processed
+          already (see ``process_records``).
+        :returns: The number of new transactions.
+
+        """
+        with transaction.atomic():
+            existing = set(models.Transaction.objects.filter(
+                account=self.account,
+                fingerprint__in=[fingerprint for fingerprint, r in records],
+            ).values_list('fingerprint', flat=True))
+            if rows is None:
+                rows = [
+                    importer.process_record(record)
+                    if fingerprint not in existing else None
+                    for fingerprint, record in records]
+            rows = [
+                dict(row, fingerprint=fingerprint)
+                for (fingerprint, record), row in zip(records, rows)
+                if fingerprint not in existing]
+            if rows:
+                self.insert_rows(rows)
+            checkpoint.position = position
+            checkpoint.first_date = self.first_date
+            checkpoint.save()
+        return len(rows)
+
+    def insert_rows(self, rows):
+        """Inserts the transactions (and invoices) of the given rows."""
+        for row in rows:
+            row['payee'] = row.get('payee') or self.default_payee
+            row['category'] = row.get('category') or self.default_category
+            row['currency'] = self.get_currency_pk(row.get('currency'))
+            # Invoice dates are ignored, i.e. the placeholder date of the
+            # MMEX invoices would invalidate all summaries
+            self.first_date = min(
+                row['transaction_date'],
+                self.first_date or row['transaction_date'])
+        payees = self.get_pks(
+            models.Payee, self.payees, [row['payee'] for row in rows])
+        categories = self.get_pks(
+            models.Category, self.categories,
+            [row['category'] for row in rows])
+
+        invoices = [None] * len(rows)
+        if self.create_invoices:
+            invoices = []
+            for row in rows:
+                invoice = models.Invoice(
+                    invoice_type=row['transaction_type'],
+                    invoice_date=row.get(
+                        'invoice_date', row['transaction_date']),
+                    invoice_number=row.get('invoice_number', ''),
+                    currency_id=row['currency'],
+                    amount_gross=row['amount'],
+                    vat=self.vat,
+                    payment_date=row['transaction_date'],
+                    branch=self.branch,
+                )
+                invoice.set_amount_fields()
+                invoice.set_value_fields('invoice_type')
+                invoices.append(invoice)
+            bulk_create_with_pks(models.Invoice, invoices)
+
+        transactions = []
+        for row, invoice in zip(rows, invoices):
+            txn = models.Transaction(
+                account=self.account,
+                transaction_type=row['transaction_type'],
+                transaction_date=row['transaction_date'],
+                description=row.get('description', ''),
+                invoice_number=row.get('invoice_number', ''),
+                invoice_id=invoice and invoice.pk,
+                payee_id=payees[row['payee']],
+                category_id=categories[row['category']],
+                currency_id=row['currency'],
+                amount_gross=row['amount'],
+                vat=self.vat,
+                fingerprint=row['fingerprint'],
+            )
+            txn.set_amount_fields()
+            txn.set_value_fields('transaction_type')
+            transactions.append(txn)
+        models.Transaction.objects.bulk_create(transactions)
+
+    def finish(self):
+        """Updates the balances and summaries after new transactions."""
+        # The bulk inserts bypass ``Transaction.save()``, so the new
+        # transactions are added to the ledger at the end
+        first_date = self.account.add_bulk_transactions()
+        dates = [value for value in [first_date, self.first_date] if value]
+        if dates:
+            models.MonthSummary.objects.invalidate(min(dates))
+
+
+def process_records(importer, records):
+    """
+    Returns the processed values of the given records.
+
+    This runs in the worker processes of the pipeline mode of
+    ``import_file``.
+
+    """
+    return [importer.process_record(record) for record in records]
+
+
+def iter_batches(importer, file_, checkpoint, batch_size, stats, log=None,
+                 progress=None):
+    """
+    Yields tuples of a batch of records and the position after the batch.
+
+    Each record of a batch is a tuple of its fingerprint and the record.
+    Records up to the position of the checkpoint are skipped. The number of
+    records is stored in ``stats['count']``.
+
+    """
+    occurrences = {}
+    started = datetime.datetime.now()
+    records = []
+    for count, record in enumerate(importer.iter_records(file_), 1):
+        stats['count'] = count
+        # Fingerprints of skipped records are needed as well to count the
+        # occurrences of identical records
+        fingerprint = utils.get_fingerprint(
+            importer.get_fingerprint_values(record), occurrences)
+        if count <= checkpoint.position:
+            continue
+        records.append((fingerprint, record))
+        if len(records) == batch_size:
+            yield records, count
+            records = []
+        if log and progress and count % progress == 0:
+            log('{0} records processed ({1})'.format(
+                count, datetime.datetime.now() - started))
+    if records:
+        yield records, stats['count']
+
+
+def import_file(importer, path, account, batch_size=1000, progress=None,
+                log=None, workers=1, **writer_kwargs):
+    """
+    Imports the given file into the given account.
+
+    The records are read as a stream and written in batches. Each batch is
+    committed together with an ``ImportCheckpoint``, so that running the
+    same import again resumes after the last committed batch. Records, that
+    already exist in the account, are skipped by their fingerprint.
+
+    With more than one worker, the records are processed in a pool of
+    worker processes, while the current thread writes the processed batches
+    in their original order. A few batches are processed ahead, so that
+    processing and writing overlap.
+
+    :param importer: An importer instance (see ``get_importer``).
+    :param path: Path of the file.
+    :param account: The ``Account`` of the new transactions.
+    :param batch_size: Number of records per batch.
+    :param progress: Report the progress every N records.
+    :param log: Optional callable, that receives progress messages.
+    :param workers: Number of worker processes.
+    :param writer_kwargs: Keyword arguments of the ``BatchWriter``.
+
+    Returns a tuple of the number of records and of new transactions.
+
+    """
+    writer = BatchWriter(
+        account, create_invoices=importer.create_invoices, **writer_kwargs)
+    checkpoint, created = models.ImportCheckpoint.objects.get_or_create(
+        account=account, importer=importer.name,
+        checksum=utils.get_checksum(path),
+        defaults={'filename': os.path.basename(path)})
+    # An aborted import might have committed batches without finishing
+    resumed = checkpoint.position and not checkpoint.finished
+    writer.first_date = checkpoint.first_date
+    if checkpoint.position and log:
+        log('Resuming after record {0}'.format(checkpoint.position))
+    stats = {'count': 0}
+    imported = 0
+    with importer.open(path) as file_:
+        batches = iter_batches(importer, file_, checkpoint, batch_size,
+                               stats, log, progress)
+        if workers > 1:
+            if ProcessPoolExecutor is None:  # pragma: nocover
+                raise ValueError('Please install futures to use workers.')
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                pending = deque()
+                for records, position in batches:
+                    pending.append((records, position, executor.submit(
+                        process_records, importer,
+                        [record for fingerprint, record in records])))
+                    while len(pending) > workers * 2:
+                        records, position, future = pending.popleft()
+                        imported += writer.write_batch(
+                            records, importer, checkpoint, position,
+                            future.result())
+                while pending:
+                    records, position, future = pending.popleft()
+                    imported += writer.write_batch(
+                        records, importer, checkpoint, position,
+                        future.result())
+        else:
+            for records, position in batches:
+                imported += writer.write_batch(
+                    records, importer, checkpoint, position)
+    if imported or resumed:
+        writer.finish()
+    checkpoint.finished = True
+    checkpoint.save()
+    return stats['count'], imported
@@ -0,0 +1,139 @@
+"""Base class and registry of the importers."""
+from collections import OrderedDict
+from decimal import Decimal
+import csv
+import io
+
+from django.conf import settings
+from django.utils import six
+from django.utils.module_loading import import_string
+
+from .. import models
+
+_registry = OrderedDict()
+
+
+def register(importer_class):
+    """Class decorator, that registers an importer under its ``name``."""
+    _registry[importer_class.name] = importer_class
+    return importer_class
+
+
+def get_importers():
+    """
+    Returns a dict of all registered importer classes by name.
+
+    Besides the built-in importers, this contains the importer classes of
+    the ``ACCOUNT_KEEPING_IMPORTERS`` setting (a list of dotted paths).
+
+    """
+    for path in getattr(settings, 'ACCOUNT_KEEPING_IMPORTERS', []):
+        importer_class = import_string(path)
+        _registry.setdefault(importer_class.name, importer_class)
+    return _registry
+
+
+def get_importer(name, **options):
+    """Returns an instance of the importer with the given name."""
+    try:
+        importer_class = get_importers()[name]
+    except KeyError:
+        raise ValueError('Unknown importer "{0}". Choose one of: {1}'.format(
+            name, ', '.join(get_importers())))
+    return importer_class(**options)
+
+
+def csv_reader(file_, **kwargs):
+    """
+    Returns a ``csv.reader`` of the given text file, that yields unicode.
+
+    The ``csv`` module of Python 2 can't read unicode, so the lines are
+    encoded as UTF-8 and the cells are decoded again.
+
+    """
+    if not six.PY2:
+        return csv.reader(file_, **kwargs)
+    return (  # pragma: nocover
+        [cell.decode('utf-8') for cell in row]
+        for row in csv.reader(
+            (line.encode('utf-8') for line in file_), **kwargs))
+
+
+class BaseImporter(object):
+    """
+    Base class of all importers.
+
+    An importer reads a file as a stream of records with ``iter_records``.
+    Records are lightweight (i.e. the raw values of a CSV row), so that the
+    backend can compute their fingerprints and skip them cheaply. Only new
+    records are turned into the values of a transaction by ``parse_record``.
+
+    Subclasses must set ``name`` and implement ``iter_records`` and
+    ``parse_record``.
+
+    """
+    name = None
+
+    #: Set to ``True`` to create an invoice for each transaction
+    create_invoices = False
+
+    #: Mode in which the file is opened. XML files should be opened in
+    #: binary mode, so that the parser can detect the encoding.
+    file_mode = 'r'
+
+    encoding = 'utf-8'
+
+    def __init__(self, **options):
+        self.options = options
+
+    def open(self, path):
+        """Returns the opened file of the given path."""
+        if 'b' in self.file_mode:
+            return io.open(path, self.file_mode)
+        return io.open(path, self.file_mode, encoding=self.encoding,
+                       newline='')
+
+    def iter_records(self, file_):
+        """Yields the records of the given file without loading it at once."""
+        raise NotImplementedError
+
+    def get_fingerprint_values(self, record):
+        """Returns the strings, that identify the given record."""
+        if isinstance(record, dict):
+            return [u'{0}={1}'.format(key, record[key])
+                    for key in sorted(record)]
+        return list(record)
+
+    def parse_record(self, record):
+        """
+        Returns a dict with the values of the transaction of a record.
+
+        Keys are ``transaction_date``, ``transaction_type``, ``amount`` (a
+        positive ``Decimal``), ``payee`` and ``category`` (names) and the
+        optional keys ``description``, ``invoice_number``, ``currency``
+        (ISO-code) and ``invoice_date``.
+
+        """
+        raise NotImplementedError
+
+    def process_record(self, record):
+        """
+        Returns the parsed and normalized values of a record.
+
+        Whitespace in payee and category names is collapsed and the names
+        are truncated to the length of their fields, so that the same payee
+        is not created twice because of formatting differences.
+
+        """
+        row = self.parse_record(record)
+        for key in ['payee', 'category']:
+            if row.get(key):
+                row[key] = ' '.join(row[key].split())[:256]
+        return row
+
+    def split_amount(self, amount):
+        """Returns a tuple of the transaction type and the absolute amount."""
+        amount = Decimal(amount)
+        if amount < 0:
+            return models.Transaction.TRANSACTION_TYPES['withdrawal'], -amount
+        return models.Transaction.TRANSACTION_TYPES['deposit'], amount
@@ -0,0 +1,121 @@
+"""
+Importer for ISO 20022 CAMT.053 bank statements.
+
+The XML is parsed with ``iterparse`` and each ``Ntry`` element is removed
+from the tree after it has been read, so memory usage does not depend on the
+size of the file. All versions of the ``camt.053`` namespace are supported.
+
+"""
+from decimal import Decimal
+import datetime
+from xml.etree import ElementTree
+
+from .base import BaseImporter, register
+
+
+def local_name(tag):
+    """Returns the tag without namespace."""
+    return tag.rsplit('}', 1)[-1]
+
+
+def find(element, path):
+    """Returns the first element of the given path of local names."""
+    for name in path.split('/'):
+        for child in element:
+            if local_name(child.tag) == name:
+                element = child
+                break
+        else:
+            return None
+    return element
+
+
+def find_text(element, *paths):
+    """Returns the text of the first of the given paths, that exists."""
+    for path in paths:
+        child = find(element, path)
+        if child is not None and child.text:
+            return child.text.strip()
+    return ''
+
+
+@register
+class CAMTImporter(BaseImporter):
+    """
+    Imports the entries (``Ntry``) of CAMT.053 statements.
+
+    The reference of the bank (``AcctSvcrRef``) is used as fingerprint if
+    available.
+
+    """
+    name = 'camt'
+    file_mode = 'rb'
+
+    def iter_records(self, file_):
+        parents = []
+        for event, element in ElementTree.iterparse(
+                file_, events=('start', 'end')):
+            if event == 'start':
+                parents.append(element)
+                continue
+            parents.pop()
+            if local_name(element.tag) != 'Ntry':
+                continue
+            amount = find(element, 'Amt')
+            details = find(element, 'NtryDtls/TxDtls')
+            if details is None:
+                details = element
+            credit = find_text(element, 'CdtDbtInd') == 'CRDT'
+            # The counterparty is the debtor of incoming payments and the
+            # creditor of outgoing ones (``Pty`` since version 8)
+            party = 'RltdPties/Dbtr' if credit else 'RltdPties/Cdtr'
+            yield {
+                'amount': amount.text.strip(),
+                'currency': amount.get('Ccy', ''),
+                'credit': credit,
+                'reversal': find_text(element, 'RvslInd') == 'true',
+                'date': find_text(
+                    element, 'BookgDt/Dt', 'BookgDt/DtTm', 'ValDt/Dt',
+                    'ValDt/DtTm')[:10],
+                'reference': find_text(
+                    element, 'AcctSvcrRef', 'NtryRef') or find_text(
+                    details, 'Refs/AcctSvcrRef', 'Refs/EndToEndId'),
+                'payee': find_text(
+                    details, party + '/Nm', party + '/Pty/Nm'),
+                'description': self.get_description(element, details),
+            }
+            # Remove the entry from the tree to keep memory usage flat
+            if parents:
+                parents[-1].remove(element)
+
+    def get_description(self, element, details):
+        """Returns the unstructured remittance information of an entry."""
+        information = find(details, 'RmtInf')
+        if information is not None:
+            lines = [
+                child.text.strip() for child in information
+                if local_name(child.tag) == 'Ustrd' and child.text]
+            if lines:
+                return ' '.join(lines)
+        return find_text(element, 'AddtlNtryInf')
+
+    def get_fingerprint_values(self, record):
+        if record['reference'] and record['reference'] != 'NOTPROVIDED':
+            return ['AcctSvcrRef', record['reference']]
+        return super(CAMTImporter, self).get_fingerprint_values(record)
+
+    def parse_record(self, record):
+        amount = Decimal(record['amount'])
+        # Reversals are booked in the opposite direction of the indicator
+        if record['credit'] == record['reversal']:
+            amount = -amount
+        transaction_type, amount = self.split_amount(amount)
+        return {
+            'transaction_date': datetime.datetime.strptime(
+                record['date'], '%Y-%m-%d').date(),
+            'transaction_type': transaction_type,
+            'amount': amount,
+            'payee': record['payee'],
+            'description': record['description'],
+            'currency': record['currency'],
+        }
@@ -0,0 +1,125 @@
+"""
+Importer for .csv bank statements, that are described by profiles.
+
+A profile describes the layout of the .csv files of one bank::
+
+    ACCOUNT_KEEPING_CSV_PROFILES = {
+        'mybank': {
+            'delimiter': ';',
+            'encoding': 'latin-1',
+            'skip_rows': 1,
+            'date_format': '%d.%m.%Y',
+            'decimal_separator': ',',
+            'thousands_separator': '.',
+            'columns': {
+                'transaction_date': 0,
+                'payee': 2,
+                'description': 4,
+                'amount': 7,
+            },
+        },
+    }
+
+Columns are indexes or, if ``header`` is ``True``, the names of the header
+row. Instead of ``amount``, a profile can define ``debit`` and ``credit``
+columns. Further optional columns are ``category``, ``invoice_number`` and
+``currency``.
+
+"""
+from decimal import Decimal
+import datetime
+
+from django.conf import settings
+from six import string_types
+
+from .base import BaseImporter, csv_reader, register
+
+PROFILES = {
+    'default': {
+        'delimiter': ',',
+        'header': True,
+        'date_format': '%Y-%m-%d',
+        'columns': {
+            'transaction_date': 'date',
+            'amount': 'amount',
+            'payee': 'payee',
+            'description': 'description',
+            'category': 'category',
+        },
+    },
+}
+
+
+def get_profiles():
+    """Returns the built-in profiles and the ones of the settings."""
+    profiles = PROFILES.copy()
+    profiles.update(getattr(settings, 'ACCOUNT_KEEPING_CSV_PROFILES', {}))
+    return profiles
+
+
+@register
+class CSVImporter(BaseImporter):
+    """
+    Imports .csv files with the profile of the ``profile`` option.
+
+    """
+    name = 'csv'
+
+    def __init__(self, **options):
+        super(CSVImporter, self).__init__(**options)
+        profile_name = options.get('profile') or 'default'
+        try:
+            self.profile = get_profiles()[profile_name]
+        except KeyError:
+            raise ValueError('Unknown CSV profile "{0}".'.format(
+                profile_name))
+        self.encoding = self.profile.get('encoding', self.encoding)
+        self.columns = dict(self.profile['columns'])
+
+    def iter_records(self, file_):
+        reader = csv_reader(
+            file_, delimiter=str(self.profile.get('delimiter', ',')))
+        if self.profile.get('header'):
+            header = [name.strip() for name in next(reader)]
+            for key, column in self.columns.items():
+                if isinstance(column, string_types):
+                    self.columns[key] = header.index(column)
+        else:
+            for index in range(self.profile.get('skip_rows', 0)):
+                next(reader)
+        for row in reader:
+            if any(row):
+                yield row
+
+    def get_value(self, row, key):
+        if key not in self.columns or self.columns[key] >= len(row):
+            return ''
+        return row[self.columns[key]].strip()
+
+    def get_decimal(self, value):
+        if not value:
+            return Decimal(0)
+        value = value.replace(
+            self.profile.get('thousands_separator', ''), '').replace(' ', '')
+        return Decimal(value.replace(
+            self.profile.get('decimal_separator', '.'), '.'))
+
+    def parse_record(self, row):
+        if 'amount' in self.columns:
+            amount = self.get_decimal(self.get_value(row, 'amount'))
+        else:
+            amount = self.get_decimal(self.get_value(row, 'credit')) - abs(
+                self.get_decimal(self.get_value(row, 'debit')))
+        transaction_type, amount = self.split_amount(amount)
+        return {
+            'transaction_date': datetime.datetime.strptime(
+                self.get_value(row, 'transaction_date'),
+                self.profile.get('date_format', '%Y-%m-%d')).date(),
+            'transaction_type': transaction_type,
+            'amount': amount,
+            'payee': self.get_value(row, 'payee'),
+            'category': self.get_value(row, 'category'),
+            'description': self.get_value(row, 'description'),
+            'invoice_number': self.get_value(row, 'invoice_number'),
+            'currency': self.get_value(row, 'currency'),
+        }
@@ -0,0 +1,50 @@
+"""
+Importer for .csv files exported via Money Manager Ex.
+
+IMPORTANT: MMEX does not distinguish between incoming and outgoing "Transfer"
+transactions. After you export the .csv you must identify all incoming
+"Transfer" transactions and rename the type to "TransferDeposit".
+
+"""
+from decimal import Decimal
+import datetime
+
+from .. import models
+from .base import BaseImporter, csv_reader, register
+
+
+@register
+class MMEXImporter(BaseImporter):
+    """
+    Imports the rows of an MMEX export.
+
+    MMEX has no invoices, so an invoice dated 1900-01-01 is created for each
+    transaction.
+
+    """
+    name = 'mmex'
+    create_invoices = True
+
+    def iter_records(self, file_):
+        return csv_reader(file_)
+
+    def parse_record(self, row):
+        if row[2] in ['Withdrawal', 'Transfer']:
+            transaction_type = models.Transaction.TRANSACTION_TYPES[
+                'withdrawal']
+        else:
+            transaction_type = models.Transaction.TRANSACTION_TYPES['deposit']
+        if row[4] and not row[5]:
+            cat_name = row[4]
+        else:
+            cat_name = row[5]
+        return {
+            'transaction_date': datetime.datetime.strptime(
+                row[0], '%d/%m/%Y').date(),
+            'invoice_date': datetime.date(1900, 1, 1),
+            'payee': row[1],
+            'transaction_type': transaction_type,
+            'amount': Decimal(row[3]),
+            'category': cat_name,
+            'description': row[7],
+        }
@@ -0,0 +1,121 @@
+"""
+Importer for SWIFT MT940 bank statements.
+
+The file is read line by line. Each statement line (``:61:``) and its
+information to the account owner (``:86:``) becomes one record.
+
+"""
+from decimal import Decimal
+import datetime
+import re
+
+from .base import BaseImporter, register
+
+STATEMENT_LINE = re.compile(
+    r'^(?P<date>\d{6})(?P<entry_date>\d{4})?(?P<mark>R?[CD])'
+    r'(?P<funds_code>[A-Z])?(?P<amount>\d+,\d*)(?P<type>[NFS][A-Z0-9]{3})'
+    r'(?P<reference>[^/\n]*)(//(?P<bank_reference>.*))?')
+
+BALANCE = re.compile(r'^[CD]\d{6}(?P<currency>[A-Z]{3})')
+
+#: Subfields of structured information (i.e. of German banks)
+DESCRIPTION_SUBFIELDS = ['20', '21', '22', '23', '24', '25', '26', '27',
+                         '28', '29', '60', '61', '62', '63']
+PAYEE_SUBFIELDS = ['32', '33']
+
+
+def iter_fields(file_):
+    """
+    Yields tuples of the tag and the value of each field.
+
+    Values of fields, that span several lines, are joined with newlines.
+    The end of a statement is yielded as the tag ``-``.
+
+    """
+    tag, value = None, []
+    for line in file_:
+        line = line.rstrip('\r\n')
+        match = re.match(r'^:(\d{2}[A-Z]?):(.*)$', line)
+        if match or line.strip() == '-':
+            if tag:
+                yield tag, '\n'.join(value)
+            if match:
+                tag, value = match.group(1), [match.group(2)]
+            else:
+                tag, value = None, []
+                yield '-', ''
+        elif tag:
+            value.append(line)
+    if tag:
+        yield tag, '\n'.join(value)
+
+
+def parse_information(value):
+    """Returns a tuple of the payee and description of a ``:86:`` field."""
+    value = value.replace('\n', '')
+    if not re.match(r'^\d{3}\?', value):
+        return '', value.strip()
+    subfields = {}
+    for subfield in value.split('?')[1:]:
+        code, text = subfield[:2], subfield[2:]
+        subfields[code] = subfields.get(code, '') + text
+    return (
+        ''.join(subfields.get(code, '') for code in PAYEE_SUBFIELDS).strip(),
+        ''.join(subfields.get(
+            code, '') for code in DESCRIPTION_SUBFIELDS).strip(),
+    )
+
+
+@register
+class MT940Importer(BaseImporter):
+    """
+    Imports the statement lines of MT940 files.
+
+    """
+    name = 'mt940'
+    encoding = 'latin-1'
+
+    def iter_records(self, file_):
+        currency = ''
+        record = None
+        for tag, value in iter_fields(file_):
+            if tag in ['60F', '60M']:
+                match = BALANCE.match(value)
+                currency = match.group('currency') if match else ''
+            elif tag == '86' and record is not None:
+                record['information'] = value
+                continue
+            if record is not None:
+                yield record
+                record = None
+            if tag == '61':
+                record = {'line': value, 'currency': currency}
+        if record is not None:
+            yield record
+
+    def parse_record(self, record):
+        match = STATEMENT_LINE.match(record['line'])
+        if match is None:
+            raise ValueError('Invalid statement line: {0}'.format(
+                record['line']))
+        amount = Decimal(match.group('amount').replace(',', '.'))
+        # Reversals of credits are debits and the other way round
+        if match.group('mark') in ['D', 'RC']:
+            amount = -amount
+        transaction_type, amount = self.split_amount(amount)
+        payee, description = parse_information(record.get('information', ''))
+        value_date = match.group('date')
+        reference = match.group('reference').strip()
+        if reference == 'NONREF':
+            reference = ''
+        return {
+            'transaction_date': datetime.date(
+                2000 + int(value_date[:2]), int(value_date[2:4]),
+                int(value_date[4:6])),
+            'transaction_type': transaction_type,
+            'amount': amount,
+            'payee': payee,
+            'description': description,
+            'invoice_number': reference,
+            'currency': record['currency'],
+        }
@@ -0,0 +1,85 @@
+"""
+Importer for OFX bank statements.
+
+Supports the SGML based OFX 1.x (where elements have no closing tags) as well
+as the XML based OFX 2.x. The file is tokenized in chunks, so it is never
+loaded into memory at once.
+
+"""
+from decimal import Decimal
+import datetime
+from xml.sax.saxutils import unescape
+
+from .base import BaseImporter, register
+
+#: Entities, that are used in OFX 1.x besides the ones of XML
+ENTITIES = {'&nbsp;': ' '}
+
+
+def iter_tags(file_, chunk_size=65536):
+    """
+    Yields tuples of the tag name and the text after the tag.
+
+    Closing tags are yielded with a leading slash (i.e. ``/STMTTRN``).
+
+    """
+    buffer = ''
+    while True:
+        chunk = file_.read(chunk_size)
+        parts = (buffer + chunk).split('<')
+        # The last part is only complete once the next tag has been read
+        buffer = parts.pop() if chunk else ''
+        for part in parts:
+            tag, separator, text = part.partition('>')
+            if separator:
+                yield tag.strip().upper(), unescape(text.strip(), ENTITIES)
+        if not chunk:
+            break
+
+
+@register
+class OFXImporter(BaseImporter):
+    """
+    Imports the ``STMTTRN`` elements of an OFX file.
+
+    The ``FITID`` of the bank identifies each transaction, so it is used as
+    fingerprint if available.
+
+    """
+    name = 'ofx'
+
+    def iter_records(self, file_):
+        currency = ''
+        record = None
+        for tag, text in iter_tags(file_):
+            if tag == 'CURDEF':
+                currency = text
+            elif tag == 'STMTTRN':
+                record = {'CURRENCY': currency}
+            elif tag == '/STMTTRN':
+                if record is not None:
+                    yield record
+                record = None
+            elif record is not None and text:
+                record[tag] = text
+
+    def get_fingerprint_values(self, record):
+        if record.get('FITID'):
+            return ['FITID', record['FITID']]
+        return super(OFXImporter, self).get_fingerprint_values(record)
+
+    def parse_record(self, record):
+        transaction_type, amount = self.split_amount(
+            Decimal(record['TRNAMT'].replace(',', '.')))
+        posted = record['DTPOSTED']
+        memo = record.get('MEMO', '')
+        return {
+            'transaction_date': datetime.date(
+                int(posted[:4]), int(posted[4:6]), int(posted[6:8])),
+            'transaction_type': transaction_type,
+            'amount': amount,
+            'payee': record.get('NAME') or memo,
+            'description': memo,
+            'invoice_number': record.get('CHECKNUM', ''),
+            'currency': record.get('CURRENCY', ''),
+        }
@@ -0,0 +1,269 @@
+"""
+Opt-in timing instrumentation of the account_keeping views.
+
+Add ``account_keeping.instrumentation.InstrumentationMiddleware`` to your
+middleware to record the number of SQL queries, the database time, the
+template render time and the remaining Python time of each request to an
+account_keeping view. The numbers are sent as ``Server-Timing`` header,
+logged and aggregated per view in a histogram, that the ``request_stats``
+command prints.
+
+"""
+from itertools import islice
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+try:
+    from django.utils.deprecation import MiddlewareMixin
+except ImportError:  # pragma: nocover
+    MiddlewareMixin = object
+
+logger = logging.getLogger(__name__)
+
+#: Upper bounds (in milliseconds) of the buckets of the request times
+BUCKETS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, None]
+
+STATS_KEY = 'account_keeping_request_stats'
+
+
+class RequestMetrics(object):
+    """
+    Measures one request.
+
+    Queries are recorded in the ``queries_log`` of each connection, which is
+    reset at the start of each request. The template time is the time of
+    rendering the response without the queries, that run while rendering
+    (i.e. of lazy querysets).
+
+    """
+    def __init__(self):
+        self.started = time.time()
+        self.connections = []
+        for connection in connections.all():
+            self.connections.append((
+                connection, connection.force_debug_cursor,
+                len(connection.queries_log)))
+            connection.force_debug_cursor = True
+        self.render_started = None
+        self.render_db = None
+        self.template = 0
+
+    def get_queries(self):
+        """Returns a tuple of the number and duration (ms) of the queries."""
+        count, duration = 0, 0
+        for connection, force_debug_cursor, start in self.connections:
+            for query in islice(connection.queries_log, start, None):
+                count += 1
+                duration += float(query['time']) * 1000
+        return count, duration
+
+    def start_render(self):
+        self.render_started = time.time()
+        self.render_db = self.get_queries()[1]
+
+    def end_render(self):
+        if self.render_started is None:
+            return
+        self.template += max(
+            (time.time() - self.render_started) * 1000
+            - (self.get_queries()[1] - self.render_db), 0)
+        self.render_started = None
+
+    def finish(self):
+        """Stops the measurement and returns a dict of the numbers."""
+        total = (time.time() - self.started) * 1000
+        queries, db = self.get_queries()
+        for connection, force_debug_cursor, start in self.connections:
+            connection.force_debug_cursor = force_debug_cursor
+        return {
+            'queries': queries,
+            'db': db,
+            'template': self.template,
+            'python': max(total - db - self.template, 0),
+            'total': total,
+        }
+
+
+class Histogram(object):
+    """
+    Aggregates the numbers of the requests per view within the process.
+
+    Every ``ACCOUNT_KEEPING_INSTRUMENTATION_FLUSH_INTERVAL`` seconds, the
+    numbers are merged into the cache of the
+    ``ACCOUNT_KEEPING_INSTRUMENTATION_CACHE_BACKEND`` setting, where the
+    ``request_stats`` command reads the numbers of all processes.
+
+    """
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+        self.flushed = time.time()
+
+    def add(self, view, values):
+        with self._lock:
+            stats = self._stats.setdefault(view, get_empty_stats())
+            stats['count'] += 1
+            for key in ['queries', 'db', 'template', 'python', 'total']:
+                stats[key] += values[key]
+            stats['max_queries'] = max(stats['max_queries'], values['queries'])
+            stats['max_total'] = max(stats['max_total'], values['total'])
+            for index, bound in enumerate(BUCKETS):
+                if bound is None or values['total'] <= bound:
+                    stats['buckets'][index] += 1
+                    break
+
+    def get_stats(self):
+        with self._lock:
+            return dict(
+                (view, dict(stats, buckets=list(stats['buckets'])))
+                for view, stats in self._stats.items())
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+    def flush(self):
+        """Merges the numbers into the cache and resets them."""
+        with self._lock:
+            stats, self._stats = self._stats, {}
+            self.flushed = time.time()
+        if stats:
+            cache = get_cache()
+            # Concurrent flushes of several processes can lose some numbers,
+            # which is fine for statistics
+            cache.set(STATS_KEY, merge_stats(
+                cache.get(STATS_KEY) or {}, stats), None)
+
+    def flush_if_due(self):
+        interval = getattr(
+            settings, 'ACCOUNT_KEEPING_INSTRUMENTATION_FLUSH_INTERVAL', 60)
+        if self.flushed + interval <= time.time():
+            self.flush()
+
+
+histogram = Histogram()
+
+
+def get_cache():
+    return caches[getattr(
+        settings, 'ACCOUNT_KEEPING_INSTRUMENTATION_CACHE_BACKEND', 'default')]
+
+
+def get_empty_stats():
+    return {
+        'count': 0,
+        'queries': 0,
+        'max_queries': 0,
+        'db': 0,
+        'template': 0,
+        'python': 0,
+        'total': 0,
+        'max_total': 0,
+        'buckets': [0] * len(BUCKETS),
+    }
+
+
+def merge_stats(stats, other):
+    """Returns the sum of two dicts of numbers per view."""
+    result = {}
+    for view in set(stats) | set(other):
+        merged = get_empty_stats()
+        for values in [stats.get(view), other.get(view)]:
+            if not values:
+                continue
+            for key, value in values.items():
+                if key == 'buckets':
+                    merged[key] = [a + b for a, b in zip(merged[key], value)]
+                elif key.startswith('max_'):
+                    merged[key] = max(merged[key], value)
+                else:
+                    merged[key] += value
+        result[view] = merged
+    return result
+
+
+def get_stats():
+    """Returns the numbers of all processes and of the current process."""
+    return merge_stats(get_cache().get(STATS_KEY) or {}, histogram.get_stats())
+
+
+def reset_stats():
+    histogram.reset()
+    get_cache().delete(STATS_KEY)
+
+
+def get_percentile(buckets, percentile):
+    """
+    Returns the upper bound of the bucket, that contains the percentile.
+
+    ``None`` means, that it is above the largest bound.
+
+    """
+    target = sum(buckets) * percentile
+    count = 0
+    for bound, bucket in zip(BUCKETS, buckets):
+        count += bucket
+        if bucket and count >= target:
+            return bound
+    return None
+
+
+def get_server_timing(values):
+    """Returns the value of the ``Server-Timing`` header."""
+    return ', '.join([
+        'db;dur={0:.1f};desc="{1} queries"'.format(
+            values['db'], values['queries']),
+        'template;dur={0:.1f}'.format(values['template']),
+        'python;dur={0:.1f}'.format(values['python']),
+        'total;dur={0:.1f}'.format(values['total']),
+    ])
+
+
+def is_instrumented(view_func):
+    """Returns ``True`` for the views of the account_keeping app."""
+    return getattr(view_func, '__module__', '').startswith('account_keeping.')
+
+
+class InstrumentationMiddleware(MiddlewareMixin):
+    """
+    Records the numbers of each request to an account_keeping view.
+
+    Works with ``MIDDLEWARE`` and ``MIDDLEWARE_CLASSES``. Requests to other
+    views are not measured at all.
+
+    """
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if is_instrumented(view_func):
+            request._account_keeping_metrics = RequestMetrics()
+            request._account_keeping_view = view_func.__name__
+
+    def process_template_response(self, request, response):
+        metrics = getattr(request, '_account_keeping_metrics', None)
+        if metrics is not None:
+            metrics.start_render()
+            response.add_post_render_callback(lambda r: metrics.end_render())
+        return response
+
+    def process_response(self, request, response):
+        metrics = getattr(request, '_account_keeping_metrics', None)
+        if metrics is None:
+            return response
+        del request._account_keeping_metrics
+        values = metrics.finish()
+        view = request._account_keeping_view
+        response['Server-Timing'] = get_server_timing(values)
+        logger.info(
+            'view=%s method=%s path=%s status=%s queries=%d db_ms=%.1f'
+            ' template_ms=%.1f python_ms=%.1f total_ms=%.1f',
+            view, request.method, request.path, response.status_code,
+            values['queries'], values['db'], values['template'],
+            values['python'], values['total'],
+            extra=dict(values, view=view, status_code=response.status_code))
+        histogram.add(view, values)
+        histogram.flush_if_due()
+        return response
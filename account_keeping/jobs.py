@@ -0,0 +1,127 @@
+"""Background jobs of the account_keeping app."""
+import datetime
+import logging
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.db.models import Q
+from django.utils.module_loading import import_string
+from django.utils.timezone import now
+
+from . import exports
+from . import models
+
+logger = logging.getLogger(__name__)
+
+
+def get_runner():
+    """Returns the runner of the ``ACCOUNT_KEEPING_EXPORT_RUNNER`` setting."""
+    return import_string(getattr(
+        settings, 'ACCOUNT_KEEPING_EXPORT_RUNNER',
+        'account_keeping.jobs.queue_job'))
+
+
+def queue_job(job):
+    """
+    Default runner, that leaves the job in the database.
+
+    The ``run_export_jobs`` command processes all pending jobs.
+
+    """
+    return job
+
+
+def run_job_now(job):
+    """Runner, that exports the file within the current process."""
+    run_export_job(job)
+    return job
+
+
+def fail_stale_jobs():
+    """
+    Marks running jobs as failed, whose worker has died.
+
+    A running job updates its ``heartbeat_date`` with each progress. Jobs
+    without heartbeat for ``ACCOUNT_KEEPING_EXPORT_JOB_TIMEOUT`` seconds
+    (i.e. because the worker was killed) are failed instead of being retried,
+    so that a job, that kills its worker, can't do so over and over again.
+
+    Returns the number of failed jobs.
+
+    """
+    timeout = getattr(settings, 'ACCOUNT_KEEPING_EXPORT_JOB_TIMEOUT', 600)
+    stale = models.ExportJob.objects.filter(status='running').filter(
+        Q(heartbeat_date__lt=now() - datetime.timedelta(seconds=timeout)) |
+        Q(heartbeat_date__isnull=True))
+    return stale.update(
+        status='failed', finish_date=now(),
+        error='The export has been aborted. Please try again.')
+
+
+def claim_next_job():
+    """
+    Marks the oldest pending job as running and returns it.
+
+    The status is changed with a conditional update, so that several workers
+    never process the same job. Stale running jobs are failed first (see
+    ``fail_stale_jobs``). Returns ``None`` if there is no pending job.
+
+    """
+    fail_stale_jobs()
+    pending = models.ExportJob.objects.filter(status='pending')
+    for pk in pending.order_by('creation_date', 'pk').values_list(
+            'pk', flat=True)[:10]:
+        if pending.filter(pk=pk).update(
+                status='running', heartbeat_date=now()):
+            return models.ExportJob.objects.get(pk=pk)
+    return None
+
+
+def run_export_job(job):
+    """
+    Writes the export file of the given job into the media storage.
+
+    The progress is saved every ``exports.PROGRESS_INTERVAL`` transactions.
+    Errors mark the job as failed instead of being raised.
+
+    """
+    jobs = models.ExportJob.objects.filter(pk=job.pk)
+    transactions = exports.get_transactions(job.start, job.end, job.branch)
+    job.status = 'running'
+    job.total = transactions.count()
+    jobs.update(status=job.status, total=job.total, heartbeat_date=now())
+
+    def progress(count):
+        jobs.update(progress=count, heartbeat_date=now())
+
+    try:
+        with tempfile.TemporaryFile() as output:
+            if job.export_format == 'csv':
+                exports.write_csv(transactions, output, progress)
+            elif job.export_format == 'xlsx':
+                exports.write_xlsx(transactions, output, progress)
+            elif job.export_format == 'parquet':
+                exports.write_parquet(
+                    transactions, exports.TRANSACTION_COLUMNS, output,
+                    progress)
+            else:
+                dataset = models.TransactionResource().export(
+                    queryset=transactions.select_related(
+                        'parent', 'invoice', 'payee', 'category',
+                        'currency'))
+                output.write(dataset.xls)
+            output.seek(0)
+            job.file.save('transactions-{0}.{1}'.format(
+                job.pk, job.export_format), File(output), save=False)
+    except Exception as ex:
+        logger.exception('Export job {0} failed.'.format(job.pk))
+        job.status = 'failed'
+        job.error = str(ex)
+    else:
+        job.status = 'done'
+        job.progress = job.total
+    job.finish_date = now()
+    jobs.update(status=job.status, error=job.error, file=job.file.name,
+                progress=job.progress, finish_date=job.finish_date)
+    return job
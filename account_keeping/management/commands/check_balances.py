@@ -0,0 +1,42 @@
+"""
+Verifies the stored balances of all accounts and repairs them if needed.
+
+Run this once a month to move the closed month of all accounts forward and
+after bulk operations that bypass ``Transaction.save()``.
+
+"""
+from django.core.management.base import BaseCommand
+
+from ... import models
+
+
+class Command(BaseCommand):
+    help = 'Verifies and repairs the stored balances of all accounts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-a', '--account',
+            dest='account',
+            help='Account slug of the account that should be handled.',
+        )
+        parser.add_argument(
+            '-r', '--repair',
+            action='store_true',
+            dest='repair',
+            default=False,
+            help='Write the recomputed balances to the database.',
+        )
+
+    def handle(self, *args, **options):
+        accounts = models.Account.objects.all()
+        if options.get('account'):
+            accounts = accounts.filter(slug=options.get('account'))
+        total_errors = 0
+        for account in accounts:
+            errors = account.update_balances(commit=options.get('repair'))
+            if errors:
+                self.stdout.write('{0}: {1} wrong balance(s)'.format(
+                    account.slug, errors))
+            total_errors += errors
+        if total_errors and not options.get('repair'):
+            self.stdout.write('Run with --repair to fix the balances.')
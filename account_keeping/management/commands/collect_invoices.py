@@ -1,18 +1,49 @@
 """
-Collects invoices for the given account and timeframe into a tarball.
+Collects invoices for the given account and timeframe into a folder or a
+tarball.
+
+The PDFs are numbered in the order of the transactions. A manifest
+(``manifest.csv``) lists the sequence number, transaction, invoice number,
+SHA-256 hash and size of each file.
+
+In incremental mode, each PDF is stored once by its SHA-256 hash in a store
+folder and the numbered files are hardlinks to it. An index remembers the
+hash, size and modification time of each collected PDF, so unchanged PDFs
+are not read again on the next run.
 
 """
+from collections import OrderedDict
+import csv
 import datetime
+import io
+import json
 import os
+import re
 import shutil
+import tarfile
+import tempfile
+import time
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:  # pragma: nocover
+    ThreadPoolExecutor = None
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+from django.utils.encoding import force_bytes
+from django.utils.six import StringIO
 
 from ... import models
+from ... import utils
+
+MANIFEST_HEADER = [
+    'sequence', 'transaction_id', 'invoice_number', 'filename', 'sha256',
+    'size']
 
 
 class Command(BaseCommand):
-    help = 'Copies invoices of transactions into a folder.'
+    help = 'Copies invoices of transactions into a folder or a tarball.'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -20,6 +51,12 @@ class Command(BaseCommand):
             dest='output',
             help='Output folder. Make sure that the folder exists.',
         )
+        parser.add_argument(
+            '-t', '--tar',
+            dest='tar',
+            help='Write the invoices into this .tar or .tar.gz file instead'
+                 ' of a folder.',
+        )
         parser.add_argument(
             '-a', '--account',
             dest='account',
@@ -35,19 +72,227 @@ class Command(BaseCommand):
             dest='end_date',
             help='End date. Include all transactions up to this date.',
         )
+        parser.add_argument(
+            '-w', '--workers',
+            dest='workers',
+            type=int,
+            default=1,
+            help='Number of threads, that copy files into the folder.',
+        )
+        parser.add_argument(
+            '-i', '--incremental',
+            action='store_true',
+            dest='incremental',
+            default=False,
+            help='Only copy new or changed PDFs and hardlink duplicates.',
+        )
+        parser.add_argument(
+            '--store',
+            dest='store',
+            help='Folder of the index and the stored PDFs of the incremental'
+                 ' mode. Must be on the same filesystem as the output folder.'
+                 ' Defaults to the folder ".invoices" within the output'
+                 ' folder.',
+        )
+
+    def get_files(self, account, start_date, end_date):
+        """
+        Returns a list of tuples of the sequence number, transaction and
+        invoice of each PDF.
+
+        The invoices of the transactions and their children are loaded with
+        two queries.
+
+        """
+        transactions = models.Transaction.objects.filter(
+            account=account,
+            transaction_date__gte=start_date,
+            transaction_date__lte=end_date,
+        ).select_related('invoice').prefetch_related(Prefetch(
+            'children',
+            queryset=models.Transaction.objects.select_related('invoice'),
+        )).order_by('-transaction_date')
+        files = []
+        for transaction in transactions:
+            for txn in list(transaction.children.all()) or [transaction]:
+                if txn.invoice and txn.invoice.pdf:
+                    files.append((len(files) + 1, txn, txn.invoice))
+        return files
+
+    def get_filename(self, sequence):
+        return '{0}.pdf'.format(str(sequence).zfill(4))
 
-    def __init__(self, *args, **kwargs):
-        super(Command, self).__init__(*args, **kwargs)
-        self.counter = 1
+    def copy_file(self, item):
+        """Copies the PDF into the output folder and returns its manifest row."""
+        sequence, transaction, invoice = item
+        filename = self.get_filename(sequence)
+        with invoice.pdf.storage.open(invoice.pdf.name, 'rb') as source, \
+                open(os.path.join(self.output_folder, filename), 'wb') as dest:
+            reader = utils.ChecksumReader(source)
+            shutil.copyfileobj(reader, dest)
+        return [sequence, transaction.pk, invoice.invoice_number, filename,
+                reader.hexdigest(), reader.size]
 
-    def copy_file(self, transaction):
-        if transaction.invoice and transaction.invoice.pdf:  # pragma: nocover
-            counter = str(self.counter).zfill(4)
-            filename = '{0}.pdf'.format(counter)
-            shutil.copy(
-                transaction.invoice.pdf.file.name,
+    def get_manifest(self, rows):
+        """Returns the manifest of the given rows as CSV."""
+        output = StringIO()
+        writer = csv.writer(output)
+        writer.writerow(MANIFEST_HEADER)
+        writer.writerows(rows)
+        return force_bytes(output.getvalue())
+
+    def write_folder(self, files, workers):
+        """Copies the files into the output folder, optionally in threads."""
+        rows = self.map(self.copy_file, files, workers)
+        with open(os.path.join(self.output_folder, 'manifest.csv'),
+                  'wb') as manifest:
+            manifest.write(self.get_manifest(rows))
+        return rows
+
+    def map(self, function, items, workers):
+        """Applies the function to the items, optionally in threads."""
+        if workers > 1:
+            if ThreadPoolExecutor is None:  # pragma: nocover
+                raise CommandError('Please install futures to use workers.')
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                return list(executor.map(function, items))
+        return [function(item) for item in items]
+
+    def get_object_path(self, checksum):
+        return os.path.join(self.store, 'objects', checksum[:2],
+                            '{0}.pdf'.format(checksum))
+
+    def store_file(self, item):
+        """
+        Stores the PDF of an invoice by its hash, unless it is unchanged.
+
+        Returns a tuple of the name of the PDF, its index entry and whether
+        it has been read.
+
+        """
+        name, pdf = item
+        storage = pdf.storage
+        try:
+            modified = storage.get_modified_time(name).isoformat()
+        except NotImplementedError:  # pragma: nocover
+            modified = None
+        size = storage.size(name)
+        entry = self.index.get(name)
+        if entry and modified and entry['modified'] == modified \
+                and entry['size'] == size \
+                and os.path.exists(self.get_object_path(entry['sha256'])):
+            return name, entry, False
+        with storage.open(name, 'rb') as source, tempfile.NamedTemporaryFile(
+                dir=self.store, delete=False) as dest:
+            reader = utils.ChecksumReader(source)
+            shutil.copyfileobj(reader, dest)
+        entry = {'sha256': reader.hexdigest(), 'size': reader.size,
+                 'modified': modified}
+        object_path = self.get_object_path(entry['sha256'])
+        if os.path.exists(object_path):
+            # Same content as another PDF
+            os.remove(dest.name)
+        else:
+            try:
+                os.makedirs(os.path.dirname(object_path))
+            except OSError:
+                # Created by another thread in the meantime
+                if not os.path.isdir(os.path.dirname(object_path)):
+                    raise
+            os.rename(dest.name, object_path)
+        return name, entry, True
+
+    def link_file(self, source, target):
+        """Hardlinks the target to the source or copies it, if that fails."""
+        if os.path.exists(target):
+            if os.path.samefile(source, target):
+                return False
+            os.remove(target)
+        try:
+            os.link(source, target)
+        except (AttributeError, OSError):  # pragma: nocover
+            # i.e. across filesystems
+            shutil.copyfile(source, target)
+        return True
+
+    def write_incremental(self, files, workers):
+        """
+        Updates the output folder with the new or changed PDFs.
+
+        Each PDF is read at most once per run, even if it belongs to several
+        transactions. Unchanged PDFs are not read at all. Numbered files,
+        that are not part of this run anymore, are removed.
+
+        """
+        self.store = self.store or os.path.join(
+            self.output_folder, '.invoices')
+        if not os.path.exists(self.store):
+            os.makedirs(self.store)
+        index_path = os.path.join(self.store, 'index.json')
+        self.index = {}
+        if os.path.exists(index_path):
+            with open(index_path) as index_file:
+                self.index = json.load(index_file)
+
+        pdfs = OrderedDict()
+        for sequence, transaction, invoice in files:
+            pdfs.setdefault(invoice.pdf.name, invoice.pdf)
+        read = 0
+        for name, entry, was_read in self.map(
+                self.store_file, pdfs.items(), workers):
+            self.index[name] = entry
+            read += was_read
+        with open(index_path, 'w') as index_file:
+            json.dump(self.index, index_file)
+
+        rows = []
+        linked = 0
+        for sequence, transaction, invoice in files:
+            entry = self.index[invoice.pdf.name]
+            filename = self.get_filename(sequence)
+            linked += self.link_file(
+                self.get_object_path(entry['sha256']),
                 os.path.join(self.output_folder, filename))
-            self.counter += 1
+            rows.append([sequence, transaction.pk, invoice.invoice_number,
+                         filename, entry['sha256'], entry['size']])
+        filenames = set(row[3] for row in rows)
+        for filename in os.listdir(self.output_folder):
+            if re.match(r'^\d{4,}\.pdf$', filename) \
+                    and filename not in filenames:
+                os.remove(os.path.join(self.output_folder, filename))
+        with open(os.path.join(self.output_folder, 'manifest.csv'),
+                  'wb') as manifest:
+            manifest.write(self.get_manifest(rows))
+        self.stdout.write('{0} PDFs read, {1} files updated'.format(
+            read, linked))
+        return rows
+
+    def write_tar(self, path, files):
+        """
+        Streams the files into a tarball.
+
+        The tarball is written in stream mode, so each PDF is read once and
+        nothing is written to a temporary folder.
+
+        """
+        mode = 'w|gz' if path.endswith(('.gz', '.tgz')) else 'w|'
+        rows = []
+        with tarfile.open(path, mode) as tar:
+            for sequence, transaction, invoice in files:
+                info = tarfile.TarInfo(self.get_filename(sequence))
+                info.size = invoice.pdf.size
+                info.mtime = time.time()
+                with invoice.pdf.storage.open(invoice.pdf.name, 'rb') as pdf:
+                    reader = utils.ChecksumReader(pdf)
+                    tar.addfile(info, reader)
+                rows.append([sequence, transaction.pk, invoice.invoice_number,
+                             info.name, reader.hexdigest(), reader.size])
+            manifest = self.get_manifest(rows)
+            info = tarfile.TarInfo('manifest.csv')
+            info.size = len(manifest)
+            info.mtime = time.time()
+            tar.addfile(info, io.BytesIO(manifest))
+        return rows
 
     def handle(self, *args, **options):
         account = models.Account.objects.get(slug=options.get('account'))
@@ -56,14 +301,17 @@ class Command(BaseCommand):
             options.get('start_date'), '%Y-%m-%d')
         end_date = datetime.datetime.strptime(
             options.get('end_date'), '%Y-%m-%d')
-        transactions = models.Transaction.objects.filter(
-            account=account,
-            transaction_date__gte=start_date,
-            transaction_date__lte=end_date,
-        ).prefetch_related('children', ).order_by('-transaction_date')
-        for transaction in transactions:
-            if transaction.children.all():
-                for child in transaction.children.all():
-                    self.copy_file(child)
-            else:
-                self.copy_file(transaction)
+        files = self.get_files(account, start_date, end_date)
+        if options.get('incremental'):
+            if not self.output_folder or options.get('tar'):
+                raise CommandError(
+                    'The incremental mode needs an output folder.')
+            self.store = options.get('store')
+            rows = self.write_incremental(files, options.get('workers'))
+        elif options.get('tar'):
+            rows = self.write_tar(options.get('tar'), files)
+        elif self.output_folder:
+            rows = self.write_folder(files, options.get('workers'))
+        else:
+            raise CommandError('Please specify an output folder or tarball.')
+        self.stdout.write('{0} invoices collected'.format(len(rows)))
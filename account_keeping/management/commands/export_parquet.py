@@ -0,0 +1,67 @@
+"""
+Exports transactions and invoices as Parquet files for analytics.
+
+Writes ``transactions.parquet`` and ``invoices.parquet`` into the output
+folder. See ``account_keeping.exports`` for the columns.
+
+"""
+import datetime
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import exports
+from ... import models
+
+
+class Command(BaseCommand):
+    help = 'Exports transactions and invoices as Parquet files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-o', '--output',
+            dest='output',
+            default='.',
+            help='Output folder. Make sure that the folder exists.',
+        )
+        parser.add_argument(
+            '-b', '--branch',
+            dest='branch',
+            help='Branch slug of the branch that should be exported.',
+        )
+        parser.add_argument(
+            '-s', '--start',
+            dest='start_date',
+            default='1900-01-01',
+            help='Start date. Include all data from this date.',
+        )
+        parser.add_argument(
+            '-e', '--end',
+            dest='end_date',
+            help='End date. Include all data up to this date.',
+        )
+
+    def handle(self, *args, **options):
+        if exports.pyarrow is None:
+            raise CommandError('Please install pyarrow to export Parquet'
+                               ' files.')
+        branch = None
+        if options.get('branch'):
+            branch = models.Branch.objects.get(slug=options.get('branch'))
+        start_date = datetime.datetime.strptime(
+            options.get('start_date'), '%Y-%m-%d').date()
+        if options.get('end_date'):
+            end_date = datetime.datetime.strptime(
+                options.get('end_date'), '%Y-%m-%d').date()
+        else:
+            end_date = datetime.date.today()
+        for filename, queryset, columns in [
+                ('transactions.parquet', exports.get_transactions(
+                    start_date, end_date, branch),
+                 exports.TRANSACTION_COLUMNS),
+                ('invoices.parquet', exports.get_invoices(
+                    start_date, end_date, branch),
+                 exports.INVOICE_COLUMNS)]:
+            path = os.path.join(options.get('output'), filename)
+            count = exports.write_parquet(queryset, columns, path)
+            self.stdout.write('{0}: {1} rows'.format(path, count))
@@ -0,0 +1,72 @@
+"""
+Creates a synthetic ledger with branches, accounts, currencies, rates,
+payees, categories, invoices, split transactions and partial payments.
+
+The same seed and start month always create the same ledger, so the numbers
+of benchmarks and profiling sessions can be compared.
+
+"""
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import generator
+
+COUNTS = ['branches', 'accounts', 'currencies', 'payees', 'categories',
+          'months', 'invoices', 'transactions', 'splits']
+
+
+class Command(BaseCommand):
+    help = 'Creates a deterministic synthetic ledger.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale',
+            dest='scale',
+            default='small',
+            choices=list(generator.SCALES),
+            help='Predefined volumes of the ledger.',
+        )
+        parser.add_argument(
+            '--seed',
+            dest='seed',
+            type=int,
+            default=0,
+            help='Seed of the random numbers.',
+        )
+        parser.add_argument(
+            '-s', '--start',
+            dest='start',
+            help='First month of the ledger (YYYY-MM). Defaults to the month,'
+                 ' that makes the ledger end with the current month.',
+        )
+        parser.add_argument(
+            '--prefix',
+            dest='prefix',
+            default='synthetic',
+            help='Prefix of the slugs and invoice numbers.',
+        )
+        for name in COUNTS:
+            parser.add_argument(
+                '--{0}'.format(name),
+                dest=name,
+                type=int,
+                help='Overrides the number of {0} of the scale.'.format(name),
+            )
+
+    def handle(self, *args, **options):
+        start = None
+        if options.get('start'):
+            start = datetime.datetime.strptime(
+                options.get('start'), '%Y-%m').date()
+        counts = dict(
+            (name, options[name]) for name in COUNTS
+            if options.get(name) is not None)
+        try:
+            result = generator.generate_ledger(
+                options.get('scale'), options.get('seed'), start,
+                options.get('prefix'), **counts)
+        except ValueError as ex:
+            raise CommandError(ex)
+        for name, count in result.items():
+            self.stdout.write('{0}: {1}'.format(name, count))
@@ -0,0 +1,115 @@
+"""
+Imports a bank statement into an account.
+
+The format is given with ``--importer`` (i.e. ``ofx``, ``camt``, ``mt940``,
+``csv`` or ``mmex``). Rows, that have already been imported, are skipped, so
+an aborted import can simply be started again.
+
+"""
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from currency_history.models import Currency
+
+from ... import importers
+from ... import models
+
+
+class Command(BaseCommand):
+    help = 'Imports a bank statement into an account.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-f', '--file',
+            dest='filepath',
+            help='Filepath of the statement.',
+        )
+        parser.add_argument(
+            '-i', '--importer',
+            dest='importer',
+            help='Format of the file. One of: {0}'.format(
+                ', '.join(importers.get_importers())),
+        )
+        parser.add_argument(
+            '-a', '--account',
+            dest='account',
+            help='Account slug of the account that should hold the new data.',
+        )
+        parser.add_argument(
+            '-c', '--currency',
+            dest='currency',
+            help='ISO-code of the currency of rows without currency.'
+                 ' Defaults to the currency of the account.',
+        )
+        parser.add_argument(
+            '-t', '--vat',
+            dest='vat',
+            help='VAT that should be applied to all transactions (i.e. 19).',
+        )
+        parser.add_argument(
+            '--profile',
+            dest='profile',
+            help='Name of the profile of the csv importer.',
+        )
+        parser.add_argument(
+            '--category',
+            dest='category',
+            default='Uncategorized',
+            help='Category of rows without category.',
+        )
+        parser.add_argument(
+            '-b', '--batch-size',
+            dest='batch_size',
+            type=int,
+            default=1000,
+            help='Number of rows, that are inserted at once.',
+        )
+        parser.add_argument(
+            '-p', '--progress',
+            dest='progress',
+            type=int,
+            default=10000,
+            help='Report the progress every N rows.',
+        )
+        parser.add_argument(
+            '-w', '--workers',
+            dest='workers',
+            type=int,
+            default=1,
+            help='Number of processes, that parse the rows while the main'
+                 ' process writes them.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            importer = importers.get_importer(
+                options.get('importer'), profile=options.get('profile'))
+        except ValueError as ex:
+            raise CommandError(str(ex))
+        try:
+            account = models.Account.objects.get(slug=options.get('account'))
+        except models.Account.DoesNotExist:
+            raise CommandError('The specified account does not exist')
+        currency = None
+        if options.get('currency'):
+            try:
+                currency = Currency.objects.get(
+                    iso_code=options.get('currency'))
+            except Currency.DoesNotExist:
+                raise CommandError('The specified currency does not exist')
+        try:
+            count, imported = importers.import_file(
+                importer, options.get('filepath'), account,
+                batch_size=options.get('batch_size'),
+                progress=options.get('progress'),
+                workers=options.get('workers'),
+                log=self.stdout.write,
+                currency=currency,
+                vat=Decimal(options.get('vat') or 0),
+                default_category=options.get('category'),
+            )
+        except ValueError as ex:
+            raise CommandError(str(ex))
+        self.stdout.write('{0} rows processed, {1} new rows imported'.format(
+            count, imported))
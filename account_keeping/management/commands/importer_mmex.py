@@ -5,15 +5,16 @@ IMPORTANT: MMEX does not distinguish between incoming and outgoing "Transfer"
 transactions. After you export the .csv you must identify all incoming
 "Transfer" transactions and rename the type to "TransferDeposit".
 
+This is a shortcut for ``import_statement --importer mmex``.
+
 """
 from decimal import Decimal
-import csv
-import datetime
 
 from django.core.management.base import BaseCommand, CommandError
 
 from currency_history.models import Currency
 
+from ... import importers
 from ... import models
 
 
@@ -41,6 +42,28 @@ class Command(BaseCommand):
             dest='vat',
             help='VAT that should be applied to all transactions (i.e. 19)',
         )
+        parser.add_argument(
+            '-b', '--batch-size',
+            dest='batch_size',
+            type=int,
+            default=1000,
+            help='Number of rows, that are inserted at once',
+        )
+        parser.add_argument(
+            '-p', '--progress',
+            dest='progress',
+            type=int,
+            default=10000,
+            help='Report the progress every N rows',
+        )
+        parser.add_argument(
+            '-w', '--workers',
+            dest='workers',
+            type=int,
+            default=1,
+            help='Number of processes, that parse the rows while the main'
+                 ' process writes them',
+        )
 
     def handle(self, *args, **options):
         try:
@@ -52,52 +75,15 @@ class Command(BaseCommand):
         vat = options.get('vat')
         if not vat:
             vat = 0
-        vat = Decimal(vat)
-
-        filepath = options.get('filepath')
-
-        deposit = models.Transaction.TRANSACTION_TYPES['deposit']
-        withdrawal = models.Transaction.TRANSACTION_TYPES['withdrawal']
 
-        with open(filepath, 'rt') as csvfile:
-            csvreader = csv.reader(csvfile)
-            for row in csvreader:
-                transaction_date = datetime.datetime.strptime(
-                    row[0], '%d/%m/%Y')
-                payee, created = models.Payee.objects.get_or_create(
-                    name=row[1])
-                if row[2] in ['Withdrawal', 'Transfer']:
-                    transaction_type = withdrawal
-                else:
-                    transaction_type = deposit
-                amount = Decimal(row[3])
-                if row[4] and not row[5]:
-                    cat_name = row[4]
-                else:
-                    cat_name = row[5]
-                category, created = models.Category.objects.get_or_create(
-                    name=cat_name)
-                description = row[7]
-
-                invoice = models.Invoice.objects.create(
-                    invoice_type=transaction_type,
-                    invoice_date=datetime.date(1900, 1, 1),
-                    currency=currency,
-                    amount_gross=amount,
-                    vat=vat,
-                    payment_date=transaction_date,
-                    branch=models.Branch.objects.first(),
-                )
-
-                models.Transaction.objects.create(
-                    account=account,
-                    transaction_type=transaction_type,
-                    transaction_date=transaction_date,
-                    description=description,
-                    invoice=invoice,
-                    payee=payee,
-                    category=category,
-                    currency=currency,
-                    amount_gross=amount,
-                    vat=vat,
-                )
+        count, imported = importers.import_file(
+            importers.get_importer('mmex'), options.get('filepath'), account,
+            batch_size=options.get('batch_size'),
+            progress=options.get('progress'),
+            workers=options.get('workers'),
+            log=self.stdout.write,
+            currency=currency,
+            vat=Decimal(vat),
+        )
+        self.stdout.write('{0} rows processed, {1} new rows imported'.format(
+            count, imported))
@@ -0,0 +1,39 @@
+"""
+Refreshes the cached list of unpaid invoices from Freckle.
+
+Run this command via cron or with ``--interval`` as a long running worker
+process, so that the index view always finds a recent list in the cache.
+
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from ... import freckle_api
+
+
+class Command(BaseCommand):
+    help = 'Fetches the unpaid invoices from Freckle into the cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-i', '--interval',
+            dest='interval',
+            type=float,
+            default=None,
+            help='Keep running and refresh the invoices every N seconds.',
+        )
+
+    def refresh(self):
+        entry = freckle_api.refresh_unpaid_invoices()
+        if entry['error']:
+            self.stderr.write('Wasn\'t able to connect to Freckle.')
+        else:
+            self.stdout.write('{0} unpaid invoices fetched'.format(
+                len(entry['invoices'])))
+
+    def handle(self, *args, **options):
+        self.refresh()
+        while options.get('interval'):
+            time.sleep(options.get('interval'))
+            self.refresh()
@@ -0,0 +1,67 @@
+"""
+Prints the request statistics of the instrumentation middleware.
+
+The numbers of the web processes are read from the cache of the
+``ACCOUNT_KEEPING_INSTRUMENTATION_CACHE_BACKEND`` setting, so this needs a
+cache, that is shared between processes.
+
+"""
+import json
+
+from django.core.management.base import BaseCommand
+
+from ... import instrumentation
+
+
+class Command(BaseCommand):
+    help = 'Prints the number of queries and the timings per view.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            dest='json',
+            default=False,
+            help='Print the raw numbers and buckets as JSON.',
+        )
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            dest='reset',
+            default=False,
+            help='Delete the numbers after printing them.',
+        )
+
+    def format_bound(self, bound):
+        if bound is None:
+            return '>{0}'.format(instrumentation.BUCKETS[-2])
+        return '<={0}'.format(bound)
+
+    def handle(self, *args, **options):
+        stats = instrumentation.get_stats()
+        if options.get('json'):
+            self.stdout.write(json.dumps({
+                'buckets': instrumentation.BUCKETS,
+                'views': stats,
+            }, indent=2, sort_keys=True))
+        else:
+            self.stdout.write(
+                '{0:<30} {1:>7} {2:>8} {3:>8} {4:>8} {5:>8} {6:>8} {7:>8}'
+                ' {8:>8}'.format(
+                    'view', 'count', 'queries', 'db', 'template', 'python',
+                    'total', 'p95', 'max'))
+            for view, values in sorted(
+                    stats.items(), key=lambda item: -item[1]['total']):
+                count = float(values['count'])
+                self.stdout.write(
+                    '{0:<30} {1:>7} {2:>8.1f} {3:>8.1f} {4:>8.1f} {5:>8.1f}'
+                    ' {6:>8.1f} {7:>8} {8:>8.1f}'.format(
+                        view, values['count'], values['queries'] / count,
+                        values['db'] / count, values['template'] / count,
+                        values['python'] / count, values['total'] / count,
+                        self.format_bound(instrumentation.get_percentile(
+                            values['buckets'], 0.95)),
+                        values['max_total']))
+            self.stdout.write('Averages and p95 in ms, sorted by total time')
+        if options.get('reset'):
+            instrumentation.reset_stats()
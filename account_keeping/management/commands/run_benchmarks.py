@@ -0,0 +1,77 @@
+"""
+Times and counts the queries of the views, the export and the importer
+against synthetic ledgers of several scales.
+
+The benchmarks run in a new test database, which is destroyed afterwards,
+so they never touch your data. The JSON report can be compared between
+releases.
+
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+
+from ... import benchmarks
+from ... import generator
+
+
+class Command(BaseCommand):
+    help = 'Runs the benchmarks and writes a JSON report.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scales',
+            dest='scales',
+            default='small,medium',
+            help='Comma separated names of the scales ({0}).'.format(
+                ', '.join(generator.SCALES)),
+        )
+        parser.add_argument(
+            '-r', '--repeat',
+            dest='repeat',
+            type=int,
+            default=3,
+            help='Number of runs of each benchmark.',
+        )
+        parser.add_argument(
+            '--seed',
+            dest='seed',
+            type=int,
+            default=0,
+            help='Seed of the synthetic ledgers.',
+        )
+        parser.add_argument(
+            '-o', '--output',
+            dest='output',
+            help='Path of the JSON report. Defaults to stdout.',
+        )
+
+    def handle(self, *args, **options):
+        scales = [
+            scale.strip() for scale in options.get('scales').split(',')
+            if scale.strip()]
+        for scale in scales:
+            if scale not in generator.SCALES:
+                raise CommandError(
+                    'Unknown scale "{0}". Choose one of: {1}'.format(
+                        scale, ', '.join(generator.SCALES)))
+        suite = benchmarks.BenchmarkSuite(
+            scales, repeat=options.get('repeat'), seed=options.get('seed'),
+            log=self.stderr.write)
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        runner.setup_test_environment()
+        old_config = runner.setup_databases()
+        try:
+            report = suite.run()
+        finally:
+            runner.teardown_databases(old_config)
+            runner.teardown_test_environment()
+        output = json.dumps(report, indent=2)
+        if options.get('output'):
+            with open(options.get('output'), 'w') as report_file:
+                report_file.write(output)
+            self.stdout.write('Report written to {0}'.format(
+                options.get('output')))
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,44 @@
+"""
+Processes the pending export jobs of the export view.
+
+Run this command as a long running worker process (i.e. via supervisor) or
+with ``--once`` via cron.
+
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from ... import jobs
+
+
+class Command(BaseCommand):
+    help = 'Processes pending export jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            dest='once',
+            default=False,
+            help='Exit when there are no pending jobs left.',
+        )
+        parser.add_argument(
+            '-s', '--sleep',
+            dest='sleep',
+            type=float,
+            default=5,
+            help='Seconds to wait, when there are no pending jobs.',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            job = jobs.claim_next_job()
+            if job is None:
+                if options.get('once'):
+                    break
+                time.sleep(options.get('sleep'))
+                continue
+            jobs.run_export_job(job)
+            self.stdout.write('Export job {0}: {1}'.format(
+                job.pk, job.status))
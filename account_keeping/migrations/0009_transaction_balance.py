@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 01:43
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def set_balances(apps, schema_editor):
+    Account = apps.get_model('account_keeping', 'Account')
+    Transaction = apps.get_model('account_keeping', 'Transaction')
+    for account in Account.objects.all():
+        balance = account.initial_amount
+        transactions = Transaction.objects.filter(
+            account=account, parent__isnull=True).order_by(
+                'transaction_date', 'pk')
+        for transaction in transactions:
+            balance += transaction.value_gross
+            Transaction.objects.filter(pk=transaction.pk).update(
+                balance=balance)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account_keeping', '0008_auto_20190121_1336'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='balance',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=18, null=True, verbose_name='Balance'),
+        ),
+        migrations.RunPython(set_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 01:44
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def set_total_amounts(apps, schema_editor):
+    Account = apps.get_model('account_keeping', 'Account')
+    Transaction = apps.get_model('account_keeping', 'Transaction')
+    for account in Account.objects.all():
+        total = Transaction.objects.filter(
+            account=account, parent__isnull=True).aggregate(
+                models.Sum('value_gross'))['value_gross__sum'] or 0
+        Account.objects.filter(pk=account.pk).update(
+            total_amount=account.initial_amount + total,
+            closed_amount=account.initial_amount)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account_keeping', '0009_transaction_balance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='closed_amount',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=18, verbose_name='Closed amount'),
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='closed_month',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='Closed month'),
+        ),
+        migrations.AlterField(
+            model_name='account',
+            name='total_amount',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=18, verbose_name='Total amount'),
+        ),
+        migrations.AlterIndexTogether(
+            name='transaction',
+            index_together=set([('account', 'transaction_date')]),
+        ),
+        migrations.RunPython(set_total_amounts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 01:46
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models.functions import TruncMonth
+
+
+def create_monthly_balances(apps, schema_editor):
+    Account = apps.get_model('account_keeping', 'Account')
+    MonthlyBalance = apps.get_model('account_keeping', 'MonthlyBalance')
+    Transaction = apps.get_model('account_keeping', 'Transaction')
+    for account in Account.objects.all():
+        month_totals = Transaction.objects.filter(
+            account=account, parent__isnull=True).annotate(
+                month=TruncMonth('transaction_date')).order_by().values(
+                    'month').annotate(total=models.Sum('value_gross'))
+        balance = account.initial_amount
+        for row in sorted(month_totals, key=lambda row: row['month']):
+            balance += row['total']
+            MonthlyBalance.objects.create(
+                account=account, month=row['month'], balance=balance)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account_keeping', '0010_account_balances'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyBalance',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Month')),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='Balance')),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_balances', to='account_keeping.Account', verbose_name='Account')),
+            ],
+            options={
+                'verbose_name': 'Monthly balance',
+                'verbose_name_plural': 'Monthly balances',
+                'ordering': ['-month'],
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='monthlybalance',
+            unique_together=set([('account', 'month')]),
+        ),
+        migrations.RunPython(
+            create_monthly_balances, migrations.RunPython.noop),
+    ]
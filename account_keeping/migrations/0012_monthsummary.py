@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 01:55
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account_keeping', '0011_monthlybalance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Month')),
+                ('base_currency', models.CharField(max_length=3, verbose_name='Base currency')),
+                ('income', models.DecimalField(blank=True, decimal_places=2, max_digits=18, null=True, verbose_name='Income')),
+                ('expenses', models.DecimalField(blank=True, decimal_places=2, max_digits=18, null=True, verbose_name='Expenses')),
+                ('new', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='New invoices')),
+                ('outstanding', models.DecimalField(blank=True, decimal_places=2, max_digits=18, null=True, verbose_name='Outstanding')),
+                ('balance', models.DecimalField(blank=True, decimal_places=2, max_digits=18, null=True, verbose_name='Balance')),
+                ('uses_fallback_rate', models.BooleanField(default=False, verbose_name='Uses fallback rate')),
+                ('branch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='month_summaries', to='account_keeping.Branch', verbose_name='Branch')),
+            ],
+            options={
+                'verbose_name': 'Month summary',
+                'verbose_name_plural': 'Month summaries',
+                'ordering': ['month'],
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='monthsummary',
+            unique_together=set([('branch', 'month', 'base_currency')]),
+        ),
+    ]
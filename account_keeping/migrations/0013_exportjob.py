@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 01:59
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('account_keeping', '0012_monthsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateField(verbose_name='Start')),
+                ('end', models.DateField(verbose_name='End')),
+                ('export_format', models.CharField(max_length=8, verbose_name='Format')),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('running', 'running'), ('done', 'done'), ('failed', 'failed')], default='pending', max_length=16, verbose_name='Status')),
+                ('progress', models.PositiveIntegerField(default=0, verbose_name='Exported transactions')),
+                ('total', models.PositiveIntegerField(blank=True, null=True, verbose_name='Total transactions')),
+                ('file', models.FileField(blank=True, upload_to='account_keeping/exports', verbose_name='File')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+                ('creation_date', models.DateTimeField(auto_now_add=True, verbose_name='Creation date')),
+                ('finish_date', models.DateTimeField(blank=True, null=True, verbose_name='Finish date')),
+                ('branch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='export_jobs', to='account_keeping.Branch', verbose_name='Branch')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='account_keeping_export_jobs', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Export job',
+                'verbose_name_plural': 'Export jobs',
+                'ordering': ['-creation_date', '-pk'],
+            },
+        ),
+    ]
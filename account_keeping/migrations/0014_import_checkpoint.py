@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 02:03
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account_keeping', '0013_exportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('importer', models.CharField(max_length=32, verbose_name='Importer')),
+                ('checksum', models.CharField(help_text='SHA-256 hash of the imported file.', max_length=64, verbose_name='Checksum')),
+                ('filename', models.CharField(blank=True, max_length=512, verbose_name='Filename')),
+                ('position', models.PositiveIntegerField(default=0, help_text='Number of rows, that have been processed.', verbose_name='Position')),
+                ('finished', models.BooleanField(default=False, verbose_name='Finished')),
+                ('update_date', models.DateTimeField(auto_now=True, verbose_name='Update date')),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_checkpoints', to='account_keeping.Account', verbose_name='Account')),
+            ],
+            options={
+                'verbose_name': 'Import checkpoint',
+                'verbose_name_plural': 'Import checkpoints',
+            },
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, help_text='Hash of the imported row, that created this transaction.', max_length=64, verbose_name='Fingerprint'),
+        ),
+        migrations.AlterIndexTogether(
+            name='transaction',
+            index_together=set([('account', 'transaction_date'), ('account', 'fingerprint')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='importcheckpoint',
+            unique_together=set([('account', 'importer', 'checksum')]),
+        ),
+    ]
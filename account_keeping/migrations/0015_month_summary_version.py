@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 02:28
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account_keeping', '0014_import_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthSummaryVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(default=0, verbose_name='Version')),
+            ],
+            options={
+                'verbose_name': 'Month summary version',
+                'verbose_name_plural': 'Month summary versions',
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 02:29
+from __future__ import unicode_literals
+
+import account_keeping.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account_keeping', '0015_month_summary_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='exportjob',
+            name='file',
+            field=models.FileField(blank=True, upload_to=account_keeping.models.get_export_path, verbose_name='File'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 02:29
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account_keeping', '0016_export_job_file_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='heartbeat_date',
+            field=models.DateTimeField(blank=True, help_text='Last sign of life of the worker of a running job.', null=True, verbose_name='Heartbeat date'),
+        ),
+    ]
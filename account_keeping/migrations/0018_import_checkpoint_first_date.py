@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 02:32
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account_keeping', '0017_export_job_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importcheckpoint',
+            name='first_date',
+            field=models.DateField(blank=True, help_text='Earliest date of the rows, that have been imported.', null=True, verbose_name='First date'),
+        ),
+    ]
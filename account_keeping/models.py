@@ -6,8 +6,13 @@ TODO: Add lazy_trans and docstrings
 """
 from datetime import date
 from decimal import Decimal
+import uuid
 
-from django.db import models
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import TruncMonth
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.translation import ugettext_lazy as _
 
@@ -16,6 +21,9 @@ from dateutil import relativedelta
 from import_export import resources
 from import_export.fields import Field
 
+from . import utils
+from .rates import RateResolver
+
 
 class AmountMixin(object):
     """
@@ -25,16 +33,18 @@ class AmountMixin(object):
     def set_amount_fields(self):
         if self.amount_net and not self.amount_gross:
             if self.vat:
-                self.amount_gross = round(
-                    self.amount_net * (self.vat / Decimal(100.0) + 1), 2)
+                # ``round()`` would return a float on Python 2
+                self.amount_gross = (
+                    self.amount_net * (self.vat / Decimal(100.0) + 1)
+                ).quantize(Decimal('0.01'))
             else:
                 self.amount_gross = self.amount_net
 
         if self.amount_gross and not self.amount_net:
             if self.vat:
-                self.amount_net = round(
-                    Decimal(1.0) / (
-                        self.vat / Decimal(100.0) + 1) * self.amount_gross, 2)
+                self.amount_net = (Decimal(1.0) / (
+                    self.vat / Decimal(100.0) + 1) * self.amount_gross
+                ).quantize(Decimal('0.01'))
             else:
                 self.amount_net = self.amount_gross
 
@@ -110,9 +120,24 @@ class Account(models.Model):
         max_digits=18,
         decimal_places=2,
         default=0,
+        editable=False,
         verbose_name=_('Total amount'),
     )
 
+    closed_amount = models.DecimalField(
+        max_digits=18,
+        decimal_places=2,
+        default=0,
+        editable=False,
+        verbose_name=_('Closed amount'),
+    )
+
+    closed_month = models.DateField(
+        blank=True, null=True,
+        editable=False,
+        verbose_name=_('Closed month'),
+    )
+
     active = models.BooleanField(
         default=True,
         verbose_name=_('Active?'),
@@ -126,23 +151,539 @@ class Account(models.Model):
         verbose_name = _('Account')
         verbose_name_plural = _('Accounts')
 
+    def save(self, *args, **kwargs):
+        # The balance fields are maintained by the transactions, so we never
+        # write back stale values of this instance
+        old = None
+        if self.pk:
+            old = Account.objects.filter(pk=self.pk).values(
+                'initial_amount', 'total_amount', 'closed_amount').first()
+        if old:
+            delta = self.initial_amount - old['initial_amount']
+            self.total_amount = old['total_amount'] + delta
+            self.closed_amount = old['closed_amount'] + delta
+        else:
+            self.total_amount = self.initial_amount
+            self.closed_amount = self.initial_amount
+        result = super(Account, self).save(*args, **kwargs)
+        if old and delta:
+            # All running balances contain the initial amount
+            self.transactions.filter(parent__isnull=True).update(
+                balance=models.F('balance') + delta)
+            self.monthly_balances.update(balance=models.F('balance') + delta)
+        return result
+
+    def update_balances(self, commit=True):
+        """
+        Verifies and recomputes all stored balances of this account.
+
+        The balances are usually maintained incrementally when transactions
+        are saved or deleted. Use this method after bulk operations, that
+        bypass ``Transaction.save()``. This also moves the closed month
+        forward to the last month.
+
+        :param commit: If ``False``, wrong values are only counted.
+        :returns: The number of wrong values that have been found.
+
+        """
+        errors = 0
+        balance = self.initial_amount
+        transactions = self.transactions.filter(parent__isnull=True).order_by(
+            'transaction_date', 'pk').values_list('pk', 'value_gross', 'balance')
+        wrong_balances = {}
+        for pk, value_gross, stored_balance in transactions.iterator():
+            balance += value_gross
+            if stored_balance != balance:
+                errors += 1
+                wrong_balances[pk] = balance
+        if commit:
+            write_balances(Transaction.objects, wrong_balances)
+
+        month_totals = self.transactions.filter(parent__isnull=True).annotate(
+            month=TruncMonth('transaction_date')).order_by().values(
+                'month').annotate(total=models.Sum('value_gross'))
+        month_totals = dict(
+            (row['month'], row['total']) for row in month_totals)
+        stored_balances = dict(
+            self.monthly_balances.values_list('month', 'balance'))
+        month_balance = self.initial_amount
+        for month in sorted(set(month_totals) | set(stored_balances)):
+            month_balance += month_totals.get(month, 0)
+            if stored_balances.get(month) != month_balance:
+                errors += 1
+                if commit:
+                    MonthlyBalance.objects.update_or_create(
+                        account=self, month=month,
+                        defaults={'balance': month_balance})
+
+        closed_month = utils.get_month(
+            date.today()) - relativedelta.relativedelta(months=1)
+        closed_amount = self.initial_amount + (self.transactions.filter(
+            parent__isnull=True,
+            transaction_date__lt=closed_month + relativedelta.relativedelta(
+                months=1),
+        ).aggregate(models.Sum('value_gross'))['value_gross__sum'] or 0)
+        if balance != self.total_amount:
+            errors += 1
+        if self.closed_month == closed_month \
+                and closed_amount != self.closed_amount:
+            errors += 1
+        if commit and errors:
+            MonthSummary.objects.invalidate()
+        if commit:
+            Account.objects.filter(pk=self.pk).update(
+                total_amount=balance,
+                closed_amount=closed_amount,
+                closed_month=closed_month,
+            )
+            self.total_amount = balance
+            self.closed_amount = closed_amount
+            self.closed_month = closed_month
+        return errors
+
+    def add_bulk_transactions(self):
+        """
+        Adds the top-level transactions without balance to the ledger.
+
+        Bulk inserts (i.e. of the importers) bypass ``Transaction.save()`` and
+        leave the balance of the new transactions empty. Only the range from
+        the first to the last new transaction is read. Changed balances within
+        this range are written with batched ``UPDATE`` queries. The later
+        transactions, the monthly balances and the totals of the account are
+        shifted by the sum of the new transactions.
+
+        Returns the date of the first new transaction or ``None``.
+
+        """
+        with transaction.atomic():
+            lock_ledgers(self.pk)
+            ledger = self.transactions.filter(parent__isnull=True)
+            new = ledger.filter(balance__isnull=True).order_by(
+                'transaction_date', 'pk').values_list('transaction_date', 'pk')
+            first, last = new.first(), new.last()
+            if first is None:
+                return None
+            after_first = models.Q(transaction_date__gt=first[0]) | models.Q(
+                transaction_date=first[0], pk__gte=first[1])
+            after_last = models.Q(transaction_date__gt=last[0]) | models.Q(
+                transaction_date=last[0], pk__gt=last[1])
+
+            previous = ledger.exclude(after_first).order_by(
+                '-transaction_date', '-pk').values_list(
+                    'balance', flat=True).first()
+            balance = self.initial_amount if previous is None else previous
+            balances = {}
+            added = 0
+            month_added = {}
+            for pk, transaction_date, value_gross, stored_balance in \
+                    ledger.filter(after_first).exclude(after_last).order_by(
+                        'transaction_date', 'pk').values_list(
+                            'pk', 'transaction_date', 'value_gross',
+                            'balance').iterator():
+                balance += value_gross
+                if stored_balance is None:
+                    added += value_gross
+                    month = utils.get_month(transaction_date)
+                    month_added[month] = month_added.get(month, 0) + \
+                        value_gross
+                if stored_balance != balance:
+                    balances[pk] = balance
+            write_balances(Transaction.objects, balances)
+            ledger.filter(after_last).update(
+                balance=models.F('balance') + added)
+
+            MonthlyBalance.objects.add_to_months(self, month_added)
+            closed_month = Account.objects.filter(pk=self.pk).values_list(
+                'closed_month', flat=True).get()
+            closed_added = sum(
+                value for month, value in month_added.items()
+                if closed_month and month <= closed_month)
+            Account.objects.filter(pk=self.pk).update(
+                total_amount=models.F('total_amount') + added,
+                closed_amount=models.F('closed_amount') + closed_added)
+        return first[0]
+
     def get_balance(self, month=None):
         """
         Returns the balance up until now or until the provided month.
 
+        The balance is read from the latest monthly balance snapshot, so the
+        costs don't depend on the size of the ledger.
+
         """
         if not month:
-            month = date(date.today().year, date.today().month, 1)
-        next_month = month + relativedelta.relativedelta(months=1)
-        account_balance = self.transactions.filter(
-            parent__isnull=True,
-            transaction_date__lt=next_month,
-        ).aggregate(models.Sum('value_gross'))['value_gross__sum'] or 0
-        account_balance = account_balance + self.initial_amount
-        return account_balance
+            month = utils.get_month(date.today())
+        if month == self.closed_month:
+            return self.closed_amount
+        balance = self.monthly_balances.filter(month__lte=month).values_list(
+            'balance', flat=True).first()
+        if balance is None:
+            return self.initial_amount
+        return balance
+
+
+class MonthlyBalanceManager(models.Manager):
+    """Custom manager for the ``MonthlyBalance`` model."""
+    def create_missing(self, account, month):
+        """
+        Creates the snapshot for the given account and month if needed.
+
+        A new snapshot starts with the closing balance of the month before.
+
+        """
+        snapshots = self.filter(account=account)
+        if snapshots.filter(month=month).exists():
+            return
+        balance = snapshots.filter(month__lt=month).values_list(
+            'balance', flat=True).first()
+        if balance is None:
+            balance = Account.objects.filter(pk=account).values_list(
+                'initial_amount', flat=True).get()
+        self.create(account_id=account, month=month, balance=balance)
+
+    def add_to_months(self, account, month_values):
+        """
+        Adds the given values to the snapshots of their and all later months.
+
+        :param month_values: A dict, that maps the first days of months to
+          the sum of the new transactions of the month.
+
+        """
+        if not month_values:
+            return
+        months = sorted(month_values)
+        snapshots = self.filter(account=account)
+        previous = snapshots.filter(month__lt=months[0]).values_list(
+            'balance', flat=True).first()
+        base = account.initial_amount if previous is None else previous
+        existing = dict(
+            (month, (pk, balance)) for month, pk, balance in snapshots.filter(
+                month__gte=months[0], month__lte=months[-1]).values_list(
+                    'month', 'pk', 'balance'))
+        added = 0
+        balances = {}
+        missing = []
+        for month in sorted(set(months) | set(existing)):
+            added += month_values.get(month, 0)
+            if month in existing:
+                pk, base = existing[month]
+                balances[pk] = base + added
+            else:
+                missing.append(self.model(
+                    account=account, month=month, balance=base + added))
+        write_balances(self, balances)
+        self.bulk_create(missing)
+        snapshots.filter(month__gt=months[-1]).update(
+            balance=models.F('balance') + added)
+
+    def get_balances(self, accounts, months):
+        """
+        Returns the closing balances of the given accounts for each month.
+
+        Needs two queries, no matter how many accounts or months are given.
+        Returns a dict that maps each month to a dict of account pks and
+        balances.
+
+        :param accounts: List of ``Account`` objects or pks.
+        :param months: List of dates of the first days of the wanted months.
+
+        """
+        months = sorted(months)
+        if not months:
+            return {}
+        pks = [getattr(account, 'pk', account) for account in accounts]
+        opening_balances = Account.objects.filter(pk__in=pks).annotate(
+            opening_balance=models.Subquery(
+                self.filter(
+                    account=models.OuterRef('pk'), month__lt=months[0],
+                ).order_by('-month').values('balance')[:1],
+                output_field=models.DecimalField(
+                    max_digits=18, decimal_places=2),
+            )).values_list('pk', 'initial_amount', 'opening_balance')
+        balances = {}
+        for pk, initial_amount, opening_balance in opening_balances:
+            if opening_balance is None:
+                opening_balance = initial_amount
+            balances[pk] = opening_balance
+        snapshots = self.filter(
+            account__in=pks, month__gte=months[0], month__lte=months[-1],
+        ).order_by('month').values_list('account', 'month', 'balance')
+        snapshots = iter(snapshots)
+        snapshot = next(snapshots, None)
+        result = {}
+        for month in months:
+            while snapshot and snapshot[1] <= month:
+                balances[snapshot[0]] = snapshot[2]
+                snapshot = next(snapshots, None)
+            result[month] = balances.copy()
+        return result
+
+
+class MonthlyBalance(models.Model):
+    """
+    Closing balance of an account at the end of a month.
+
+    There is one snapshot for every month that has transactions. The
+    snapshots are maintained incrementally whenever a transaction is saved or
+    deleted. For months without snapshot the latest previous snapshot
+    applies.
+
+    """
+    account = models.ForeignKey(
+        Account,
+        related_name='monthly_balances',
+        verbose_name=_('Account'),
+    )
+
+    month = models.DateField(
+        verbose_name=_('Month'),
+    )
+
+    balance = models.DecimalField(
+        max_digits=18,
+        decimal_places=2,
+        default=0,
+        verbose_name=_('Balance'),
+    )
+
+    objects = MonthlyBalanceManager()
+
+    class Meta:
+        ordering = ['-month']
+        unique_together = ['account', 'month']
+        verbose_name = _('Monthly balance')
+        verbose_name_plural = _('Monthly balances')
+
+
+class MonthSummaryManager(models.Manager):
+    """Custom manager for the ``MonthSummary`` model."""
+    def invalidate(self, *dates):
+        """
+        Deletes the summaries, that are affected by changes at the given dates.
+
+        Changes affect the balances and outstanding amounts of all later
+        months as well. If no dates are given, all summaries are deleted.
+
+        """
+        self.increment_version()
+        dates = [value for value in dates if value]
+        if not dates:
+            return self.all().delete()
+        return self.filter(
+            month__gte=utils.get_month(min(dates))).delete()
+
+    def invalidate_rates(self, value):
+        """
+        Deletes the summaries, that are affected by a rate at the given date.
+
+        This includes all summaries, that used the latest rate as a fallback.
+
+        """
+        self.increment_version()
+        return self.filter(
+            models.Q(month__gte=utils.get_month(value)) |
+            models.Q(uses_fallback_rate=True)).delete()
+
+    def get_version(self):
+        """
+        Returns the current version of the summaries.
+
+        The version is incremented by each invalidation. Read it before the
+        data of new summaries and pass it to ``save_summaries``.
+
+        """
+        return MonthSummaryVersion.objects.get_or_create(pk=1)[0].version
+
+    def increment_version(self):
+        # Locks the version row until the end of the current transaction, so
+        # that ``save_summaries`` can't save summaries in the meantime
+        MonthSummaryVersion.objects.filter(pk=1).update(
+            version=models.F('version') + 1)
+
+    def save_summaries(self, summaries, version):
+        """
+        Saves the given summaries, unless they have been invalidated.
+
+        Summaries, that were computed before an invalidation, are discarded.
+        The version row is locked until the summaries are saved, so an
+        invalidation can't slip between the check and the insert.
+
+        Returns ``True`` if the summaries have been saved.
+
+        """
+        with transaction.atomic():
+            current = MonthSummaryVersion.objects.select_for_update().filter(
+                pk=1).values_list('version', flat=True).first()
+            if current != version:
+                return False
+            try:
+                with transaction.atomic():
+                    self.bulk_create(summaries)
+            except IntegrityError:
+                # Another request has saved the same summaries in the
+                # meantime
+                return False
+        return True
+
+
+class MonthSummary(models.Model):
+    """
+    Figures of one month of the year overview in the base currency.
+
+    Summaries are computed on demand and deleted whenever a transaction,
+    invoice or rate of their month or an earlier month changes.
+
+    """
+    branch = models.ForeignKey(
+        Branch,
+        blank=True, null=True,
+        related_name='month_summaries',
+        verbose_name=_('Branch'),
+    )
+
+    month = models.DateField(
+        verbose_name=_('Month'),
+    )
+
+    base_currency = models.CharField(
+        max_length=3,
+        verbose_name=_('Base currency'),
+    )
+
+    income = models.DecimalField(
+        max_digits=18,
+        decimal_places=2,
+        blank=True, null=True,
+        verbose_name=_('Income'),
+    )
+
+    expenses = models.DecimalField(
+        max_digits=18,
+        decimal_places=2,
+        blank=True, null=True,
+        verbose_name=_('Expenses'),
+    )
+
+    new = models.DecimalField(
+        max_digits=18,
+        decimal_places=2,
+        default=0,
+        verbose_name=_('New invoices'),
+    )
 
+    outstanding = models.DecimalField(
+        max_digits=18,
+        decimal_places=2,
+        blank=True, null=True,
+        verbose_name=_('Outstanding'),
+    )
+
+    balance = models.DecimalField(
+        max_digits=18,
+        decimal_places=2,
+        blank=True, null=True,
+        verbose_name=_('Balance'),
+    )
+
+    uses_fallback_rate = models.BooleanField(
+        default=False,
+        verbose_name=_('Uses fallback rate'),
+    )
+
+    objects = MonthSummaryManager()
+
+    class Meta:
+        ordering = ['month']
+        unique_together = ['branch', 'month', 'base_currency']
+        verbose_name = _('Month summary')
+        verbose_name_plural = _('Month summaries')
+
+
+class MonthSummaryVersion(models.Model):
+    """
+    Counter of the invalidations of the ``MonthSummary`` objects.
+
+    There is only one row. It guards against saving summaries, that were
+    computed from data, that changed during the computation.
 
-class InvoiceManager(models.Manager):
+    """
+    version = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_('Version'),
+    )
+
+    class Meta:
+        verbose_name = _('Month summary version')
+        verbose_name_plural = _('Month summary versions')
+
+
+class InvoiceQuerySet(models.QuerySet):
+    """Custom queryset for the ``Invoice`` model."""
+    def __init__(self, *args, **kwargs):
+        super(InvoiceQuerySet, self).__init__(*args, **kwargs)
+        self._with_balance = False
+        self._balance_date = None
+
+    def _clone(self, **kwargs):
+        clone = super(InvoiceQuerySet, self)._clone(**kwargs)
+        clone._with_balance = self._with_balance
+        clone._balance_date = self._balance_date
+        return clone
+
+    def _fetch_all(self):
+        set_balances = self._with_balance and self._result_cache is None
+        super(InvoiceQuerySet, self)._fetch_all()
+        if set_balances:
+            invoices = [
+                obj for obj in self._result_cache if isinstance(obj, Invoice)]
+            balances = get_invoice_balances(invoices, self._balance_date)
+            for invoice, balance in zip(invoices, balances):
+                invoice._balance = balance
+
+    def get_totals_by_currency(self):
+        """
+        Returns the gross totals of the invoices grouped by currency.
+
+        The totals of all currencies are computed in one grouped query.
+        Returns a dict that maps the pks of all currencies that have invoices
+        to a dict with the keys ``expenses_gross`` and ``income_gross``.
+
+        """
+        qs = self.prefetch_related(None).order_by().values(
+            'currency', 'invoice_type').annotate(
+                amount_gross_sum=models.Sum('amount_gross'))
+        keys = {
+            Invoice.INVOICE_TYPES['withdrawal']: 'expenses_gross',
+            Invoice.INVOICE_TYPES['deposit']: 'income_gross',
+        }
+        totals = {}
+        for row in qs:
+            currency_totals = totals.setdefault(row['currency'], {
+                'expenses_gross': 0,
+                'income_gross': 0,
+            })
+            currency_totals[keys[row['invoice_type']]] += \
+                row['amount_gross_sum'] or 0
+        return totals
+
+    def with_balance(self, base_date=None):
+        """
+        Computes ``Invoice.balance`` of all invoices in bulk.
+
+        The paid amounts are summed up per invoice and currency in one
+        grouped query when the queryset is evaluated.
+
+        :param base_date: Any date of the month, whose rates should be used
+          for conversions. If ``None``, the latest rates are used.
+
+        """
+        clone = self._clone()
+        clone._with_balance = True
+        clone._balance_date = base_date
+        return clone
+
+
+class InvoiceManager(models.Manager.from_queryset(InvoiceQuerySet)):
     """Custom manager for the ``Invoice`` model."""
     def get_without_pdf(self):
         qs = Invoice.objects.filter(pdf='')
@@ -260,31 +801,62 @@ class Invoice(AmountMixin, models.Model):
     def save(self, *args, **kwargs):
         self.set_amount_fields()
         self.set_value_fields('invoice_type')
-        return super(Invoice, self).save(*args, **kwargs)
+        old_dates = []
+        if self.pk:
+            old_dates = Invoice.objects.filter(pk=self.pk).values_list(
+                'invoice_date', 'payment_date').first() or []
+        result = super(Invoice, self).save(*args, **kwargs)
+        MonthSummary.objects.invalidate(
+            self.invoice_date, self.payment_date, *old_dates)
+        return result
 
     @property
     def balance(self):
-        if not self.transactions.all():
-            return 0 - self.amount_net
+        if hasattr(self, '_balance'):
+            # Computed in bulk by ``InvoiceQuerySet.with_balance()``
+            return self._balance
+        return get_invoice_balances([self])[0]
+
 
+def get_invoice_balances(invoices, base_date=None):
+    """
+    Returns the balances of the given invoices as a list.
+
+    The balance is the sum of all transactions of an invoice, converted into
+    the currency of the invoice, minus the net amount of the invoice. The
+    transactions are summed up per invoice and currency in one grouped query.
+
+    """
+    invoice_pks = [invoice.pk for invoice in invoices if invoice.pk]
+    paid_amounts = {}
+    if invoice_pks:
+        qs = Transaction.objects.filter(invoice__in=invoice_pks).order_by()
+        qs = qs.values('invoice', 'currency').annotate(
+            amount_net_sum=models.Sum('amount_net'))
+        for row in qs:
+            paid_amounts.setdefault(row['invoice'], []).append(
+                (row['currency'], row['amount_net_sum']))
+    iso_codes = {}
+    if paid_amounts:
+        iso_codes = dict(Currency.objects.filter(pk__in=set(
+            invoice.currency_id for invoice in invoices
+        )).values_list('pk', 'iso_code'))
+    resolvers = {}
+    balances = []
+    for invoice in invoices:
         total = 0
-        # Convert amounts
-        for currency in Currency.objects.all():
-            # Get transactions for each currency
-            transactions = self.transactions.filter(currency=currency)
-            if not transactions:
-                continue
-
-            if currency == self.currency:
+        for currency, amount_net_sum in paid_amounts.get(invoice.pk, []):
+            if currency == invoice.currency_id:
                 rate = 1
             else:
-                rate = Decimal(CurrencyRateHistory.objects.filter(
-                    rate__from_currency=currency,
-                    rate__to_currency=self.currency,
-                )[0].value)
-            total += rate * transactions.aggregate(
-                models.Sum('amount_net'))['amount_net__sum']
-        return total - self.amount_net
+                iso_code = iso_codes[invoice.currency_id]
+                if iso_code not in resolvers:
+                    resolvers[iso_code] = RateResolver(
+                        iso_code, base_date, base_date)
+                rate = resolvers[iso_code].get_rate(currency, base_date)
+            total += rate * amount_net_sum
+        balances.append(total - invoice.amount_net)
+    return balances
 
 
 @python_2_unicode_compatible
@@ -323,7 +895,63 @@ class Category(models.Model):
         return self.name
 
 
-class TransactionManager(models.Manager):
+class TransactionQuerySet(models.QuerySet):
+    """Custom queryset for the ``Transaction`` model."""
+    def get_totals_by_account(self):
+        """
+        Returns net and gross totals of the transactions grouped by account.
+
+        All sums are computed with conditional aggregates in one grouped
+        query, so the number of queries does not depend on the number of
+        accounts. Returns a dict that maps account pks to a dict with the
+        keys ``count``, ``profit_net``, ``profit_gross``, ``expenses_net``,
+        ``expenses_gross``, ``income_net`` and ``income_gross``.
+
+        """
+        def conditional_sum(field_name, transaction_type):
+            return models.Sum(models.Case(
+                models.When(transaction_type=transaction_type,
+                            then=field_name),
+                default=models.Value(0),
+                output_field=models.DecimalField(),
+            ))
+
+        withdrawal = Transaction.TRANSACTION_TYPES['withdrawal']
+        deposit = Transaction.TRANSACTION_TYPES['deposit']
+        qs = self.order_by().values('account').annotate(
+            count=models.Count('pk'),
+            profit_net=models.Sum('value_net'),
+            profit_gross=models.Sum('value_gross'),
+            expenses_net=conditional_sum('amount_net', withdrawal),
+            expenses_gross=conditional_sum('amount_gross', withdrawal),
+            income_net=conditional_sum('amount_net', deposit),
+            income_gross=conditional_sum('amount_gross', deposit),
+        )
+        totals = {}
+        for row in qs:
+            account = row.pop('account')
+            totals[account] = dict(
+                (key, value or 0) for key, value in row.items())
+        return totals
+
+    def for_table(self):
+        """
+        Loads everything, that the transaction tables display.
+
+        The related objects of each row as well as the children and their
+        invoices are loaded upfront, so that rendering a table needs a fixed
+        number of queries.
+
+        """
+        return self.select_related(
+            'payee', 'category', 'currency', 'invoice',
+        ).prefetch_related(models.Prefetch(
+            'children',
+            queryset=Transaction.objects.select_related('invoice'),
+        ))
+
+
+class TransactionManager(models.Manager.from_queryset(TransactionQuerySet)):
     """Manager for the ``Transaction`` model."""
     def get_totals_by_payee(self, account, start_date=None, end_date=None):
         """
@@ -457,10 +1085,31 @@ class Transaction(AmountMixin, models.Model):
         verbose_name=_('Value gross'),
     )
 
+    balance = models.DecimalField(
+        max_digits=18,
+        decimal_places=2,
+        blank=True, null=True,
+        editable=False,
+        verbose_name=_('Balance'),
+    )
+
+    fingerprint = models.CharField(
+        max_length=64,
+        blank=True,
+        editable=False,
+        verbose_name=_('Fingerprint'),
+        help_text=_('Hash of the imported row, that created this'
+                    ' transaction.'),
+    )
+
     objects = TransactionManager()
 
     class Meta:
         ordering = ['-transaction_date', '-pk']
+        index_together = [
+            ('account', 'transaction_date'),
+            ('account', 'fingerprint'),
+        ]
         verbose_name = _('Transaction')
         verbose_name_plural = _('Transactions')
 
@@ -477,6 +1126,7 @@ class Transaction(AmountMixin, models.Model):
         if self.invoice and self.invoice.description:
             return self.invoice.description
         description = ''
+        # Uses the children of ``TransactionQuerySet.for_table()`` if loaded
         for child in self.children.all():
             if child.description:
                 description += u'{0},\n'.format(child.description)
@@ -485,14 +1135,175 @@ class Transaction(AmountMixin, models.Model):
         return description or u'n/a'
 
     def get_invoices(self):
-        if self.children.all():
-            return [child.invoice for child in self.children.all()]
+        children = list(self.children.all())
+        if children:
+            return [child.invoice for child in children]
         return [self.invoice, ]
 
     def save(self, *args, **kwargs):
         self.set_amount_fields()
         self.set_value_fields('transaction_type')
-        return super(Transaction, self).save(*args, **kwargs)
+        with transaction.atomic():
+            old = None
+            if self.pk:
+                old = Transaction.objects.filter(pk=self.pk).values(
+                    'account', 'parent', 'transaction_date',
+                    'value_gross').first()
+            lock_ledgers(self.account_id, old and old['account'])
+            result = super(Transaction, self).save(*args, **kwargs)
+            self.update_ledger(old)
+            MonthSummary.objects.invalidate(
+                self.transaction_date, old and old['transaction_date'])
+        return result
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            lock_ledgers(self.account_id)
+            return super(Transaction, self).delete(*args, **kwargs)
+
+    def update_ledger(self, old=None):
+        """
+        Updates the running balances after this transaction has been saved.
+
+        Only top-level transactions are part of the ledger of an account.
+        The old contribution of the transaction is removed and the new one is
+        added, so that only the transactions after the changed positions are
+        rewritten.
+
+        :param old: Dict with ``account``, ``parent``, ``transaction_date``
+          and ``value_gross`` of the transaction before it was saved.
+
+        """
+        if old and old['parent'] is None:
+            if self.parent_id is None \
+                    and old['account'] == self.account_id \
+                    and old['transaction_date'] == self.transaction_date \
+                    and old['value_gross'] == self.value_gross:
+                return
+            shift_ledger(old['account'], old['transaction_date'], self.pk,
+                         -old['value_gross'])
+        if self.parent_id is None:
+            MonthlyBalance.objects.create_missing(
+                self.account_id, utils.get_month(self.transaction_date))
+            shift_ledger(self.account_id, self.transaction_date, self.pk,
+                         self.value_gross)
+            previous = Transaction.objects.filter(
+                account=self.account_id, parent__isnull=True).filter(
+                models.Q(transaction_date__lt=self.transaction_date) |
+                models.Q(transaction_date=self.transaction_date,
+                         pk__lt=self.pk))
+            balances = list(previous.order_by(
+                '-transaction_date', '-pk').values_list(
+                    'balance', flat=True)[:1])
+            if balances and balances[0] is not None:
+                balance = balances[0]
+            else:
+                # Without a previous balance (i.e. after bulk inserts, that
+                # haven't been finished yet) we sum up the whole ledger
+                balance = Account.objects.filter(
+                    pk=self.account_id).values_list(
+                        'initial_amount', flat=True).get()
+                if balances:
+                    balance += previous.aggregate(models.Sum(
+                        'value_gross'))['value_gross__sum']
+            self.balance = balance + self.value_gross
+        else:
+            self.balance = None
+        Transaction.objects.filter(pk=self.pk).update(balance=self.balance)
+
+
+#: Number of balances per ``UPDATE`` query of ``write_balances``. Each
+#: balance needs three parameters and SQLite allows 999 per query.
+BALANCE_BATCH_SIZE = 300
+
+
+def write_balances(queryset, balances, batch_size=BALANCE_BATCH_SIZE):
+    """
+    Sets the ``balance`` field of the objects of the given dict of pks.
+
+    The balances are written in batches with one ``UPDATE`` query each.
+
+    """
+    pks = sorted(balances)
+    for index in range(0, len(pks), batch_size):
+        batch = pks[index:index + batch_size]
+        queryset.filter(pk__in=batch).update(balance=models.Case(
+            *[models.When(pk=pk, then=models.Value(balances[pk]))
+              for pk in batch],
+            output_field=models.DecimalField(
+                max_digits=18, decimal_places=2)))
+
+
+def lock_ledgers(*accounts):
+    """
+    Locks the rows of the given accounts until the end of the transaction.
+
+    Changes of the ledger of an account read the previous balance and shift
+    the later ones, so concurrent changes of the same ledger must run one
+    after another.
+
+    """
+    pks = sorted(set(pk for pk in accounts if pk))
+    if pks:
+        list(Account.objects.select_for_update().filter(
+            pk__in=pks).values_list('pk', flat=True))
+
+
+def shift_ledger(account, transaction_date, pk, delta):
+    """
+    Adds ``delta`` to all balances after the given ledger position.
+
+    The ledger of an account is ordered by ``(transaction_date, pk)``. This
+    updates the running balances of the later transactions as well as the
+    total and closed amounts of the account.
+
+    """
+    month = utils.get_month(transaction_date)
+    Account.objects.filter(pk=account).update(
+        total_amount=models.F('total_amount') + delta,
+        closed_amount=models.Case(
+            models.When(closed_month__gte=month,
+                        then=models.F('closed_amount') + delta),
+            default=models.F('closed_amount'),
+        ),
+    )
+    MonthlyBalance.objects.filter(account=account, month__gte=month).update(
+        balance=models.F('balance') + delta)
+    Transaction.objects.filter(
+        account=account, parent__isnull=True).filter(
+        models.Q(transaction_date__gt=transaction_date) |
+        models.Q(transaction_date=transaction_date, pk__gt=pk)).update(
+            balance=models.F('balance') + delta)
+
+
+@receiver(post_delete, sender=Transaction)
+def transaction_post_delete(sender, instance, **kwargs):
+    """Removes a deleted transaction from the ledger and the summaries."""
+    if instance.parent_id is None:
+        shift_ledger(instance.account_id, instance.transaction_date,
+                     instance.pk, -instance.value_gross)
+    MonthSummary.objects.invalidate(instance.transaction_date)
+
+
+@receiver(post_delete, sender=Invoice)
+def invoice_post_delete(sender, instance, **kwargs):
+    """Deletes the summaries, that contain a deleted invoice."""
+    MonthSummary.objects.invalidate(
+        instance.invoice_date, instance.payment_date)
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+def account_post_save(sender, instance, **kwargs):
+    """Deletes all summaries, because they all contain the account."""
+    MonthSummary.objects.invalidate()
+
+
+@receiver(post_save, sender=CurrencyRateHistory)
+@receiver(post_delete, sender=CurrencyRateHistory)
+def currency_rate_history_post_save(sender, instance, **kwargs):
+    """Deletes the summaries, that might use a changed rate."""
+    MonthSummary.objects.invalidate_rates(instance.date)
 
 
 class TransactionResource(resources.ModelResource):
@@ -523,13 +1334,192 @@ class TransactionResource(resources.ModelResource):
         return ''
 
     def dehydrate_balance(self, transaction):  # pragma: nocover
-        account_balance = transaction.account.transactions.filter(
-            models.Q(parent__isnull=True),
-            models.Q(transaction_date__lt=transaction.transaction_date) |
-            (models.Q(transaction_date=transaction.transaction_date,
-                      pk__lte=transaction.pk)),
-        ).aggregate(models.Sum('value_gross'))['value_gross__sum'] or 0
-        return account_balance + transaction.account.initial_amount
+        if transaction.parent_id:
+            # Children are not part of the ledger, they show the balance of
+            # their parent instead
+            return transaction.parent.balance
+        return transaction.balance
 
     def dehydrate_get_transaction_type(self, transaction):  # pragma: nocover
         return transaction.get_transaction_type_display()
+
+
+def get_export_path(instance, filename):
+    """
+    Returns a path with a random folder for the file of an ``ExportJob``.
+
+    The files are served by ``ExportJobDownloadView`` to logged in users.
+    The random folder keeps them from being guessed via the media URL.
+
+    """
+    return 'account_keeping/exports/{0}/{1}'.format(uuid.uuid4().hex, filename)
+
+
+@python_2_unicode_compatible
+class ExportJob(models.Model):
+    """
+    Export of transactions, that runs outside of the web request.
+
+    Jobs are handed to the runner of the ``ACCOUNT_KEEPING_EXPORT_RUNNER``
+    setting. The default runner leaves them in the database, where the
+    ``run_export_jobs`` command picks them up.
+
+    """
+    STATUS_CHOICES = [
+        ('pending', _('pending')),
+        ('running', _('running')),
+        ('done', _('done')),
+        ('failed', _('failed')),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        blank=True, null=True,
+        on_delete=models.SET_NULL,
+        related_name='account_keeping_export_jobs',
+        verbose_name=_('User'),
+    )
+
+    branch = models.ForeignKey(
+        Branch,
+        blank=True, null=True,
+        related_name='export_jobs',
+        verbose_name=_('Branch'),
+    )
+
+    start = models.DateField(
+        verbose_name=_('Start'),
+    )
+
+    end = models.DateField(
+        verbose_name=_('End'),
+    )
+
+    export_format = models.CharField(
+        max_length=8,
+        verbose_name=_('Format'),
+    )
+
+    status = models.CharField(
+        max_length=16,
+        choices=STATUS_CHOICES,
+        default='pending',
+        verbose_name=_('Status'),
+    )
+
+    progress = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_('Exported transactions'),
+    )
+
+    total = models.PositiveIntegerField(
+        blank=True, null=True,
+        verbose_name=_('Total transactions'),
+    )
+
+    file = models.FileField(
+        upload_to=get_export_path,
+        blank=True,
+        verbose_name=_('File'),
+    )
+
+    error = models.TextField(
+        blank=True,
+        verbose_name=_('Error'),
+    )
+
+    creation_date = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name=_('Creation date'),
+    )
+
+    finish_date = models.DateTimeField(
+        blank=True, null=True,
+        verbose_name=_('Finish date'),
+    )
+
+    heartbeat_date = models.DateTimeField(
+        blank=True, null=True,
+        verbose_name=_('Heartbeat date'),
+        help_text=_('Last sign of life of the worker of a running job.'),
+    )
+
+    class Meta:
+        ordering = ['-creation_date', '-pk']
+        verbose_name = _('Export job')
+        verbose_name_plural = _('Export jobs')
+
+    def __str__(self):
+        return '{0} - {1}.{2}'.format(self.start, self.end, self.export_format)
+
+    def get_percentage(self):
+        if self.status == 'done':
+            return 100
+        if not self.total:
+            return 0
+        return min(100, self.progress * 100 // self.total)
+
+
+@python_2_unicode_compatible
+class ImportCheckpoint(models.Model):
+    """
+    Position of an import, so that an aborted import can be resumed.
+
+    Imports commit one batch of rows at a time together with their
+    checkpoint. Running the same import again skips the rows up to the
+    stored position without parsing them.
+
+    """
+    account = models.ForeignKey(
+        Account,
+        related_name='import_checkpoints',
+        verbose_name=_('Account'),
+    )
+
+    importer = models.CharField(
+        max_length=32,
+        verbose_name=_('Importer'),
+    )
+
+    checksum = models.CharField(
+        max_length=64,
+        verbose_name=_('Checksum'),
+        help_text=_('SHA-256 hash of the imported file.'),
+    )
+
+    filename = models.CharField(
+        max_length=512,
+        blank=True,
+        verbose_name=_('Filename'),
+    )
+
+    position = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_('Position'),
+        help_text=_('Number of rows, that have been processed.'),
+    )
+
+    first_date = models.DateField(
+        blank=True, null=True,
+        verbose_name=_('First date'),
+        help_text=_('Earliest date of the rows, that have been imported.'),
+    )
+
+    finished = models.BooleanField(
+        default=False,
+        verbose_name=_('Finished'),
+    )
+
+    update_date = models.DateTimeField(
+        auto_now=True,
+        verbose_name=_('Update date'),
+    )
+
+    class Meta:
+        unique_together = ('account', 'importer', 'checksum')
+        verbose_name = _('Import checkpoint')
+        verbose_name_plural = _('Import checkpoints')
+
+    def __str__(self):
+        return u'{0} ({1}/{2})'.format(
+            self.filename or self.checksum, self.account, self.position)
@@ -0,0 +1,268 @@
+"""Currency conversion rates for the account_keeping app."""
+from collections import OrderedDict
+import decimal
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from currency_history.models import Currency, CurrencyRate, CurrencyRateHistory
+from dateutil import relativedelta
+
+from . import utils
+
+
+class RateCache(object):
+    """
+    Bounded LRU cache for conversion rates, shared by the whole process.
+
+    Keys are ``(from_currency_pk, to_currency_iso_code, month)``, where
+    ``month`` is the first day of a month or ``None`` for the latest rate.
+    Values are tuples of the rate and whether it is a fallback to the latest
+    rate.
+    Local entries expire after ``ACCOUNT_KEEPING_RATE_CACHE_TIMEOUT``
+    seconds. If ``ACCOUNT_KEEPING_RATE_CACHE_BACKEND`` names a Django cache,
+    it is used as a second tier and its generation counter invalidates the
+    local entries of all processes. The counter is read at most every
+    ``ACCOUNT_KEEPING_RATE_CACHE_CHECK_INTERVAL`` seconds, so local hits
+    don't need a request to the backend.
+
+    """
+    generation_key = 'account_keeping_rates_generation'
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = None
+        self._generation_checked = 0
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'ACCOUNT_KEEPING_RATE_CACHE_SIZE', 1024)
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'ACCOUNT_KEEPING_RATE_CACHE_TIMEOUT', 300)
+
+    def get_backend(self):
+        alias = getattr(settings, 'ACCOUNT_KEEPING_RATE_CACHE_BACKEND', None)
+        if alias:
+            return caches[alias]
+        return None
+
+    @property
+    def check_interval(self):
+        return getattr(
+            settings, 'ACCOUNT_KEEPING_RATE_CACHE_CHECK_INTERVAL', 5)
+
+    def get_generation(self, backend):
+        if backend is None:
+            return None
+        if self._generation is not None \
+                and self._generation_checked + self.check_interval > \
+                time.time():
+            return self._generation
+        generation = backend.get(self.generation_key)
+        if generation is None:
+            generation = int(time.time())
+            backend.add(self.generation_key, generation, None)
+            generation = backend.get(self.generation_key, generation)
+        self._generation = generation
+        self._generation_checked = time.time()
+        return generation
+
+    def get(self, key):
+        """Returns the cached rate or ``None``."""
+        backend = self.get_backend()
+        generation = self.get_generation(backend)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                value, entry_generation, expires = entry
+                if entry_generation == generation and expires > time.time():
+                    # Re-insert the entry as the most recently used one
+                    self._entries[key] = entry
+                    return value
+        if backend is None:
+            return None
+        value = backend.get(self.make_backend_key(key, generation))
+        if value is not None:
+            self.set_local(key, value, generation)
+        return value
+
+    def set(self, key, value):
+        backend = self.get_backend()
+        generation = self.get_generation(backend)
+        if backend is not None:
+            backend.set(self.make_backend_key(key, generation), value, None)
+        self.set_local(key, value, generation)
+
+    def set_local(self, key, value, generation):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (
+                value, generation, time.time() + self.timeout)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def make_backend_key(self, key, generation):
+        currency, base_currency, month = key
+        return 'account_keeping_rate:{0}:{1}:{2}:{3}'.format(
+            generation, currency, base_currency,
+            month.strftime('%Y-%m') if month else 'latest')
+
+    def invalidate(self):
+        """Removes all rates from the cache of all processes."""
+        with self._lock:
+            self._entries.clear()
+        # Read the new generation on the next access
+        self._generation = None
+        backend = self.get_backend()
+        if backend is not None:
+            try:
+                backend.incr(self.generation_key)
+            except ValueError:
+                backend.set(self.generation_key, int(time.time()), None)
+
+
+rate_cache = RateCache()
+
+
+@receiver(post_save, sender=Currency)
+@receiver(post_delete, sender=Currency)
+@receiver(post_save, sender=CurrencyRate)
+@receiver(post_delete, sender=CurrencyRate)
+@receiver(post_save, sender=CurrencyRateHistory)
+@receiver(post_delete, sender=CurrencyRateHistory)
+def invalidate_rate_cache(sender, **kwargs):
+    """
+    Invalidates all cached rates when rates or currencies change.
+
+    Rates change at most daily, so we don't need to be more selective. A new
+    rate can also change the fallback of months without a rate.
+
+    """
+    rate_cache.invalidate()
+
+
+class RateResolver(object):
+    """
+    Resolves the rates to convert currencies into one base currency.
+
+    Resolved rates are stored in the process-wide ``rate_cache``. On cache
+    misses, all rates of the given range of months are loaded with one query
+    into a matrix of months and currencies. Just like before, the latest
+    available rate is used for months that don't have a rate. These months
+    are collected in ``fallback_months``. Rates for months outside of the
+    range are loaded on demand, one query per month.
+
+    :param base_currency: ISO-code of the currency to convert into.
+    :param start: Any date of the first month that should be preloaded.
+    :param end: Any date of the last month that should be preloaded.
+
+    """
+    def __init__(self, base_currency, start=None, end=None):
+        self.base_currency = base_currency
+        self.start = start and utils.get_month(start)
+        self.end = end and utils.get_month(end)
+        self._base_currency_pk = None
+        self._latest = None
+        self._months = {}
+        self.fallback_months = set()
+
+    def get_rate(self, currency, month=None):
+        """
+        Returns the rate to convert the given currency into the base currency.
+
+        :param currency: A ``Currency`` object or pk.
+        :param month: Any date of the wanted month. If ``None``, the latest
+          rate is returned.
+
+        """
+        if getattr(currency, 'iso_code', None) == self.base_currency:
+            return decimal.Decimal(1)
+        currency = getattr(currency, 'pk', currency)
+        if month is not None:
+            month = utils.get_month(month)
+        key = (currency, self.base_currency, month)
+        entry = rate_cache.get(key)
+        if entry is None:
+            entry = self._resolve(currency, month)
+            rate_cache.set(key, entry)
+        rate, is_fallback = entry
+        if is_fallback:
+            self.fallback_months.add(month)
+        return rate
+
+    def _resolve(self, currency, month):
+        """Returns a tuple of the rate and whether it is a fallback."""
+        if currency == self.get_base_currency_pk():
+            return decimal.Decimal(1), False
+        if month is not None:
+            if month not in self._months:
+                self._load_months(month)
+            if currency in self._months[month]:
+                return self._months[month][currency], False
+        if self._latest is None:
+            self._load_latest()
+        try:
+            return self._latest[currency], month is not None
+        except KeyError:
+            raise CurrencyRateHistory.DoesNotExist(
+                'There is no rate to convert currency {0} into {1}.'.format(
+                    currency, self.base_currency))
+
+    def get_base_currency_pk(self):
+        if self._base_currency_pk is None:
+            self._base_currency_pk = Currency.objects.filter(
+                iso_code=self.base_currency).values_list(
+                    'pk', flat=True).first()
+        return self._base_currency_pk
+
+    def _load_latest(self):
+        """Loads the latest rate of every currency with one query."""
+        history = CurrencyRateHistory.objects.filter(
+            rate=models.OuterRef('pk')).order_by('-date')
+        rates = CurrencyRate.objects.filter(
+            to_currency__iso_code=self.base_currency,
+        ).annotate(
+            latest_value=models.Subquery(
+                history.values('value')[:1],
+                output_field=models.FloatField()),
+            latest_date=models.Subquery(
+                history.values('date')[:1],
+                output_field=models.DateTimeField()),
+        ).filter(latest_date__isnull=False).order_by('latest_date')
+        self._latest = {}
+        for currency, value in rates.values_list(
+                'from_currency', 'latest_value'):
+            self._latest[currency] = decimal.Decimal(value)
+
+    def _load_months(self, month):
+        """
+        Loads the rates of the preloaded range or of the given month.
+
+        The latest rate of each month wins.
+
+        """
+        if self.start and self.end and self.start <= month <= self.end:
+            start, end = self.start, self.end
+        else:
+            start, end = month, month
+        months = [start]
+        while months[-1] < end:
+            months.append(months[-1] + relativedelta.relativedelta(months=1))
+        for loaded_month in months:
+            self._months[loaded_month] = {}
+        history = CurrencyRateHistory.objects.filter(
+            rate__to_currency__iso_code=self.base_currency,
+            date__gte=start,
+            date__lt=end + relativedelta.relativedelta(months=1),
+        ).order_by('date').values_list('rate__from_currency', 'date', 'value')
+        for currency, date, value in history:
+            self._months[utils.get_month(date)][currency] = \
+                decimal.Decimal(value)
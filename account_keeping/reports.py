@@ -0,0 +1,251 @@
+"""Reports of the account_keeping app."""
+from decimal import Decimal
+
+from django.db.models import F, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils.timezone import now
+
+from dateutil import relativedelta
+
+from . import models
+from . import utils
+from .rates import RateResolver
+
+
+def _add_change(changes, month, currency, value):
+    currencies = changes.setdefault(month, {})
+    currencies[currency] = currencies.get(currency, 0) + value
+
+
+def _convert(amounts, rates, month):
+    return sum(
+        value * rates.get_rate(currency, month)
+        for currency, value in amounts.items() if value)
+
+
+def _round(value):
+    if value is None:
+        return None
+    return Decimal(value).quantize(Decimal('0.01'))
+
+
+def get_outstanding_series(months, rates, branch=None):
+    """
+    Returns the outstanding invoice amounts at the end of the given months.
+
+    An invoice sent in February and paid in May is outstanding in February,
+    March and April. Transactions of invoices, that are not paid yet, reduce
+    the outstanding amount from the month of the transaction on.
+
+    Instead of querying each month, the invoices and partial payments of the
+    whole range are loaded with two grouped queries. Each group opens (and
+    closes) at a certain month, so we can sweep over the months and keep a
+    running amount per currency. This keeps ranges of several years cheap.
+
+    :param months: A list of consecutive months (first day of each month).
+    :param rates: A ``RateResolver`` to convert into the base currency.
+    :param branch: If given, only invoices of this branch are counted.
+
+    Returns a tuple of two dicts, that map each month to the outstanding
+    amount (minus partial payments) and to the partial payments.
+
+    """
+    if not months:
+        return {}, {}
+    start = months[0]
+    end = months[-1] + relativedelta.relativedelta(months=1)
+
+    invoices = models.Invoice.objects.filter(
+        Q(invoice_date__lt=end),
+        Q(payment_date__isnull=True) |
+        Q(payment_date__gte=start + relativedelta.relativedelta(months=1)))
+    # Invoices, that were paid before they were sent, are never outstanding
+    invoices = invoices.exclude(payment_date__lt=F('invoice_date'))
+    if branch:
+        invoices = invoices.filter(branch=branch)
+    # The sqlite backend of Django can't truncate NULL dates, so the payment
+    # date is truncated in Python.
+    invoices = invoices.order_by().annotate(
+        open_month=TruncMonth('invoice_date'),
+    ).values('currency', 'open_month', 'payment_date').annotate(
+        value_sum=Sum('value_gross'))
+    outstanding_changes = {}
+    for row in invoices:
+        close_month = None
+        if row['payment_date'] is not None:
+            close_month = utils.get_month(row['payment_date'])
+            if close_month <= row['open_month']:
+                continue
+        _add_change(outstanding_changes, max(row['open_month'], start),
+                    row['currency'], row['value_sum'])
+        if close_month is not None:
+            _add_change(outstanding_changes, close_month,
+                        row['currency'], -row['value_sum'])
+
+    payments = models.Transaction.objects.filter(
+        invoice__invoice_date__lt=end,
+        transaction_date__lt=end,
+        invoice__payment_date__isnull=True)
+    if branch:
+        payments = payments.filter(
+            Q(invoice__branch=branch) | Q(account__branch=branch))
+    payments = payments.order_by().annotate(
+        invoice_month=TruncMonth('invoice__invoice_date'),
+        payment_month=TruncMonth('transaction_date'),
+    ).values('currency', 'invoice_month', 'payment_month').annotate(
+        value_sum=Sum('value_gross'))
+    payment_changes = {}
+    for row in payments:
+        month = max(row['invoice_month'], row['payment_month'], start)
+        _add_change(
+            payment_changes, month, row['currency'], row['value_sum'])
+
+    outstanding_total = {}
+    partial_payments_total = {}
+    outstanding_amounts = {}
+    payment_amounts = {}
+    for month in months:
+        for amounts, changes in [(outstanding_amounts, outstanding_changes),
+                                 (payment_amounts, payment_changes)]:
+            for currency, value in changes.get(month, {}).items():
+                amounts[currency] = amounts.get(currency, 0) + value
+        partial_payments_total[month] = _convert(
+            payment_amounts, rates, month)
+        outstanding_total[month] = _convert(
+            outstanding_amounts, rates, month) - partial_payments_total[month]
+    return outstanding_total, partial_payments_total
+
+
+def compute_month_summaries(months, rates, branch=None, past_months=None):
+    """
+    Computes the figures of the year overview for the given months.
+
+    Income and expenses are only set for months that have transactions.
+    Outstanding amounts and balances are only computed for past months.
+
+    :param months: A list of consecutive months (first day of each month).
+    :param rates: A ``RateResolver`` to convert into the base currency.
+    :param branch: If given, only data of this branch is counted.
+    :param past_months: The leading months, that have already begun.
+
+    Returns a list of unsaved ``MonthSummary`` objects.
+
+    """
+    if past_months is None:
+        past_months = months
+    start = months[0]
+    end = months[-1] + relativedelta.relativedelta(months=1)
+
+    txns = models.Transaction.objects.filter(
+        parent__isnull=True, transaction_date__gte=start,
+        transaction_date__lt=end)
+    if branch:
+        txns = txns.filter(
+            Q(invoice__branch=branch) | Q(account__branch=branch))
+    txns = txns.order_by().annotate(
+        month=TruncMonth('transaction_date'),
+    ).values('month', 'currency', 'transaction_type').annotate(
+        amount_gross_sum=Sum('amount_gross'))
+    income = {}
+    expenses = {}
+    for row in txns:
+        if row['transaction_type'] == models.Transaction.TRANSACTION_TYPES[
+                'deposit']:
+            totals = income
+        else:
+            totals = expenses
+        totals[row['month']] = totals.get(row['month'], 0) + (
+            row['amount_gross_sum'] * rates.get_rate(
+                row['currency'], row['month']))
+
+    invoices = models.Invoice.objects.filter(
+        invoice_type=models.Invoice.INVOICE_TYPES['deposit'],
+        invoice_date__gte=start, invoice_date__lt=end)
+    if branch:
+        invoices = invoices.filter(branch=branch)
+    invoices = invoices.order_by().annotate(
+        month=TruncMonth('invoice_date'),
+    ).values('month', 'currency').annotate(value_sum=Sum('value_gross'))
+    new = {}
+    for row in invoices:
+        new[row['month']] = new.get(row['month'], 0) + (
+            row['value_sum'] * rates.get_rate(row['currency'], row['month']))
+
+    outstanding = get_outstanding_series(past_months, rates, branch)[0]
+
+    accounts = models.Account.objects.filter(active=True)
+    if branch:
+        accounts = accounts.filter(branch=branch)
+    accounts = list(accounts.select_related('currency'))
+    month_balances = models.MonthlyBalance.objects.get_balances(
+        accounts, past_months)
+    balance = {}
+    for month in past_months:
+        # The snapshots hold the balances at the end of each month
+        balance[month] = 0
+        for account in accounts:
+            account_balance = month_balances[month][account.pk]
+            if not account.currency.iso_code == rates.base_currency:
+                account_balance = account_balance * rates.get_rate(
+                    account.currency, month)
+            balance[month] += account_balance
+
+    return [models.MonthSummary(
+        branch=branch,
+        month=month,
+        base_currency=rates.base_currency,
+        income=_round(income.get(month)),
+        expenses=_round(expenses.get(month)),
+        new=_round(new.get(month, 0)),
+        outstanding=_round(outstanding.get(month)),
+        balance=_round(balance.get(month)),
+        uses_fallback_rate=month in rates.fallback_months,
+    ) for month in months]
+
+
+def get_month_summaries(months, base_currency, branch=None, past_months=None):
+    """
+    Returns a ``MonthSummary`` for each of the given months.
+
+    The summaries of the months before the current month are saved, so that
+    they only need to be computed again after data of their month has
+    changed (see ``MonthSummaryManager.invalidate``). Summaries, that have
+    been invalidated while they were computed, are not saved.
+
+    :param months: A list of consecutive months (first day of each month).
+    :param base_currency: ISO-code of the currency of all figures.
+    :param branch: If given, only data of this branch is counted.
+    :param past_months: The number of leading months, that have already
+      begun. Defaults to all months.
+
+    """
+    if past_months is None:
+        past_months = len(months)
+    summaries = dict((summary.month, summary) for summary in (
+        models.MonthSummary.objects.filter(
+            branch=branch, base_currency=base_currency,
+            month__in=months[:past_months])))
+    missing = [month for month in months if month not in summaries]
+    if missing:
+        version = models.MonthSummary.objects.get_version()
+        current_month = utils.get_month(now())
+        computed_months = months[
+            months.index(missing[0]):months.index(missing[-1]) + 1]
+        rates = RateResolver(
+            base_currency, computed_months[0], computed_months[-1])
+        computed = compute_month_summaries(
+            computed_months, rates, branch, [
+                month for month in computed_months
+                if month in months[:past_months]])
+        new_summaries = []
+        for summary in computed:
+            if summary.month not in missing:
+                continue
+            summaries[summary.month] = summary
+            # Only the summaries of months, that have ended, are saved
+            if summary.month in months[:past_months] \
+                    and summary.month < current_month:
+                new_summaries.append(summary)
+        if new_summaries:
+            models.MonthSummary.objects.save_summaries(new_summaries, version)
+    return [summaries[month] for month in months]
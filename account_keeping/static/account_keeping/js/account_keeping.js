@@ -1,4 +1,23 @@
 $(document).ready(function() {
+    // Load the transactions of account tabs on demand
+    function loadTransactions($tbody, url) {
+        $.get(url, function(html) {
+            $tbody.find('[data-id="load-more"]').remove();
+            $tbody.append(html);
+        });
+    }
+    $('a[data-toggle="tab"]').on('shown.bs.tab', function() {
+        var $tbody = $($(this).attr('href')).find('[data-id="account-transactions"]');
+        if ($tbody.length && !$tbody.data('loaded')) {
+            $tbody.data('loaded', true);
+            loadTransactions($tbody, $tbody.data('url'));
+        }
+    });
+    $(document).on('click', '[data-id="load-more-transactions"]', function(event) {
+        event.preventDefault();
+        loadTransactions($(this).parents('[data-id="account-transactions"]'), $(this).attr('href'));
+    });
+
     // Auto-activate tabs
     if (location.hash !== '' && $('a[href="' + location.hash + '"]').length) $('a[href="' + location.hash + '"]').tab('show');
     $('a[data-toggle="tab"]').click(function() {
@@ -0,0 +1,97 @@
+"""Tests for the exports of the account_keeping app."""
+import datetime
+from decimal import Decimal
+import io
+import tempfile
+import unittest
+
+from django.test import TestCase
+
+from mixer.backend.django import mixer
+from mock import patch
+
+from .. import exports
+from .. import models
+
+
+class WriteCSVTestCase(TestCase):
+    """Tests for the ``write_csv`` function."""
+    def test_function(self):
+        mixer.blend('account_keeping.Transaction', invoice=None,
+                    payee__name=u'B\xe4ckerei M\xfcller',
+                    description=u'Caf\xe9')
+        output = io.BytesIO()
+        exports.write_csv(models.Transaction.objects.all(), output)
+        content = output.getvalue().decode('utf-8')
+        self.assertIn(u'B\xe4ckerei M\xfcller', content)
+        self.assertIn(u'Caf\xe9', content)
+
+
+def read_rows(path):
+    """Returns the rows of the given Parquet file as dicts."""
+    columns = exports.parquet.read_table(path).to_pydict()
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+
+@unittest.skipIf(exports.pyarrow is None, 'pyarrow is not installed')
+class WriteParquetTestCase(TestCase):
+    """Tests for the ``write_parquet`` function."""
+    longMessage = True
+
+    def setUp(self):
+        self.invoice = mixer.blend(
+            'account_keeping.Invoice', invoice_date=datetime.date(2018, 1, 2),
+            payment_date=None, invoice_type='d', vat=19,
+            amount_net=Decimal('100.00'), amount_gross=0, pdf='')
+        self.parent = mixer.blend(
+            'account_keeping.Transaction', transaction_type='d',
+            transaction_date=datetime.date(2018, 2, 3), vat=0, invoice=None,
+            amount_net=Decimal('12.34'), amount_gross=0, parent=None)
+        self.child = mixer.blend(
+            'account_keeping.Transaction', parent=self.parent,
+            transaction_date=datetime.date(2018, 2, 3), invoice=self.invoice)
+        self.parent.refresh_from_db()
+
+    def test_function(self):
+        output = tempfile.NamedTemporaryFile(suffix='.parquet')
+        with self.assertNumQueries(1), \
+                patch.object(exports, 'PARQUET_CHUNK_SIZE', 1):
+            count = exports.write_parquet(
+                exports.get_transactions(
+                    datetime.date(2018, 1, 1), datetime.date(2018, 12, 31)),
+                exports.TRANSACTION_COLUMNS, output.name)
+        self.assertEqual(count, 2)
+        self.assertEqual(
+            exports.parquet.ParquetFile(output.name).num_row_groups, 2,
+            msg='Should write one row group per chunk')
+        table = exports.parquet.read_table(output.name)
+        self.assertEqual(str(table.schema.field('transaction_date').type),
+                         'date32[day]')
+        self.assertEqual(str(table.schema.field('amount_net_cents').type),
+                         'int64')
+        rows = dict((row['id'], row) for row in read_rows(output.name))
+        self.assertEqual(rows[self.parent.pk]['amount_net_cents'], 1234)
+        self.assertEqual(rows[self.parent.pk]['transaction_date'],
+                         datetime.date(2018, 2, 3))
+        self.assertEqual(
+            rows[self.child.pk]['balance_cents'],
+            int(self.parent.balance * 100), msg=(
+                'Children should get the balance of their parent'))
+        self.assertEqual(rows[self.child.pk]['invoice_date'],
+                         datetime.date(2018, 1, 2))
+        self.assertEqual(rows[self.child.pk]['payee'], self.child.payee.name)
+
+        exports.write_parquet(
+            exports.get_invoices(
+                datetime.date(2018, 1, 1), datetime.date(2018, 12, 31)),
+            exports.INVOICE_COLUMNS, output.name)
+        rows = read_rows(output.name)
+        self.assertEqual(rows[0]['amount_gross_cents'], 11900)
+        self.assertIsNone(rows[0]['payment_date'])
+
+        exports.write_parquet(
+            exports.get_invoices(
+                datetime.date(2017, 1, 1), datetime.date(2017, 12, 31)),
+            exports.INVOICE_COLUMNS, output.name)
+        self.assertEqual(exports.parquet.read_table(output.name).num_rows, 0,
+                         msg='Should write an empty file with the schema')
@@ -1,28 +1,143 @@
 """Tests for the freckle API functions of the account_keeping app."""
-import json
-
+from django.core.cache import cache
 from django.test import TestCase
 
 from mixer.backend.django import mixer
-from mock import patch
-from requests import Response
+from mock import Mock, patch
+from requests.exceptions import ConnectionError, ReadTimeout
 
 from .. import freckle_api
 
 
-class GetUnpaidInvoicesWithTransactionsTestCase(TestCase):
-    """Tests for the ``get_unpaid_invoices_with_transactions`` function."""
+class FreckleTestCase(TestCase):
     longMessage = True
 
-    @patch('requests.request')
-    def test_function(self, mock):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+
+class GetUnpaidInvoicesWithTransactionsTestCase(FreckleTestCase):
+    """Tests for the ``get_unpaid_invoices_with_transactions`` function."""
+    def test_function(self):
         invoice = mixer.blend('account_keeping.Invoice')
         mixer.blend('account_keeping.Transaction', invoice=invoice)
-        resp = Response()
-        resp.status_code = 200
-        resp._content = json.dumps([{
-            'reference': invoice.invoice_number,
-        }])
-        mock.return_value = resp
         self.assertEqual(
-            len(freckle_api.get_unpaid_invoices_with_transactions()), 1)
+            freckle_api.get_unpaid_invoices_with_transactions(),
+            {'pending': True}, msg=(
+                'Should not wait for Freckle, if nothing is cached'))
+        with patch.object(freckle_api.FakeFreckleClient, 'invoices', [
+                {'reference': invoice.invoice_number, 'state': 'unpaid'},
+                {'reference': 'unknown', 'state': 'unpaid'},
+                {'reference': invoice.invoice_number, 'state': 'paid'}]):
+            freckle_api.refresh_unpaid_invoices()
+        self.assertEqual(
+            len(freckle_api.get_unpaid_invoices_with_transactions()[
+                'invoices']), 1)
+        self.assertEqual(
+            freckle_api.get_unpaid_invoices_with_transactions(
+                mixer.blend('account_keeping.Branch'))['invoices'], [],
+            msg='Should only return invoices of the given branch')
+
+        numeric = mixer.blend('account_keeping.Invoice', invoice_number='42')
+        mixer.blend('account_keeping.Transaction', invoice=numeric)
+        with patch.object(freckle_api.FakeFreckleClient, 'invoices', [
+                {'reference': 42, 'state': 'unpaid'},
+                {'reference': None, 'state': 'unpaid'}]):
+            freckle_api.refresh_unpaid_invoices()
+        self.assertEqual(
+            freckle_api.get_unpaid_invoices_with_transactions()['invoices'],
+            [{'reference': 42, 'state': 'unpaid'}], msg=(
+                'Should match integer references'))
+
+        with patch.object(freckle_api.FakeFreckleClient, 'fetch_json',
+                          side_effect=ConnectionError):
+            freckle_api.refresh_unpaid_invoices()
+        result = freckle_api.get_unpaid_invoices_with_transactions()
+        self.assertIn('error', result)
+        self.assertEqual(len(result['invoices']), 1, msg=(
+            'Should keep the invoices, if Freckle is not available'))
+
+        for error in (ReadTimeout, ValueError):
+            cache.set(freckle_api.CACHE_KEY, {'invoices': [], 'fetched': 0})
+            with patch.object(freckle_api.FakeFreckleClient, 'fetch_json',
+                              side_effect=error):
+                entry = freckle_api.refresh_unpaid_invoices()
+            self.assertTrue(entry['error'])
+            self.assertEqual(
+                cache.get(freckle_api.CACHE_KEY)['fetched'],
+                entry['fetched'], msg=(
+                    'Should cache the failed attempt on {}'.format(
+                        error.__name__)))
+
+
+class FreckleClientTestCase(FreckleTestCase):
+    """Tests for the ``FreckleClient`` class."""
+    def test_timeout(self):
+        response = Mock(content=b'[]', links={}, **{'json.return_value': []})
+        with self.settings(ACCOUNT_KEEPING_FRECKLE_TIMEOUT=3), patch(
+                'requests.request', return_value=response) as request:
+            self.assertEqual(freckle_api.client.fetch_json('invoices'), [])
+        self.assertEqual(request.call_args[1]['timeout'], 3)
+
+
+class ScheduleRefreshTestCase(FreckleTestCase):
+    """Tests for the ``schedule_refresh`` function."""
+    def test_function(self):
+        self.assertIsNone(freckle_api.schedule_refresh(), msg=(
+            'Should be disabled by the settings'))
+        with self.settings(ACCOUNT_KEEPING_FRECKLE_BACKGROUND_REFRESH=True):
+            cache.add(freckle_api.LOCK_KEY, True)
+            self.assertIsNone(freckle_api.schedule_refresh(), msg=(
+                'Should not refresh twice at the same time'))
+            cache.delete(freckle_api.LOCK_KEY)
+            thread = freckle_api.schedule_refresh()
+            thread.join()
+        self.assertEqual(cache.get(freckle_api.CACHE_KEY)['invoices'], [])
+        self.assertIsNone(cache.get(freckle_api.LOCK_KEY))
+
+        with self.settings(ACCOUNT_KEEPING_FRECKLE_CACHE_TIMEOUT=-1), \
+                patch.object(freckle_api, 'schedule_refresh') as mock:
+            self.assertEqual(
+                freckle_api.get_unpaid_invoices_with_transactions(),
+                {'invoices': []})
+            self.assertEqual(mock.call_count, 1, msg=(
+                'Should serve the stale invoices and refresh them'))
+
+
+class GetInvoiceNumbersWithTransactionsTestCase(TestCase):
+    """Tests for the ``get_invoice_numbers_with_transactions`` function."""
+    longMessage = True
+
+    def test_function(self):
+        invoices = [
+            mixer.blend('account_keeping.Invoice', invoice_number=str(number))
+            for number in range(3)]
+        for invoice in invoices[:2]:
+            mixer.blend('account_keeping.Transaction', invoice=invoice)
+        mixer.blend('account_keeping.Transaction', invoice=invoices[0])
+        with self.assertNumQueries(2), \
+                patch.object(freckle_api, 'CHUNK_SIZE', 2):
+            self.assertEqual(
+                freckle_api.get_invoice_numbers_with_transactions(
+                    ['0', '1', '2', 'foo', None]), set(['0', '1']))
+        self.assertEqual(
+            freckle_api.get_invoice_numbers_with_transactions(
+                ['0', '1'], invoices[1].branch), set(['1']))
+        mixer.blend('account_keeping.Transaction', invoice=mixer.blend(
+            'account_keeping.Invoice', invoice_number='INV-1'))
+        self.assertEqual(
+            freckle_api.get_invoice_numbers_with_transactions(
+                [1, 'INV-1', 'inv-1']),
+            set(['1', 'INV-1']), msg=(
+                'Should compare the invoice numbers as text, but exactly'))
+
+        # A database with a case-insensitive collation returns the booked
+        # invoice number for another case
+        with patch.object(freckle_api.models.Invoice.objects,
+                          'filter') as mock:
+            mock.return_value.order_by.return_value.values_list.return_value \
+                .distinct.return_value = ['INV-2']
+            self.assertEqual(
+                freckle_api.get_invoice_numbers_with_transactions(['inv-2']),
+                set(['inv-2']))
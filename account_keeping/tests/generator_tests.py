@@ -0,0 +1,77 @@
+"""Tests for the generator and the benchmarks of the account_keeping app."""
+import datetime
+import json
+
+from django.test import TestCase
+
+from .. import benchmarks
+from .. import generator
+from .. import models
+
+COUNTS = {
+    'months': 2,
+    'payees': 5,
+    'categories': 3,
+    'invoices': 5,
+    'transactions': 3,
+    'splits': 1,
+}
+
+
+class GenerateLedgerTestCase(TestCase):
+    """Tests for the ``generate_ledger`` function."""
+    longMessage = True
+
+    def get_signature(self, prefix):
+        return list(models.Invoice.objects.filter(
+            branch__slug__startswith=prefix).order_by('pk').values_list(
+                'invoice_date', 'invoice_type', 'amount_gross', 'currency',
+                'payment_date'))
+
+    def test_function(self):
+        start = datetime.date(2018, 1, 1)
+        result = generator.generate_ledger(start=start, **COUNTS)
+        self.assertEqual(result['invoices'], 10)
+        self.assertEqual(
+            models.Transaction.objects.count(), result['transactions'])
+        self.assertTrue(models.Transaction.objects.filter(
+            parent__isnull=False).exists(), msg=(
+                'Should create split transactions'))
+        for parent in models.Transaction.objects.filter(
+                children__isnull=False).distinct():
+            self.assertEqual(parent.amount_gross, sum(
+                child.amount_gross for child in parent.children.all()))
+        self.assertFalse(models.Transaction.objects.filter(
+            transaction_date__gte=datetime.date(2018, 3, 1)).exists())
+        for account in models.Account.objects.all():
+            self.assertEqual(account.update_balances(commit=False), 0, msg=(
+                'Should compute the balances of the bulk inserts'))
+
+        generator.generate_ledger(start=start, prefix='other', **COUNTS)
+        self.assertEqual(
+            self.get_signature('synthetic'), self.get_signature('other'),
+            msg='Should create the same ledger with the same seed')
+        generator.generate_ledger(
+            seed=1, start=start, prefix='seed', **COUNTS)
+        self.assertNotEqual(
+            self.get_signature('synthetic'), self.get_signature('seed'))
+
+        with self.assertRaises(ValueError):
+            generator.generate_ledger('foo')
+
+
+class BenchmarkSuiteTestCase(TestCase):
+    """Tests for the ``BenchmarkSuite`` class."""
+    longMessage = True
+
+    def test_run(self):
+        report = benchmarks.BenchmarkSuite(
+            [dict(COUNTS, months=1)], repeat=2).run()
+        json.dumps(report)
+        results = report['scales']['custom-0']['benchmarks']
+        self.assertEqual(list(results), benchmarks.BenchmarkSuite.benchmarks)
+        for name, result in results.items():
+            self.assertEqual(len(result['seconds']), 2)
+            self.assertIn(result['status'], [200, 'ok'], msg=name)
+        self.assertFalse(models.Transaction.objects.exists(), msg=(
+            'Should roll back the ledger'))
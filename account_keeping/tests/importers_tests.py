@@ -0,0 +1,300 @@
+"""Tests for the importers of the account_keeping app."""
+from decimal import Decimal
+import datetime
+import io
+import os
+import tempfile
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from mixer.backend.django import mixer
+from mock import patch
+
+from .. import importers
+from .. import models
+from ..importers import ofx
+from ..importers.backend import bulk_create_with_pks
+
+OFX = u"""OFXHEADER:100
+DATA:OFXSGML
+VERSION:102
+
+<OFX>
+<BANKMSGSRSV1><STMTTRNRS><STMTRS>
+<CURDEF>EUR
+<BANKTRANLIST>
+<STMTTRN>
+<TRNTYPE>DEBIT
+<DTPOSTED>20180105120000[+1:CET]
+<TRNAMT>-12.50
+<FITID>A1
+<NAME>Coffee &amp; Cake
+<MEMO>Breakfast
+</STMTTRN>
+<STMTTRN>
+<TRNTYPE>CREDIT
+<DTPOSTED>20180110
+<TRNAMT>1000.00
+<FITID>A2
+<NAME>ACME Corp.
+</STMTTRN>
+</BANKTRANLIST>
+</STMTRS></STMTTRNRS></BANKMSGSRSV1>
+</OFX>
+"""
+
+CAMT = u"""<?xml version="1.0" encoding="UTF-8"?>
+<Document xmlns="urn:iso:std:iso:20022:tech:xsd:camt.053.001.02">
+<BkToCstmrStmt><Stmt>
+<Ntry>
+  <Amt Ccy="EUR">99.90</Amt>
+  <CdtDbtInd>DBIT</CdtDbtInd>
+  <BookgDt><Dt>2018-02-01</Dt></BookgDt>
+  <AcctSvcrRef>REF-1</AcctSvcrRef>
+  <NtryDtls><TxDtls>
+    <RltdPties><Cdtr><Nm>Landlord</Nm></Cdtr></RltdPties>
+    <RmtInf><Ustrd>Rent</Ustrd><Ustrd>February</Ustrd></RmtInf>
+  </TxDtls></NtryDtls>
+</Ntry>
+<Ntry>
+  <Amt Ccy="EUR">20.00</Amt>
+  <CdtDbtInd>DBIT</CdtDbtInd>
+  <RvslInd>true</RvslInd>
+  <BookgDt><DtTm>2018-02-03T10:00:00</DtTm></BookgDt>
+  <AddtlNtryInf>Reversal</AddtlNtryInf>
+</Ntry>
+</Stmt></BkToCstmrStmt>
+</Document>
+"""
+
+MT940 = u""":20:STARTUMS
+:25:10020030/1234567
+:28C:0
+:60F:C180301EUR1000,00
+:61:1803050305DR45,10NMSCNONREF
+:86:106?00KARTENZAHLUNG?20Groceries?21 March?32Supermarket
+:61:1803060306CR1500,00NTRFINV-42//BANKREF
+:86:Salary March
+:62F:C180306EUR2454,90
+-
+"""
+
+CSV = u"""Datum;Empf\xe4nger;Betrag
+05.04.2018;B\xe4ckerei;-1.234,50
+06.04.2018;Customer;10,00
+"""
+
+
+class BulkCreateWithPksTestCase(TestCase):
+    """Tests for the ``bulk_create_with_pks`` function."""
+    longMessage = True
+
+    def test_function(self):
+        payees = bulk_create_with_pks(models.Payee, [
+            models.Payee(name='Foo'), models.Payee(name='Bar')])
+        for payee in payees:
+            self.assertEqual(models.Payee.objects.get(pk=payee.pk).name,
+                             payee.name)
+
+    def test_concurrent_insert(self):
+        manager = models.Payee.objects
+        bulk_create = manager.bulk_create
+
+        def concurrent_bulk_create(objects):
+            models.Payee.objects.create(name='Concurrent')
+            return bulk_create(objects)
+
+        with patch.object(manager, 'bulk_create', concurrent_bulk_create):
+            payees = bulk_create_with_pks(models.Payee, [
+                models.Payee(name='Foo'), models.Payee(name='Bar')])
+        for payee in payees:
+            self.assertEqual(
+                models.Payee.objects.get(pk=payee.pk).name, payee.name, msg=(
+                    'Interleaved primary keys should not be assigned'))
+        self.assertEqual(models.Payee.objects.count(), 2, msg=(
+            'The bulk insert should have been rolled back'))
+
+
+class ImporterTestCase(TestCase):
+    longMessage = True
+
+    def setUp(self):
+        self.eur = mixer.blend('currency_history.Currency', iso_code='EUR')
+        self.account = mixer.blend('account_keeping.Account',
+                                   currency=self.eur, initial_amount=0)
+
+    def get_file(self, content):
+        file_ = tempfile.NamedTemporaryFile(delete=False)
+        file_.write(content.encode('utf-8'))
+        file_.close()
+        self.addCleanup(os.remove, file_.name)
+        return file_.name
+
+    def get_rows(self, importer, path):
+        with importer.open(path) as file_:
+            return [importer.parse_record(record)
+                    for record in importer.iter_records(file_)]
+
+
+class ImportFileTestCase(ImporterTestCase):
+    """Tests for the ``import_file`` function."""
+    def test_aborted_before_finish(self):
+        path = self.get_file(OFX)
+        importer = importers.get_importer('ofx')
+        with patch('account_keeping.importers.backend.BatchWriter.finish',
+                   side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                importers.import_file(importer, path, self.account)
+        checkpoint = models.ImportCheckpoint.objects.get()
+        self.assertEqual(checkpoint.first_date, datetime.date(2018, 1, 5),
+                         msg='Should store the first date of each batch')
+        self.assertFalse(checkpoint.finished)
+        mixer.blend('account_keeping.MonthSummary',
+                    month=datetime.date(2018, 1, 1))
+
+        self.assertEqual(importers.import_file(importer, path, self.account),
+                         (2, 0))
+        self.assertEqual(models.Transaction.objects.order_by(
+            'transaction_date').last().balance, Decimal('987.50'), msg=(
+                'Should finish an aborted import, even without new rows'))
+        self.assertFalse(models.MonthSummary.objects.exists())
+        self.assertTrue(models.ImportCheckpoint.objects.get().finished)
+
+    def test_summaries(self):
+        path = self.get_file(
+            u'05/03/2018,Bakery,Withdrawal,1.50,Food,,,Bread\n')
+        mixer.blend('account_keeping.MonthSummary',
+                    month=datetime.date(2018, 2, 1))
+        mixer.blend('account_keeping.MonthSummary',
+                    month=datetime.date(2018, 3, 1))
+        importers.import_file(importers.get_importer('mmex'), path,
+                              self.account)
+        self.assertEqual(list(models.MonthSummary.objects.values_list(
+            'month', flat=True)), [datetime.date(2018, 2, 1)], msg=(
+                'Should only invalidate the summaries from the first'
+                ' transaction date on'))
+
+    def test_queries(self):
+        def count_queries(rows):
+            account = mixer.blend('account_keeping.Account',
+                                  currency=self.eur, initial_amount=0)
+            path = self.get_file(u''.join(
+                u'{0:02d}/01/2018,Bakery,Withdrawal,1.50,Food,,,Row {1}\n'
+                .format(index % 28 + 1, index) for index in range(rows)))
+            with CaptureQueriesContext(connection) as queries:
+                importers.import_file(importers.get_importer('mmex'), path,
+                                      account, batch_size=10)
+            return len(queries)
+
+        count_queries(10)
+        per_batch = count_queries(40) - count_queries(30)
+        self.assertLessEqual(per_batch, 15)
+        self.assertEqual(count_queries(90) - count_queries(30),
+                         6 * per_batch, msg=(
+                             'The number of queries should only grow with'
+                             ' the number of batches'))
+
+
+class RegistryTestCase(ImporterTestCase):
+    """Tests for the registry of the importers."""
+    def test_get_importer(self):
+        self.assertEqual(
+            list(importers.get_importers()),
+            ['camt', 'csv', 'mmex', 'mt940', 'ofx'])
+        self.assertIsInstance(importers.get_importer('ofx'),
+                              ofx.OFXImporter)
+        with self.assertRaises(ValueError):
+            importers.get_importer('foo')
+
+
+class OFXImporterTestCase(ImporterTestCase):
+    """Tests for the ``OFXImporter`` class."""
+    def test_importer(self):
+        path = self.get_file(OFX)
+        tags = list(ofx.iter_tags(io.StringIO(OFX), chunk_size=7))
+        self.assertIn(('NAME', 'Coffee & Cake'), tags, msg=(
+            'Should join tags, that are split between chunks'))
+        rows = self.get_rows(importers.get_importer('ofx'), path)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['transaction_date'],
+                         datetime.date(2018, 1, 5))
+        self.assertEqual(rows[0]['transaction_type'], 'w')
+        self.assertEqual(rows[0]['amount'], Decimal('12.50'))
+        self.assertEqual(rows[0]['currency'], 'EUR')
+        self.assertEqual(rows[1]['payee'], 'ACME Corp.')
+
+        self.assertEqual(importers.import_file(
+            importers.get_importer('ofx'), path, self.account), (2, 2))
+        self.assertEqual(importers.import_file(
+            importers.get_importer('ofx'), self.get_file(OFX.replace(
+                '<MEMO>Breakfast\n', '')), self.account), (2, 0), msg=(
+            'Should identify the transactions by their FITID'))
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.total_amount, Decimal('987.50'))
+        self.assertEqual(models.Transaction.objects.filter(
+            category__name='Uncategorized').count(), 2)
+
+
+class CAMTImporterTestCase(ImporterTestCase):
+    """Tests for the ``CAMTImporter`` class."""
+    def test_importer(self):
+        rows = self.get_rows(importers.get_importer('camt'),
+                             self.get_file(CAMT))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['transaction_type'], 'w')
+        self.assertEqual(rows[0]['payee'], 'Landlord')
+        self.assertEqual(rows[0]['description'], 'Rent February')
+        self.assertEqual(rows[1]['transaction_date'],
+                         datetime.date(2018, 2, 3))
+        self.assertEqual(rows[1]['transaction_type'], 'd', msg=(
+            'Reversed debits should be deposits'))
+        self.assertEqual(rows[1]['description'], 'Reversal')
+
+
+class MT940ImporterTestCase(ImporterTestCase):
+    """Tests for the ``MT940Importer`` class."""
+    def test_importer(self):
+        rows = self.get_rows(importers.get_importer('mt940'),
+                             self.get_file(MT940))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['transaction_date'],
+                         datetime.date(2018, 3, 5))
+        self.assertEqual(rows[0]['transaction_type'], 'w')
+        self.assertEqual(rows[0]['amount'], Decimal('45.10'))
+        self.assertEqual(rows[0]['payee'], 'Supermarket')
+        self.assertEqual(rows[0]['description'], 'Groceries March')
+        self.assertEqual(rows[0]['invoice_number'], '')
+        self.assertEqual(rows[0]['currency'], 'EUR')
+        self.assertEqual(rows[1]['transaction_type'], 'd')
+        self.assertEqual(rows[1]['invoice_number'], 'INV-42')
+        self.assertEqual(rows[1]['description'], 'Salary March')
+
+
+class CSVImporterTestCase(ImporterTestCase):
+    """Tests for the ``CSVImporter`` class."""
+    def test_importer(self):
+        profile = {
+            'delimiter': ';',
+            'header': True,
+            'date_format': '%d.%m.%Y',
+            'decimal_separator': ',',
+            'thousands_separator': '.',
+            'columns': {
+                'transaction_date': 'Datum',
+                'payee': u'Empf\xe4nger',
+                'amount': 'Betrag',
+            },
+        }
+        with self.settings(ACCOUNT_KEEPING_CSV_PROFILES={'bank': profile}):
+            importer = importers.get_importer('csv', profile='bank')
+        rows = self.get_rows(importer, self.get_file(CSV))
+        self.assertEqual(rows[0]['amount'], Decimal('1234.50'))
+        self.assertEqual(rows[0]['payee'], u'B\xe4ckerei', msg=(
+            'Should read non-ASCII characters'))
+        self.assertEqual(rows[0]['transaction_type'], 'w')
+        self.assertEqual(rows[1]['transaction_date'],
+                         datetime.date(2018, 4, 6))
+        with self.assertRaises(ValueError):
+            importers.get_importer('csv', profile='foo')
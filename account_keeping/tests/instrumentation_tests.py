@@ -0,0 +1,78 @@
+"""Tests for the instrumentation of the account_keeping app."""
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test import Client, TestCase
+from django.utils.six import StringIO
+
+from mixer.backend.django import mixer
+from mock import patch
+
+from .. import instrumentation
+
+
+class InstrumentationMiddlewareTestCase(TestCase):
+    """Tests for the ``InstrumentationMiddleware`` class."""
+    longMessage = True
+
+    def setUp(self):
+        instrumentation.reset_stats()
+        self.addCleanup(instrumentation.reset_stats)
+        self.addCleanup(cache.clear)
+        self.user = mixer.blend('auth.User', is_superuser=True)
+        self.client.force_login(self.user)
+        mixer.blend('account_keeping.Payee')
+
+    def test_middleware(self):
+        self.client.get(reverse('account_keeping_payees'))
+        self.assertEqual(instrumentation.get_stats(), {}, msg=(
+            'Should be opt-in'))
+
+        with self.settings(MIDDLEWARE_CLASSES=settings.MIDDLEWARE_CLASSES + [
+                'account_keeping.instrumentation.InstrumentationMiddleware',
+        ]), patch.object(instrumentation.logger, 'info') as log:
+            # A new client, that loads the middleware of these settings
+            client = Client()
+            client.force_login(self.user)
+            resp = client.get(reverse('account_keeping_payees'))
+            client.get(reverse('account_keeping_payees'))
+            self.assertNotIn(
+                'Server-Timing', client.get('/admin/login/'),
+                msg='Should only instrument account_keeping views')
+        self.assertIn('db;dur=', resp['Server-Timing'])
+        self.assertIn('template;dur=', resp['Server-Timing'])
+        self.assertEqual(log.call_count, 2)
+        self.assertEqual(log.call_args[0][1:3], ('PayeeListView', 'GET'))
+        stats = instrumentation.get_stats()
+        self.assertEqual(list(stats), ['PayeeListView'])
+        self.assertEqual(stats['PayeeListView']['count'], 2)
+        self.assertGreater(stats['PayeeListView']['queries'], 0)
+        self.assertEqual(sum(stats['PayeeListView']['buckets']), 2)
+
+        instrumentation.histogram.flush()
+        self.assertEqual(instrumentation.histogram.get_stats(), {})
+        self.assertEqual(
+            instrumentation.get_stats()['PayeeListView']['count'], 2, msg=(
+                'Should read the flushed numbers from the cache'))
+
+    def test_get_percentile(self):
+        self.assertEqual(instrumentation.get_percentile(
+            [1, 0, 8, 1, 0, 0, 0, 0, 0, 0, 0], 0.95), 100)
+        self.assertIsNone(instrumentation.get_percentile(
+            [0] * 10 + [1], 0.95))
+
+    def test_request_stats_command(self):
+        instrumentation.histogram.add('MonthView', {
+            'queries': 3, 'db': 1.5, 'template': 2, 'python': 4,
+            'total': 7.5})
+        out = StringIO()
+        call_command('request_stats', stdout=out)
+        self.assertIn('MonthView', out.getvalue())
+        out = StringIO()
+        call_command('request_stats', json=True, reset=True, stdout=out)
+        self.assertEqual(
+            json.loads(out.getvalue())['views']['MonthView']['buckets'][0], 1)
+        self.assertEqual(instrumentation.get_stats(), {})
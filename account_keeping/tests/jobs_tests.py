@@ -0,0 +1,81 @@
+"""Tests for the background jobs of the account_keeping app."""
+from datetime import date, timedelta
+import shutil
+import tempfile
+
+from django.test import TestCase
+from django.utils.timezone import now
+
+from mixer.backend.django import mixer
+from mock import patch
+
+from .. import jobs
+from .. import models
+
+
+class FailStaleJobsTestCase(TestCase):
+    """Tests for the ``fail_stale_jobs`` function."""
+    longMessage = True
+
+    def test_function(self):
+        stale = mixer.blend('account_keeping.ExportJob', file='',
+                            status='running',
+                            heartbeat_date=now() - timedelta(seconds=601))
+        alive = mixer.blend('account_keeping.ExportJob', file='',
+                            status='running',
+                            heartbeat_date=now() - timedelta(seconds=10))
+        pending = mixer.blend('account_keeping.ExportJob', file='',
+                              status='pending')
+        self.assertEqual(jobs.fail_stale_jobs(), 1)
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, 'failed')
+        self.assertTrue(stale.error)
+        self.assertIsNotNone(stale.finish_date)
+        self.assertEqual(models.ExportJob.objects.get(pk=alive.pk).status,
+                         'running', msg='Jobs with a heartbeat should run on')
+        self.assertEqual(models.ExportJob.objects.get(pk=pending.pk).status,
+                         'pending')
+        with self.settings(ACCOUNT_KEEPING_EXPORT_JOB_TIMEOUT=5):
+            self.assertEqual(jobs.claim_next_job(), pending)
+        self.assertEqual(models.ExportJob.objects.get(pk=alive.pk).status,
+                         'failed', msg=(
+                             'Claiming a job should fail stale jobs first'))
+
+
+class RunExportJobTestCase(TestCase):
+    """Tests for the ``run_export_job`` function."""
+    longMessage = True
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        mixer.blend('account_keeping.Transaction',
+                    transaction_date=date(2018, 2, 3))
+
+    def tearDown(self):
+        shutil.rmtree(self.media_root)
+
+    def test_function(self):
+        for export_format in ['csv', 'xlsx', 'xls']:
+            job = mixer.blend('account_keeping.ExportJob', file='', branch=None,
+                              start=date(2018, 1, 1), end=date(2018, 12, 31),
+                              export_format=export_format, status='pending')
+            with self.settings(MEDIA_ROOT=self.media_root):
+                self.assertEqual(jobs.claim_next_job(), job)
+                self.assertIsNone(jobs.claim_next_job(), msg=(
+                    'Running jobs should not be claimed again'))
+                jobs.run_export_job(job)
+                job.refresh_from_db()
+                self.assertEqual(job.status, 'done', msg=job.error)
+                self.assertEqual((job.progress, job.total), (1, 1))
+                self.assertTrue(job.file.size)
+
+    def test_failure(self):
+        job = mixer.blend('account_keeping.ExportJob', file='', branch=None,
+                          start=date(2018, 1, 1), end=date(2018, 12, 31),
+                          export_format='xlsx')
+        with self.settings(MEDIA_ROOT='/dev/null/foo'), \
+                patch.object(jobs, 'logger') as logger:
+            jobs.run_export_job(job)
+        self.assertEqual(models.ExportJob.objects.get().status, 'failed')
+        self.assertEqual(logger.exception.call_count, 1, msg=(
+            'Should log the failure'))
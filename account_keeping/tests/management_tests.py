@@ -1,31 +1,251 @@
 """Tests for the management commands of the ``account_keeping`` app."""
 from datetime import date
+from decimal import Decimal
 from os import path
+import csv
+import hashlib
+import os
+import shutil
+import tarfile
+import tempfile
 
+from django.core.files.base import ContentFile
 from django.core.management import call_command, CommandError
 from django.test import TestCase
+from django.utils.six import StringIO
 
 from mixer.backend.django import mixer
 
+from .. import exports
+from .. import models
+
 
 class CommandTestCase(TestCase):
+    def test_check_balances(self):
+        transaction = mixer.blend('account_keeping.Transaction')
+        models.Account.objects.update(total_amount=0)
+        call_command('check_balances')
+        call_command('check_balances', account=transaction.account.slug,
+                     repair=True)
+        transaction.account.refresh_from_db()
+        self.assertEqual(transaction.account.total_amount,
+                         transaction.value_gross)
+
     def test_collect_invoices(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        output = tempfile.mkdtemp(dir=media_root)
+        transaction = mixer.blend('account_keeping.Transaction',
+                                  transaction_date=date.today())
+        with self.settings(MEDIA_ROOT=media_root):
+            for content in [b'foo', b'bar']:
+                invoice = mixer.blend('account_keeping.Invoice', pdf='')
+                invoice.pdf.save('invoice.pdf', ContentFile(content))
+                mixer.blend('account_keeping.Transaction', parent=transaction,
+                            invoice=invoice)
+            mixer.blend('account_keeping.Transaction',
+                        transaction_date=date.today(),
+                        account=transaction.account)
+            kwargs = {
+                'account': transaction.account.slug,
+                'start_date': date.today().strftime('%Y-%m-%d'),
+                'end_date': date.today().strftime('%Y-%m-%d'),
+                'stdout': StringIO(),
+            }
+            call_command('collect_invoices', output=output, workers=2,
+                         **kwargs)
+            self.assertEqual(sorted(os.listdir(output)), [
+                '0001.pdf', '0002.pdf', 'manifest.csv'])
+            with open(path.join(output, 'manifest.csv')) as manifest:
+                rows = list(csv.reader(manifest))
+            self.assertEqual(rows[0][4], 'sha256')
+            self.assertEqual(len(rows), 3)
+            self.assertIn(rows[1][4], [
+                hashlib.sha256(b'foo').hexdigest(),
+                hashlib.sha256(b'bar').hexdigest()])
+            self.assertEqual(rows[1][5], '3')
+
+            tarball = path.join(output, 'invoices.tar.gz')
+            call_command('collect_invoices', tar=tarball, **kwargs)
+            with tarfile.open(tarball) as tar:
+                self.assertEqual(tar.getnames(), [
+                    '0001.pdf', '0002.pdf', 'manifest.csv'])
+                self.assertEqual(
+                    tar.extractfile('manifest.csv').read().decode('utf-8'),
+                    ''.join(','.join(row) + '\r\n' for row in rows))
+            with self.assertRaises(CommandError):
+                call_command('collect_invoices', **kwargs)
+
+    def test_collect_invoices_incremental(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        output = tempfile.mkdtemp(dir=media_root)
         transaction = mixer.blend('account_keeping.Transaction',
                                   transaction_date=date.today())
-        mixer.blend('account_keeping.Transaction', parent=transaction)
+        kwargs = {
+            'account': transaction.account.slug,
+            'start_date': date.today().strftime('%Y-%m-%d'),
+            'end_date': date.today().strftime('%Y-%m-%d'),
+            'output': output,
+            'incremental': True,
+            'workers': 2,
+        }
+        with self.settings(MEDIA_ROOT=media_root):
+            invoices = []
+            for content in [b'foo', b'foo', b'bar']:
+                invoice = mixer.blend('account_keeping.Invoice', pdf='')
+                invoice.pdf.save('invoice.pdf', ContentFile(content))
+                invoices.append(invoice)
+            for invoice in invoices + [invoices[0]]:
+                mixer.blend('account_keeping.Transaction', parent=transaction,
+                            invoice=invoice)
+            stdout = StringIO()
+            call_command('collect_invoices', stdout=stdout, **kwargs)
+            self.assertIn('3 PDFs read, 4 files updated', stdout.getvalue(),
+                          msg='Should read each PDF once')
+            inodes = [os.stat(path.join(output, '000{0}.pdf'.format(
+                number))).st_ino for number in range(1, 5)]
+            self.assertEqual(len(set(inodes)), 2, msg=(
+                'Should hardlink files with the same content'))
+
+            stdout = StringIO()
+            call_command('collect_invoices', stdout=stdout, **kwargs)
+            self.assertIn('0 PDFs read, 0 files updated', stdout.getvalue(),
+                          msg='Should skip unchanged PDFs')
+
+            with open(invoices[2].pdf.path, 'wb') as pdf:
+                pdf.write(b'changed')
+            os.utime(invoices[2].pdf.path, (0, 0))
+            models.Transaction.objects.filter(invoice=invoices[1]).delete()
+            stdout = StringIO()
+            call_command('collect_invoices', stdout=stdout, **kwargs)
+            self.assertIn('1 PDFs read', stdout.getvalue())
+            self.assertEqual(sorted(os.listdir(output)), [
+                '.invoices', '0001.pdf', '0002.pdf', '0003.pdf',
+                'manifest.csv'], msg='Should remove files of old numbers')
+            with self.assertRaises(CommandError):
+                call_command('collect_invoices', tar='foo.tar', **kwargs)
+
+    def test_export_parquet(self):
+        if exports.pyarrow is None:  # pragma: nocover
+            with self.assertRaises(CommandError):
+                call_command('export_parquet')
+            return
         mixer.blend('account_keeping.Transaction',
-                    transaction_date=date.today(), account=transaction.account)
-        call_command('collect_invoices', account=transaction.account.slug,
-                     start_date=date.today().strftime('%Y-%m-%d'),
-                     end_date=date.today().strftime('%Y-%m-%d'),
-                     output='./foo')
+                    transaction_date=date.today())
+        output = tempfile.mkdtemp()
+        try:
+            call_command('export_parquet', output=output, stdout=StringIO())
+            self.assertEqual(exports.parquet.read_table(
+                path.join(output, 'transactions.parquet')).num_rows, 1)
+            self.assertTrue(path.exists(path.join(
+                output, 'invoices.parquet')))
+        finally:
+            shutil.rmtree(output)
+
+    def test_refresh_freckle_invoices(self):
+        out = StringIO()
+        call_command('refresh_freckle_invoices', stdout=out)
+        self.assertIn('0 unpaid invoices fetched', out.getvalue())
+
+    def test_generate_ledger(self):
+        out = StringIO()
+        call_command('generate_ledger', start='2018-01', months=1,
+                     invoices=2, transactions=2, stdout=out)
+        self.assertIn('invoices: 2', out.getvalue())
+        self.assertTrue(models.Branch.objects.filter(
+            slug='synthetic-branch-0').exists())
+
+    def test_run_benchmarks(self):
+        with self.assertRaises(CommandError):
+            call_command('run_benchmarks', scales='foo')
+
+    def test_run_export_jobs(self):
+        job = mixer.blend('account_keeping.ExportJob', file='', branch=None,
+                          export_format='csv', status='done')
+        call_command('run_export_jobs', once=True)
+        self.assertEqual(models.ExportJob.objects.get().status, job.status)
 
     def test_importer_mmex(self):
         currency = mixer.blend('currency_history.Currency')
-        call_command('importer_mmex',
-                     account=mixer.blend('account_keeping.Account').slug,
-                     currency=currency.iso_code,
+        account = mixer.blend('account_keeping.Account', initial_amount=0)
+        mixer.blend('account_keeping.Payee', name='Landlord')
+        call_command('importer_mmex', account=account.slug,
+                     currency=currency.iso_code, batch_size=4, progress=5,
+                     stdout=StringIO(),
                      filepath=path.abspath(path.join(path.dirname(
                          path.dirname(__file__)), 'tests', 'test_file.csv')))
+        self.assertEqual(models.Transaction.objects.count(), 6)
+        self.assertEqual(models.Invoice.objects.count(), 6)
+        self.assertEqual(models.Payee.objects.filter(
+            name='Landlord').count(), 1, msg='Should reuse existing payees')
+        self.assertEqual(models.Category.objects.count(), 4)
+        account.refresh_from_db()
+        self.assertEqual(account.total_amount, Decimal('615.30'))
+        self.assertEqual(models.Transaction.objects.order_by(
+            'transaction_date', 'pk').last().balance, Decimal('615.30'),
+            msg='Should compute the running balances')
+        invoice = models.Invoice.objects.get(transactions__description=(
+            'January rent'))
+        self.assertEqual(invoice.value_gross, -1200, msg=(
+            'Should link each transaction to its invoice'))
         with self.assertRaises(CommandError):
             call_command('importer_mmex', currency='FOO')
+
+    def test_import_statement(self):
+        account = mixer.blend('account_keeping.Account', initial_amount=0)
+        filepath = path.abspath(path.join(path.dirname(
+            path.dirname(__file__)), 'tests', 'test_file.csv'))
+        call_command('import_statement', importer='mmex', filepath=filepath,
+                     account=account.slug, stdout=StringIO(), workers=2,
+                     batch_size=2)
+        self.assertEqual(models.Transaction.objects.filter(
+            currency=account.currency).count(), 6, msg=(
+                'Should use the currency of the account by default'))
+        self.assertEqual(list(models.Transaction.objects.order_by(
+            'pk').values_list('description', flat=True))[:2], [
+                'January rent', 'Invoice 2017-001'], msg=(
+                    'Should keep the order of the rows with several workers'))
+        with self.assertRaises(CommandError):
+            call_command('import_statement', importer='foo',
+                         filepath=filepath, account=account.slug)
+        with self.assertRaises(CommandError):
+            call_command('import_statement', importer='mmex',
+                         filepath=filepath, account='foo')
+
+    def test_importer_mmex_reimport(self):
+        currency = mixer.blend('currency_history.Currency')
+        account = mixer.blend('account_keeping.Account', initial_amount=0)
+        filepath = path.abspath(path.join(path.dirname(
+            path.dirname(__file__)), 'tests', 'test_file.csv'))
+        kwargs = {'account': account.slug, 'currency': currency.iso_code,
+                  'batch_size': 4, 'stdout': StringIO()}
+        call_command('importer_mmex', filepath=filepath, **kwargs)
+        call_command('importer_mmex', filepath=filepath, **kwargs)
+        self.assertEqual(models.Transaction.objects.count(), 6, msg=(
+            'Should not import the same file twice'))
+
+        # An aborted import, that has committed the first batch
+        checkpoint = models.ImportCheckpoint.objects.get()
+        checkpoint.position = 4
+        checkpoint.finished = False
+        checkpoint.save()
+        models.Transaction.objects.filter(transaction_date__gte=date(
+            2017, 2, 3)).delete()
+        call_command('importer_mmex', filepath=filepath, **kwargs)
+        self.assertEqual(models.Transaction.objects.count(), 6, msg=(
+            'Should resume after the checkpoint'))
+        self.assertTrue(models.ImportCheckpoint.objects.get().finished)
+
+        # An overlapping file with one new row and two identical rows
+        with open(filepath) as file_:
+            lines = file_.readlines()
+        output = tempfile.NamedTemporaryFile(mode='w', suffix='.csv')
+        output.write(''.join(lines[4:] + [
+            '11/02/2017,Bakery,Withdrawal,3.50,Food,,,\n'] * 2))
+        output.flush()
+        call_command('importer_mmex', filepath=output.name, **kwargs)
+        self.assertEqual(models.Transaction.objects.count(), 8, msg=(
+            'Should only import the new rows'))
+        account.refresh_from_db()
+        self.assertEqual(account.total_amount, Decimal('608.30'))
@@ -1,10 +1,15 @@
 """Tests for the models of the account_keeping app."""
+from datetime import date
+from decimal import Decimal
+
 from django.test import TestCase
 from django.utils.timezone import now, timedelta
 
+from dateutil.relativedelta import relativedelta
 from mixer.backend.django import mixer
 
 from .. import models
+from .. import utils
 
 
 WITHDRAWAL = models.Transaction.TRANSACTION_TYPES['withdrawal']
@@ -30,6 +35,174 @@ class AccountTestCase(TestCase):
 
     def test_get_balance(self):
         self.assertEqual(self.account.get_balance(), 0)
+        mixer.blend('account_keeping.Transaction', account=self.account,
+                    transaction_type=DEPOSIT, amount_gross=10, amount_net=10,
+                    transaction_date=now())
+        mixer.blend('account_keeping.Transaction', account=self.account,
+                    transaction_type=DEPOSIT, amount_gross=5, amount_net=5,
+                    transaction_date=now() + timedelta(days=62))
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.total_amount, 15, msg=(
+            'The total amount should be updated by the transactions'))
+        self.assertEqual(self.account.get_balance(), 10, msg=(
+            'Transactions after the given month should not be included'))
+        self.assertEqual(self.account.get_balance(
+            utils.get_month(now() + timedelta(days=93))), 15, msg=(
+                'Months without transactions should carry the balance'))
+
+    def test_save(self):
+        trans = mixer.blend('account_keeping.Transaction', account=self.account,
+                            transaction_type=DEPOSIT, amount_gross=10,
+                            amount_net=10)
+        self.account.initial_amount = 100
+        self.account.total_amount = 0
+        self.account.save()
+        trans.refresh_from_db()
+        self.assertEqual(trans.balance, 110, msg=(
+            'Changing the initial amount should shift all running balances'))
+        self.assertEqual(self.account.total_amount, 110, msg=(
+            'Stale total amounts should never be written back'))
+
+    def test_update_balances(self):
+        trans = mixer.blend('account_keeping.Transaction', account=self.account,
+                            transaction_type=DEPOSIT, amount_gross=10,
+                            amount_net=10,
+                            transaction_date=now() - timedelta(days=62))
+        models.Transaction.objects.update(balance=None)
+        models.Account.objects.update(total_amount=0)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.update_balances(commit=False), 2)
+        self.assertEqual(self.account.update_balances(), 2)
+        trans.refresh_from_db()
+        self.assertEqual(trans.balance, 10, msg=(
+            'Should recompute the running balances of the account'))
+        self.assertEqual(self.account.total_amount, 10)
+        self.assertEqual(self.account.closed_amount, 10, msg=(
+            'Should compute the balance of the last month'))
+        self.assertEqual(self.account.update_balances(), 0)
+
+        models.MonthlyBalance.objects.all().delete()
+        self.assertEqual(self.account.update_balances(), 1, msg=(
+            'Should rebuild missing monthly balances'))
+        self.assertEqual(self.account.get_balance(
+            utils.get_month(trans.transaction_date)), 10)
+
+    def test_add_bulk_transactions(self):
+        self.assertIsNone(self.account.add_bulk_transactions())
+
+        def transaction(day, amount, **kwargs):
+            return mixer.blend(
+                'account_keeping.Transaction', account=self.account,
+                transaction_type=DEPOSIT, amount_gross=amount,
+                amount_net=amount, vat=0, parent=None,
+                transaction_date=date(2017, 1, 1) + timedelta(days=day),
+                **kwargs)
+
+        transaction(10, 1)
+        transaction(70, 2)
+        transaction(100, 4)
+        self.account.refresh_from_db()
+        self.account.update_balances()
+
+        def bulk(day, amount):
+            txn = models.Transaction(
+                account=self.account, transaction_type=DEPOSIT,
+                amount_gross=amount, amount_net=amount, vat=0,
+                currency=self.account.currency,
+                payee=mixer.blend('account_keeping.Payee'),
+                category=mixer.blend('account_keeping.Category'),
+                transaction_date=date(2017, 1, 1) + timedelta(days=day))
+            txn.set_amount_fields()
+            txn.set_value_fields('transaction_type')
+            return txn
+
+        # Before, between (in a new month) and after the existing ones
+        models.Transaction.objects.bulk_create([
+            bulk(5, 10), bulk(40, 20), bulk(70, 40), bulk(200, 80)])
+        with self.assertNumQueries(16):
+            self.assertEqual(self.account.add_bulk_transactions(),
+                             date(2017, 1, 6))
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.total_amount, 157)
+        self.assertEqual(self.account.update_balances(commit=False), 0, msg=(
+            'Should update all balances like a full recomputation'))
+        self.assertEqual(self.account.get_balance(date(2017, 2, 1)), 31)
+
+
+class MonthlyBalanceManagerTestCase(TestCase):
+    """Tests for the ``MonthlyBalanceManager`` manager class."""
+    longMessage = True
+
+    def test_get_balances(self):
+        account = mixer.blend('account_keeping.Account', initial_amount=100)
+        other = mixer.blend('account_keeping.Account', initial_amount=5)
+        month = utils.get_month(now())
+        months = [
+            month - relativedelta(months=2),
+            month - relativedelta(months=1),
+            month,
+        ]
+        mixer.blend('account_keeping.Transaction', account=account,
+                    transaction_type=DEPOSIT, amount_net=10, amount_gross=10,
+                    transaction_date=months[0] - relativedelta(months=1))
+        mixer.blend('account_keeping.Transaction', account=account,
+                    transaction_type=DEPOSIT, amount_net=20, amount_gross=20,
+                    transaction_date=months[1])
+        with self.assertNumQueries(2):
+            result = models.MonthlyBalance.objects.get_balances(
+                [account, other.pk], months)
+        self.assertEqual(result[months[0]], {account.pk: 110, other.pk: 5},
+                         msg=('Should start with the latest previous balance'
+                              ' or the initial amount'))
+        self.assertEqual(result[months[1]][account.pk], 130)
+        self.assertEqual(result[months[2]][account.pk], 130, msg=(
+            'Months without snapshot should carry the balance forward'))
+        self.assertEqual(
+            models.MonthlyBalance.objects.get_balances([account], []), {})
+
+
+class MonthSummaryManagerTestCase(TestCase):
+    """Tests for the ``MonthSummaryManager`` class."""
+    longMessage = True
+
+    def setUp(self):
+        for month in range(1, 5):
+            mixer.blend('account_keeping.MonthSummary',
+                        month=date(2018, month, 1), branch=None,
+                        uses_fallback_rate=month == 1)
+
+    def test_invalidate(self):
+        models.MonthSummary.objects.invalidate(None, date(2018, 3, 20))
+        self.assertEqual(models.MonthSummary.objects.count(), 2, msg=(
+            'Should delete the summaries of the month and later months'))
+        models.MonthSummary.objects.invalidate()
+        self.assertEqual(models.MonthSummary.objects.count(), 0)
+
+    def test_invalidate_rates(self):
+        models.MonthSummary.objects.invalidate_rates(date(2018, 4, 1))
+        self.assertEqual(list(models.MonthSummary.objects.values_list(
+            'month', flat=True)), [date(2018, 2, 1), date(2018, 3, 1)], msg=(
+                'Should also delete summaries, that used fallback rates'))
+
+    def test_signals(self):
+        transaction = mixer.blend('account_keeping.Transaction',
+                                  transaction_date=date(2018, 3, 5))
+        self.assertEqual(models.MonthSummary.objects.count(), 0)
+        for month in range(1, 5):
+            mixer.blend('account_keeping.MonthSummary',
+                        month=date(2018, month, 1), branch=None)
+        transaction.transaction_date = date(2018, 2, 1)
+        transaction.save()
+        self.assertEqual(models.MonthSummary.objects.count(), 1, msg=(
+            'Saving a transaction should invalidate its months'))
+        invoice = mixer.blend('account_keeping.Invoice',
+                              invoice_date=date(2017, 12, 1))
+        self.assertEqual(models.MonthSummary.objects.count(), 0)
+        mixer.blend('account_keeping.MonthSummary',
+                    month=date(2018, 1, 1), branch=None)
+        invoice.delete()
+        self.assertEqual(models.MonthSummary.objects.count(), 0, msg=(
+            'Deleting an invoice should invalidate its months'))
 
 
 class InvoiceTestCase(TestCase):
@@ -41,6 +214,16 @@ class InvoiceTestCase(TestCase):
         obj.save()
         self.assertEqual(str(obj), 'Foo123')
 
+    def test_set_amount_fields(self):
+        invoice = models.Invoice(amount_net=Decimal('10.00'), vat=19)
+        invoice.set_amount_fields()
+        self.assertEqual(invoice.amount_gross, Decimal('11.90'))
+        self.assertIsInstance(invoice.amount_gross, Decimal)
+        invoice = models.Invoice(amount_gross=Decimal('11.90'), vat=19)
+        invoice.set_amount_fields()
+        self.assertEqual(invoice.amount_net, Decimal('10.00'))
+        self.assertIsInstance(invoice.amount_net, Decimal)
+
     def test_manager(self):
         mixer.blend('account_keeping.Invoice')
         mixer.blend('account_keeping.Invoice')
@@ -58,6 +241,44 @@ class InvoiceTestCase(TestCase):
                     rate__to_currency=invoice.currency)
         self.assertEqual(int(invoice.balance), -65)
 
+    def test_get_totals_by_currency(self):
+        eur = mixer.blend('currency_history.Currency', iso_code='EUR')
+        usd = mixer.blend('currency_history.Currency', iso_code='USD')
+        mixer.blend('currency_history.Currency', iso_code='CHF')
+        for currency, invoice_type, amount_gross in [
+                (eur, 'w', 10), (eur, 'w', 5), (eur, 'd', 20), (usd, 'd', 7)]:
+            mixer.blend('account_keeping.Invoice', currency=currency,
+                        invoice_type=invoice_type, amount_gross=amount_gross,
+                        vat=0, amount_net=None)
+        with self.assertNumQueries(1):
+            totals = models.Invoice.objects.prefetch_related(
+                'transactions').get_totals_by_currency()
+        self.assertEqual(totals, {
+            eur.pk: {'expenses_gross': 15, 'income_gross': 20},
+            usd.pk: {'expenses_gross': 0, 'income_gross': 7},
+        }, msg=('Should only contain currencies that have invoices'))
+
+    def test_with_balance(self):
+        invoice = mixer.blend('account_keeping.Invoice', amount_net=100)
+        mixer.blend('account_keeping.Transaction', amount_net=10,
+                    invoice=invoice, currency=invoice.currency)
+        transaction = mixer.blend('account_keeping.Transaction', amount_net=50,
+                                  invoice=invoice)
+        mixer.blend('currency_history.CurrencyRateHistory', value=0.5,
+                    rate__from_currency=transaction.currency,
+                    rate__to_currency=invoice.currency)
+        mixer.blend('account_keeping.Invoice', amount_net=20)
+        with self.assertNumQueries(5):
+            balances = [int(obj.balance) for obj in models.Invoice.objects.
+                        order_by('pk').with_balance()]
+        self.assertEqual(balances, [-65, -20], msg=(
+            'Should compute the balances of all invoices in bulk'))
+        with self.assertNumQueries(3):
+            balances = [int(obj.balance) for obj in models.Invoice.objects.
+                        order_by('pk').with_balance()]
+        self.assertEqual(balances, [-65, -20], msg=(
+            'Should use the cached rates'))
+
 
 class PayeeTestCase(TestCase):
     """Tests for the ``Payee`` model."""
@@ -131,6 +352,55 @@ class TransactionTestCase(TestCase):
         self.assertEqual(obj.value_net, obj.amount_net * -1, msg=(
             'When type is withdrawal, the value should be negative'))
 
+    def test_update_ledger(self):
+        account = mixer.blend('account_keeping.Account', initial_amount=100)
+        today = now().date()
+
+        def blend(transaction_type, amount, days, **kwargs):
+            return mixer.blend(
+                'account_keeping.Transaction', account=account,
+                transaction_type=transaction_type, amount_net=amount,
+                amount_gross=amount, vat=0,
+                transaction_date=today - timedelta(days=days), **kwargs)
+
+        def balances():
+            return list(account.transactions.filter(
+                parent__isnull=True).order_by(
+                    'transaction_date', 'pk').values_list('balance', flat=True))
+
+        first = blend(DEPOSIT, 10, 3)
+        last = blend(WITHDRAWAL, 5, 1)
+        backdated = blend(DEPOSIT, 20, 2)
+        self.assertEqual(balances(), [110, 130, 125], msg=(
+            'Back-dated transactions should update all later balances'))
+
+        first.amount_net = first.amount_gross = 30
+        first.save()
+        self.assertEqual(balances(), [130, 150, 145], msg=(
+            'Changed amounts should update all later balances'))
+
+        backdated.transaction_date = today
+        backdated.save()
+        self.assertEqual(balances(), [130, 125, 145], msg=(
+            'Moved transactions should update the affected balances'))
+
+        blend(DEPOSIT, 1000, 2, parent=last)
+        self.assertEqual(balances(), [130, 125, 145], msg=(
+            'Child transactions should not be part of the ledger'))
+
+        first.delete()
+        self.assertEqual(balances(), [95, 115], msg=(
+            'Deleted transactions should be removed from the ledger'))
+        self.assertEqual(account.get_balance(utils.get_month(today)), 115,
+                         msg=('Should update the monthly balances'))
+
+        # Rows of bulk inserts have no balance until the import is finished
+        models.Transaction.objects.filter(account=account).update(
+            balance=None)
+        blend(DEPOSIT, 1, 0)
+        self.assertEqual(balances(), [None, None, 116], msg=(
+            'Should sum up the ledger, if the previous balance is missing'))
+
     def test_get_description(self):
         """Tests for the ``get_description`` method."""
         trans = mixer.blend('account_keeping.Transaction', description='')
@@ -214,3 +484,50 @@ class TransactionTestCase(TestCase):
     def test_manager(self):
         self.assertEqual(
             models.Transaction.objects.get_without_invoice().count(), 1)
+
+
+class TransactionQuerySetTestCase(TestCase):
+    """Tests for the ``TransactionQuerySet`` queryset class."""
+    longMessage = True
+
+    def test_get_totals_by_account(self):
+        account = mixer.blend('account_keeping.Account')
+        mixer.blend('account_keeping.Transaction', account=account,
+                    transaction_type=DEPOSIT, amount_net=100, vat=19,
+                    amount_gross=None)
+        mixer.blend('account_keeping.Transaction', account=account,
+                    transaction_type=WITHDRAWAL, amount_net=40, vat=0,
+                    amount_gross=None)
+        other = mixer.blend('account_keeping.Transaction',
+                            transaction_type=WITHDRAWAL, amount_net=10,
+                            vat=0, amount_gross=None)
+        with self.assertNumQueries(1):
+            result = models.Transaction.objects.all().get_totals_by_account()
+        self.assertEqual(result[account.pk], {
+            'count': 2,
+            'profit_net': 60,
+            'profit_gross': 79,
+            'expenses_net': 40,
+            'expenses_gross': 40,
+            'income_net': 100,
+            'income_gross': 119,
+        }, msg=('Should return the totals for each account'))
+        self.assertEqual(result[other.account.pk]['expenses_gross'], 10)
+        self.assertEqual(result[other.account.pk]['income_gross'], 0, msg=(
+            'Sums without matching transactions should be zero'))
+
+    def test_for_table(self):
+        for i in range(3):
+            parent = mixer.blend('account_keeping.Transaction',
+                                 invoice=None, description='')
+            for j in range(2):
+                mixer.blend('account_keeping.Transaction', parent=parent,
+                            description='', invoice__description='Foo')
+        with self.assertNumQueries(2):
+            rows = [
+                (obj.get_description(), obj.get_invoices(), obj.payee,
+                 obj.category, obj.currency)
+                for obj in models.Transaction.objects.filter(
+                    parent__isnull=True).for_table()]
+        self.assertEqual(rows[0][0], 'Foo,\nFoo,\n', msg=(
+            'Should use the prefetched children and invoices'))
@@ -0,0 +1,117 @@
+"""Tests for the currency rates of the account_keeping app."""
+import datetime
+
+from django.test import TestCase
+
+from currency_history.models import CurrencyRateHistory
+from mixer.backend.django import mixer
+from mock import patch
+
+from .. import rates
+
+
+class RateResolverTestCase(TestCase):
+    """Tests for the ``RateResolver`` class."""
+    longMessage = True
+
+    def setUp(self):
+        self.eur = mixer.blend('currency_history.Currency', iso_code='EUR')
+        self.usd = mixer.blend('currency_history.Currency', iso_code='USD')
+        self.rate = mixer.blend('currency_history.CurrencyRate',
+                                from_currency=self.usd, to_currency=self.eur)
+        for day, value in [(1, 0.5), (20, 0.25)]:
+            history = mixer.blend('currency_history.CurrencyRateHistory',
+                                  rate=self.rate, value=value)
+            history.date = datetime.datetime(2018, 2, day)
+            history.save()
+        history = mixer.blend('currency_history.CurrencyRateHistory',
+                              rate=self.rate, value=2)
+        history.date = datetime.datetime(2018, 5, 1)
+        history.save()
+
+    def test_get_rate(self):
+        resolver = rates.RateResolver(
+            'EUR', datetime.date(2018, 1, 1), datetime.date(2018, 12, 1))
+        with self.assertNumQueries(3):
+            self.assertEqual(resolver.get_rate(self.eur), 1, msg=(
+                'The base currency should not be converted'))
+            self.assertEqual(
+                resolver.get_rate(self.usd, datetime.date(2018, 2, 5)), 0.25,
+                msg=('Should return the latest rate of the month'))
+            self.assertEqual(
+                resolver.get_rate(self.usd.pk, datetime.date(2018, 3, 1)), 2,
+                msg=('Should fall back to the latest rate'))
+            self.assertEqual(
+                resolver.get_rate(self.usd, datetime.date(2018, 5, 1)), 2)
+        self.assertEqual(resolver.fallback_months, set([
+            datetime.date(2018, 3, 1)]))
+        self.assertEqual(resolver.get_rate(self.usd), 2, msg=(
+            'Should return the latest rate if no month is given'))
+        self.assertEqual(
+            resolver.get_rate(self.usd, datetime.date(2017, 2, 1)), 2, msg=(
+                'Should load months outside of the range on demand'))
+        with self.assertRaises(CurrencyRateHistory.DoesNotExist):
+            resolver.get_rate(mixer.blend('currency_history.Currency'))
+
+
+class RateCacheTestCase(TestCase):
+    """Tests for the ``RateCache`` class."""
+    longMessage = True
+
+    def setUp(self):
+        self.cache = rates.RateCache()
+        self.month = datetime.date(2018, 2, 1)
+
+    def test_cache(self):
+        self.assertIsNone(self.cache.get((1, 'EUR', None)))
+        self.cache.set((1, 'EUR', None), 2)
+        self.cache.set((1, 'EUR', self.month), 3)
+        self.assertEqual(self.cache.get((1, 'EUR', None)), 2)
+        with self.settings(ACCOUNT_KEEPING_RATE_CACHE_SIZE=2):
+            self.cache.set((2, 'EUR', None), 4)
+        self.assertIsNone(self.cache.get((1, 'EUR', self.month)), msg=(
+            'Should evict the least recently used entry'))
+        self.assertEqual(self.cache.get((1, 'EUR', None)), 2)
+        with self.settings(ACCOUNT_KEEPING_RATE_CACHE_TIMEOUT=-1):
+            self.cache.set((1, 'EUR', None), 2)
+        self.assertIsNone(self.cache.get((1, 'EUR', None)), msg=(
+            'Should not return expired entries'))
+        self.cache.invalidate()
+        self.assertIsNone(self.cache.get((2, 'EUR', None)))
+
+    def test_backend(self):
+        with self.settings(ACCOUNT_KEEPING_RATE_CACHE_BACKEND='default'):
+            self.cache.set((1, 'EUR', self.month), 3)
+            other_cache = rates.RateCache()
+            self.assertEqual(other_cache.get((1, 'EUR', self.month)), 3, msg=(
+                'Should share the entries of all processes via the backend'))
+            with patch.object(other_cache, 'get_backend') as get_backend:
+                get_backend.return_value.get.side_effect = AssertionError
+                self.assertEqual(
+                    other_cache.get((1, 'EUR', self.month)), 3, msg=(
+                        'Should not ask the backend for local hits'))
+            self.cache.invalidate()
+            self.assertIsNone(self.cache.get((1, 'EUR', self.month)))
+            self.assertEqual(other_cache.get((1, 'EUR', self.month)), 3, msg=(
+                'Should check the generation only once per interval'))
+            with self.settings(ACCOUNT_KEEPING_RATE_CACHE_CHECK_INTERVAL=0):
+                self.assertIsNone(
+                    other_cache.get((1, 'EUR', self.month)), msg=(
+                        'Should invalidate the local entries of all'
+                        ' processes'))
+
+    def test_invalidation(self):
+        eur = mixer.blend('currency_history.Currency', iso_code='EUR')
+        usd = mixer.blend('currency_history.Currency', iso_code='USD')
+        rate = mixer.blend('currency_history.CurrencyRate',
+                           from_currency=usd, to_currency=eur)
+        mixer.blend('currency_history.CurrencyRateHistory', rate=rate,
+                    value=0.5)
+        self.assertEqual(rates.RateResolver('EUR').get_rate(usd), 0.5)
+        with self.assertNumQueries(0):
+            self.assertEqual(rates.RateResolver('EUR').get_rate(usd), 0.5,
+                             msg=('Should use the process-wide cache'))
+        mixer.blend('currency_history.CurrencyRateHistory', rate=rate,
+                    value=2)
+        self.assertEqual(rates.RateResolver('EUR').get_rate(usd), 2, msg=(
+            'Should invalidate the cache when a rate is saved'))
@@ -0,0 +1,153 @@
+"""Tests for the reports of the account_keeping app."""
+import datetime
+
+from django.test import TestCase
+from django.utils.timezone import now
+
+from mixer.backend.django import mixer
+
+from .. import models
+from .. import reports
+from .. import utils
+from ..rates import RateResolver
+
+
+class GetOutstandingSeriesTestCase(TestCase):
+    """Tests for the ``get_outstanding_series`` function."""
+    longMessage = True
+
+    def setUp(self):
+        self.eur = mixer.blend('currency_history.Currency', iso_code='EUR')
+        self.usd = mixer.blend('currency_history.Currency', iso_code='USD')
+        history = mixer.blend('currency_history.CurrencyRateHistory',
+                              rate__from_currency=self.usd,
+                              rate__to_currency=self.eur, value=0.5)
+        history.date = datetime.datetime(2017, 1, 1)
+        history.save()
+        self.branch = mixer.blend('account_keeping.Branch')
+
+        def invoice(invoice_date, payment_date, currency, value_gross):
+            return mixer.blend(
+                'account_keeping.Invoice', branch=self.branch,
+                invoice_type='d', invoice_date=invoice_date,
+                payment_date=payment_date, currency=currency, vat=0,
+                amount_net=value_gross, amount_gross=value_gross)
+
+        # Sent in December, paid in February
+        invoice(datetime.date(2017, 12, 5), datetime.date(2018, 2, 3),
+                self.eur, 100)
+        # Sent in March, paid in March
+        invoice(datetime.date(2018, 3, 1), datetime.date(2018, 3, 20),
+                self.eur, 1000)
+        # Sent in February, unpaid but partially paid in April
+        unpaid = invoice(datetime.date(2018, 2, 10), None, self.usd, 40)
+        mixer.blend('account_keeping.Transaction', invoice=unpaid,
+                    transaction_type='d', transaction_date=datetime.date(
+                        2018, 4, 2), currency=self.usd, vat=0,
+                    amount_net=10, amount_gross=10, parent=None)
+        # Another branch
+        mixer.blend('account_keeping.Invoice', invoice_date=datetime.date(
+            2018, 1, 1), payment_date=None, currency=self.eur, vat=0,
+            invoice_type='d', amount_net=7, amount_gross=7)
+
+    def test_function(self):
+        months = [datetime.date(2018, month, 1) for month in range(1, 6)]
+        rates = RateResolver('EUR', months[0], months[-1])
+        with self.assertNumQueries(5):
+            outstanding, payments = reports.get_outstanding_series(
+                months, rates, self.branch)
+        self.assertEqual(outstanding, {
+            months[0]: 100,
+            months[1]: 20,
+            months[2]: 20,
+            months[3]: 15,
+            months[4]: 15,
+        })
+        self.assertEqual(payments, {
+            months[0]: 0,
+            months[1]: 0,
+            months[2]: 0,
+            months[3]: 5,
+            months[4]: 5,
+        })
+        outstanding, payments = reports.get_outstanding_series(months, rates)
+        self.assertEqual(outstanding[months[0]], 107, msg=(
+            'Should count the invoices of all branches'))
+        self.assertEqual(reports.get_outstanding_series([], rates), ({}, {}))
+
+    def test_paid_before_invoice_date(self):
+        mixer.blend(
+            'account_keeping.Invoice', branch=self.branch, invoice_type='d',
+            invoice_date=datetime.date(2017, 3, 5),
+            payment_date=datetime.date(2017, 2, 10), currency=self.eur,
+            vat=0, amount_net=100, amount_gross=100)
+        months = [datetime.date(2017, month, 1) for month in range(1, 4)]
+        rates = RateResolver('EUR', months[0], months[-1])
+        outstanding, payments = reports.get_outstanding_series(
+            months, rates, self.branch)
+        self.assertEqual(outstanding, dict(
+            (month, 0) for month in months), msg=(
+                'Invoices paid before they were sent are never outstanding'))
+
+
+class GetMonthSummariesTestCase(TestCase):
+    """Tests for the ``get_month_summaries`` function."""
+    longMessage = True
+
+    def setUp(self):
+        self.eur = mixer.blend('currency_history.Currency', iso_code='EUR')
+        self.account = mixer.blend('account_keeping.Account',
+                                   currency=self.eur, initial_amount=100)
+        for day, transaction_type, amount in [
+                (datetime.date(2018, 1, 5), 'd', 50),
+                (datetime.date(2018, 2, 5), 'w', 20),
+                (datetime.date(2018, 2, 6), 'd', 10)]:
+            mixer.blend('account_keeping.Transaction', account=self.account,
+                        currency=self.eur, transaction_date=day,
+                        transaction_type=transaction_type, vat=0,
+                        amount_net=amount, amount_gross=amount, parent=None,
+                        invoice=None)
+        self.months = [datetime.date(2018, month, 1) for month in range(1, 5)]
+
+    def test_function(self):
+        summaries = reports.get_month_summaries(
+            self.months, 'EUR', past_months=3)
+        self.assertEqual([
+            (summary.income, summary.expenses, summary.balance)
+            for summary in summaries
+        ], [(50, None, 150), (10, 20, 140), (None, None, 140),
+            (None, None, None)])
+        self.assertEqual(models.MonthSummary.objects.count(), 3, msg=(
+            'Should save the summaries of the past months'))
+        with self.assertNumQueries(1):
+            summaries = reports.get_month_summaries(
+                self.months[:3], 'EUR', past_months=3)
+        self.assertEqual(summaries[1].income, 10)
+        mixer.blend('account_keeping.Transaction', account=self.account,
+                    currency=self.eur, transaction_date=datetime.date(
+                        2018, 2, 1), transaction_type='d', vat=0,
+                    amount_net=5, amount_gross=5, parent=None, invoice=None)
+        summaries = reports.get_month_summaries(
+            self.months[:3], 'EUR', past_months=3)
+        self.assertEqual([
+            (summary.income, summary.balance) for summary in summaries
+        ], [(50, 150), (15, 145), (None, 145)], msg=(
+            'Should recompute the months of changed transactions'))
+
+    def test_invalidated_while_computing(self):
+        version = models.MonthSummary.objects.get_version()
+        models.MonthSummary.objects.invalidate(datetime.date(2018, 1, 1))
+        summaries = reports.compute_month_summaries(
+            self.months[:1], RateResolver('EUR'))
+        self.assertFalse(models.MonthSummary.objects.save_summaries(
+            summaries, version), msg=(
+                'Should not save summaries, that have been invalidated'))
+        self.assertTrue(models.MonthSummary.objects.save_summaries(
+            summaries, models.MonthSummary.objects.get_version()))
+
+    def test_current_month(self):
+        month = utils.get_month(now())
+        reports.get_month_summaries([month, month + datetime.timedelta(
+            days=40)], 'EUR', past_months=2)
+        self.assertFalse(models.MonthSummary.objects.exists(), msg=(
+            'Should not save the current and future months'))
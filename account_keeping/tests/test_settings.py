@@ -76,3 +76,5 @@ CURRENCY_SERVICE = 'yahoo'
 
 # Freckle
 ACCOUNT_KEEPING_FRECKLE_ACCESS_TOKEN = 'Foo'
+ACCOUNT_KEEPING_FRECKLE_CLIENT = 'account_keeping.freckle_api.FakeFreckleClient'
+ACCOUNT_KEEPING_FRECKLE_BACKGROUND_REFRESH = False
@@ -16,6 +16,15 @@ class GetDateTestCase(TestCase):
         self.assertEqual(utils.get_date(1), 1)
 
 
+class GetMonthTestCase(TestCase):
+    """Tests for the ``get_month`` function."""
+    longMessage = True
+
+    def test_function(self):
+        self.assertEqual(utils.get_month(datetime.datetime(2014, 2, 3, 4)),
+                         datetime.date(2014, 2, 1))
+
+
 class GetMonthsOfYearTestCase(TestCase):
     """Tests for the ``get_months_of_year`` function."""
     longMessage = True
@@ -1,15 +1,19 @@
 """Tests for the views of the account_keeping app."""
-import json
+import csv
+import datetime
 
+from django.core.files.base import ContentFile
 from django.core.urlresolvers import reverse
+from django.http import Http404
 from django.test import TestCase
 from django.utils.timezone import now, timedelta
 
+from currency_history.models import CurrencyRateHistory
 from django_libs.tests.mixins import ViewRequestFactoryTestMixin
 from mixer.backend.django import mixer
-from mock import patch
-from requests import Response
 
+from .. import freckle_api
+from .. import models
 from .. import views
 
 
@@ -130,6 +134,74 @@ class MonthViewTestCase(ViewRequestFactoryTestMixin, TestCase):
         self.is_callable(self.user, kwargs={
             'year': now().year, 'month': now().month})
 
+    def test_get_outstanding_invoices(self):
+        month = datetime.date(2017, 1, 1)
+        invoice = mixer.blend(
+            'account_keeping.Invoice', currency=self.ccy, amount_net=100,
+            amount_gross=100, vat=0, invoice_date=month, payment_date=None)
+        mixer.blend('account_keeping.Transaction', invoice=invoice,
+                    currency=self.ccy2, amount_net=10, amount_gross=10,
+                    vat=0, transaction_date=month)
+        rate = CurrencyRateHistory.objects.get()
+        rate.date = now().replace(year=2017, month=1, day=15)
+        rate.value = 2
+        rate.save()
+        latest = mixer.blend('currency_history.CurrencyRateHistory',
+                             rate=rate.rate, value=3)
+        latest.date = now()
+        latest.save()
+        view = views.MonthView()
+        view.month, view.branch = month, None
+        self.assertEqual(
+            [item.balance for item in view.get_outstanding_invoices()],
+            [-70], msg='Should convert with the latest rate')
+
+
+class AccountTransactionsViewTestCase(ViewRequestFactoryTestMixin,
+                                      TestCase):
+    """Tests for the ``AccountTransactionsView`` view class."""
+    view_class = views.AccountTransactionsView
+
+    def setUp(self):
+        self.user = mixer.blend('auth.User', is_superuser=True)
+        self.account = mixer.blend('account_keeping.Account')
+        self.transactions = []
+        for day in [1, 2, 2, 3]:
+            self.transactions.append(mixer.blend(
+                'account_keeping.Transaction', account=self.account,
+                parent=None, transaction_date=now().replace(day=day)))
+
+    def get_view_kwargs(self):
+        return {'pk': self.account.pk}
+
+    def test_view(self):
+        self.should_redirect_to_login_when_anonymous()
+        with self.settings(ACCOUNT_KEEPING_TRANSACTIONS_PAGE_SIZE=3):
+            resp = self.is_callable(self.user)
+            self.assertEqual(resp.context_data['transactions'], list(reversed(
+                self.transactions[1:])), msg=(
+                    'Should return the latest transactions first'))
+            before = resp.context_data['next_url'].split('before=')[1]
+            resp = self.is_callable(self.user, data={'before': before})
+            self.assertEqual(resp.context_data['transactions'],
+                             self.transactions[:1], msg=(
+                                 'Should continue after the given position'))
+            self.assertIsNone(resp.context_data['next_url'])
+        resp = self.is_callable(self.user, kwargs={
+            'pk': self.account.pk, 'year': 2001, 'month': 1})
+        self.assertEqual(resp.context_data['transactions'], [], msg=(
+            'Should only return transactions of the given month'))
+        with self.assertRaises(Http404):
+            self.get(self.user, data={'before': 'foo'})
+
+        branch = mixer.blend('account_keeping.Branch')
+        req = self.get_get_request(user=self.user,
+                                   view_kwargs=self.get_view_kwargs())
+        req.COOKIES['django_account_keeping_branch'] = branch.slug
+        with self.assertRaises(Http404):
+            # Accounts of other branches should not be found
+            self.get_view()(req, **self.get_view_kwargs())
+
 
 class YearOverviewViewTestCase(ViewRequestFactoryTestMixin, TestCase):
     """Tests for the ``YearOverviewView`` view class."""
@@ -194,16 +266,11 @@ class IndexViewTestCase(ViewRequestFactoryTestMixin, TestCase):
         self.user = mixer.blend('auth.User', is_superuser=True)
         mixer.blend('account_keeping.Transaction')
 
-    @patch('requests.request')
-    def test_view(self, mock):
-        resp = Response()
-        resp.status_code = 200
-        resp._content = json.dumps([{
-            'reference': 1,
-        }])
-        mock.return_value = resp
+    def test_view(self):
         self.should_redirect_to_login_when_anonymous()
         self.is_callable(self.user)
+        freckle_api.refresh_unpaid_invoices()
+        self.is_callable(self.user)
 
 
 class BranchSelectViewTestCase(ViewRequestFactoryTestMixin, TestCase):
@@ -222,6 +289,31 @@ class BranchSelectViewTestCase(ViewRequestFactoryTestMixin, TestCase):
         self.is_not_callable(self.user, kwargs={'slug': 'foo'})
 
 
+class AccountListViewTestCase(ViewRequestFactoryTestMixin, TestCase):
+    """Tests for the ``AccountListView`` view class."""
+    view_class = views.AccountListView
+
+    def setUp(self):
+        self.user = mixer.blend('auth.User', is_superuser=True)
+        self.account = mixer.blend('account_keeping.Account',
+                                   initial_amount=100)
+        for days in [0, 100]:
+            mixer.blend('account_keeping.Transaction', account=self.account,
+                        parent=None, transaction_type='d', amount_net=10,
+                        amount_gross=10, vat=0,
+                        transaction_date=now().date() + timedelta(days=days))
+
+    def test_view(self):
+        self.should_redirect_to_login_when_anonymous()
+        resp = self.is_callable(self.user)
+        self.assertEqual(
+            resp.context_data['object_list'][0].current_balance, 110, msg=(
+                'Should not include future transactions in the balance'))
+        with self.assertNumQueries(2):
+            # The accounts and the sums of their future transactions
+            self.is_callable(self.user)
+
+
 class PayeeListViewTestCase(ViewRequestFactoryTestMixin, TestCase):
     """Tests for the ``PayeeListView`` view class."""
     view_class = views.PayeeListView
@@ -304,3 +396,88 @@ class TransactionExportViewTestCase(ViewRequestFactoryTestMixin, TestCase):
             'start': '2015-01-01',
             'end': '2018-01-01',
         })
+        transaction = mixer.blend('account_keeping.Transaction',
+                                  transaction_date='2016-02-03')
+        resp = self.is_postable(user=self.user, ajax=True, data={
+            'start': '2015-01-01',
+            'end': '2018-01-01',
+            'format': 'csv',
+        })
+        rows = list(csv.reader(b''.join(
+            resp.streaming_content).decode('utf-8').splitlines(True)))
+        self.assertEqual(len(rows), 2, msg=(
+            'Should stream the header and one row per transaction'))
+        self.assertEqual(rows[1][0], str(transaction.pk))
+        resp = self.is_postable(user=self.user, ajax=True, data={
+            'start': '2015-01-01',
+            'end': '2018-01-01',
+            'format': 'xlsx',
+        })
+        self.assertIn('.xlsx', resp['Content-Disposition'])
+        resp = self.is_postable(user=self.user, ajax=True, data={
+            'start': '2015-01-01',
+            'end': '2018-01-01',
+            'format': 'parquet',
+        })
+        self.assertIn('.parquet', resp['Content-Disposition'])
+        with self.settings(
+                ACCOUNT_KEEPING_EXPORT_RUNNER='account_keeping.jobs.queue_job'):
+            self.is_postable(
+                user=self.user, to_url_name='account_keeping_export_job',
+                data={
+                    'start': '2015-01-01',
+                    'end': '2018-01-01',
+                    'format': 'csv',
+                    'background': True,
+                })
+
+
+class ExportJobViewTestCase(ViewRequestFactoryTestMixin, TestCase):
+    """Tests for the ``ExportJobView`` view class."""
+    view_class = views.ExportJobView
+
+    def setUp(self):
+        self.user = mixer.blend('auth.User', is_superuser=True)
+        self.job = mixer.blend('account_keeping.ExportJob', file='', total=10,
+                               progress=5, user=self.user)
+
+    def get_view_kwargs(self):
+        return {'pk': self.job.pk}
+
+    def test_view(self):
+        self.should_redirect_to_login_when_anonymous()
+        self.is_callable(self.user)
+        with self.assertRaises(Http404):
+            # Jobs of other users should not be found
+            self.get(mixer.blend('auth.User'))
+
+
+class ExportJobDownloadViewTestCase(ViewRequestFactoryTestMixin, TestCase):
+    """Tests for the ``ExportJobDownloadView`` view class."""
+    view_class = views.ExportJobDownloadView
+
+    def setUp(self):
+        self.user = mixer.blend('auth.User', is_superuser=True)
+        self.job = mixer.blend('account_keeping.ExportJob', file='',
+                               status='done', export_format='csv',
+                               user=self.user)
+        self.job.file.save('transactions.csv', ContentFile(b'a,b\r\n'))
+        self.addCleanup(self.job.file.delete, save=False)
+
+    def get_view_kwargs(self):
+        return {'pk': self.job.pk}
+
+    def test_view(self):
+        self.assertNotIn('exports/transactions', self.job.file.name, msg=(
+            'Should store the file in a random folder'))
+        self.should_redirect_to_login_when_anonymous()
+        resp = self.is_callable(self.user)
+        self.assertEqual(b''.join(resp.streaming_content), b'a,b\r\n')
+        resp.close()
+        with self.assertRaises(Http404):
+            # Files of other users should not be served
+            self.get(mixer.blend('auth.User', is_superuser=True))
+        models.ExportJob.objects.filter(pk=self.job.pk).update(
+            status='running')
+        with self.assertRaises(Http404):
+            self.get(self.user)
@@ -37,6 +37,22 @@ urlpatterns = [
         views.PayeeListView.as_view(),
         name='account_keeping_payees'),
 
+    url(r'account/(?P<pk>\d+)/transactions/$',
+        views.AccountTransactionsView.as_view(),
+        name='account_keeping_account_transactions'),
+
+    url(r'account/(?P<pk>\d+)/transactions/(?P<year>\d+)/(?P<month>\d+)/$',
+        views.AccountTransactionsView.as_view(),
+        name='account_keeping_account_transactions'),
+
+    url(r'export/(?P<pk>\d+)/download/$',
+        views.ExportJobDownloadView.as_view(),
+        name='account_keeping_export_job_download'),
+
+    url(r'export/(?P<pk>\d+)/$',
+        views.ExportJobView.as_view(),
+        name='account_keeping_export_job'),
+
     url(r'export/$',
         views.TransactionExportView.as_view(),
         name='account_keeping_export'),
@@ -1,4 +1,8 @@
 """Utility functions for the account_keeping app."""
+from datetime import date
+import hashlib
+
+from django.utils.encoding import force_bytes
 from django.utils.timezone import datetime, now
 
 from six import string_types
@@ -17,6 +21,14 @@ def get_date(value):
     return value
 
 
+def get_month(value):
+    """
+    Returns the first day of the month of the given date or datetime.
+
+    """
+    return date(value.year, value.month, 1)
+
+
 def get_months_of_year(year):
     """
     Returns the number of months that have already passed in the given year.
@@ -33,3 +45,52 @@ def get_months_of_year(year):
         return 1
     if year < current_year:
         return 12
+
+
+def get_checksum(path, chunk_size=65536):
+    """Returns the SHA-256 hash of the given file as hex string."""
+    checksum = hashlib.sha256()
+    with open(path, 'rb') as file_:
+        for chunk in iter(lambda: file_.read(chunk_size), b''):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+class ChecksumReader(object):
+    """
+    File-like wrapper, that computes the SHA-256 hash and size of the data.
+
+    Use it to hash files while they are copied, instead of reading them
+    twice.
+
+    """
+    def __init__(self, file_):
+        self.file = file_
+        self.checksum = hashlib.sha256()
+        self.size = 0
+
+    def read(self, *args):
+        data = self.file.read(*args)
+        self.checksum.update(data)
+        self.size += len(data)
+        return data
+
+    def hexdigest(self):
+        return self.checksum.hexdigest()
+
+
+def get_fingerprint(values, occurrences):
+    """
+    Returns the fingerprint of an imported row as hex string.
+
+    Statements can contain identical rows (i.e. two coffees on the same day),
+    so the number of previous occurrences of the same values is part of the
+    fingerprint. ``occurrences`` is a dict, that counts them for the current
+    file.
+
+    """
+    content = force_bytes(u'\x1f'.join(values))
+    occurrence = occurrences.get(content, 0)
+    occurrences[content] = occurrence + 1
+    return hashlib.sha256(content + force_bytes(
+        u'\x1e{0}'.format(occurrence))).hexdigest()
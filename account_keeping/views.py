@@ -1,27 +1,34 @@
 """Views for the account_keeping app."""
-import decimal
+from collections import OrderedDict
 import datetime
+import tempfile
 
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.core.urlresolvers import reverse, reverse_lazy
-from django.db import connection
 from django.db.models import Q, Sum
-from django.http import HttpResponse, Http404, HttpResponseRedirect
-from django.shortcuts import redirect
+from django.http import (
+    FileResponse, HttpResponse, Http404, HttpResponseRedirect,
+    StreamingHttpResponse,
+)
+from django.shortcuts import get_object_or_404, redirect
 from django.template.defaultfilters import date as date_filter
 from django.utils.decorators import method_decorator
+from django.utils.http import urlencode
 from django.utils.timezone import now
 from django.views import generic
 
-from currency_history.models import Currency, CurrencyRateHistory
+from currency_history.models import Currency
 from dateutil import relativedelta
 
+from . import exports
 from . import forms
+from . import jobs
 from . import models
+from . import reports
 from . import utils
 from .freckle_api import get_unpaid_invoices_with_transactions
-from .utils import get_date as d
+from .rates import RateResolver
 
 
 DEPOSIT = models.Transaction.TRANSACTION_TYPES['deposit']
@@ -51,6 +58,15 @@ class BranchMixin(object):
         })
         return ctx
 
+    def get_base_currency(self):
+        """
+        Returns the ISO-code of the currency all totals are converted into.
+
+        """
+        if self.branch:
+            return self.branch.currency.iso_code
+        return getattr(settings, 'BASE_CURRENCY', 'EUR')
+
 
 class AccountsViewMixin(object):
     """
@@ -73,33 +89,29 @@ class AccountsViewMixin(object):
             'income_net': 0,
             'income_gross': 0,
         }
-        if self.branch:
-            base_currency = self.branch.currency.iso_code
-        else:
-            base_currency = getattr(settings, 'BASE_CURRENCY', 'EUR')
+        base_currency = self.get_base_currency()
+        # All rates of this view are loaded at once
+        self.rates = RateResolver(base_currency, self.month, self.month)
+        accounts = list(accounts.select_related('currency'))
+        transactions = self.get_transactions().filter(account__in=accounts)
+        account_totals = transactions.get_totals_by_account()
+        account_balances = models.MonthlyBalance.objects.get_balances(
+            accounts, [self.month])[self.month]
         for account in accounts:
             rate = 1
             if not account.currency.iso_code == base_currency:
                 rate = self.get_rate(account.currency)
 
-            account_balance = account.get_balance(self.month)
-
-            qs = self.get_transactions(account)
-
-            amount_net_sum = qs.aggregate(
-                Sum('value_net'))['value_net__sum'] or 0
-            amount_gross_sum = qs.aggregate(
-                Sum('value_gross'))['value_gross__sum'] or 0
-            expenses_net_sum = qs.filter(
-                transaction_type=WITHDRAWAL).aggregate(
-                    Sum('amount_net'))['amount_net__sum'] or 0
-            expenses_gross_sum = qs.filter(
-                transaction_type=WITHDRAWAL).aggregate(
-                    Sum('amount_gross'))['amount_gross__sum'] or 0
-            income_net_sum = qs.filter(transaction_type=DEPOSIT).aggregate(
-                Sum('amount_net'))['amount_net__sum'] or 0
-            income_gross_sum = qs.filter(transaction_type=DEPOSIT).aggregate(
-                Sum('amount_gross'))['amount_gross__sum'] or 0
+            account_balance = account_balances[account.pk]
+
+            account_total = account_totals.get(account.pk, {})
+
+            amount_net_sum = account_total.get('profit_net', 0)
+            amount_gross_sum = account_total.get('profit_gross', 0)
+            expenses_net_sum = account_total.get('expenses_net', 0)
+            expenses_gross_sum = account_total.get('expenses_gross', 0)
+            income_net_sum = account_total.get('income_net', 0)
+            income_gross_sum = account_total.get('income_gross', 0)
 
             amount_net_sum_base = amount_net_sum * rate
             amount_gross_sum_base = amount_gross_sum * rate
@@ -118,7 +130,8 @@ class AccountsViewMixin(object):
             account_transactions.append({
                 'account': account,
                 'account_balance': account_balance,
-                'transactions': qs,
+                'transactions_url': self.get_transactions_url(account),
+                'transactions_count': account_total.get('count', 0),
                 'amount_net_total': amount_net_sum,
                 'amount_gross_total': amount_gross_sum,
                 'expenses_net_total': expenses_net_sum,
@@ -141,22 +154,19 @@ class AccountsViewMixin(object):
         outstanding_expenses_gross_total_base = 0
         outstanding_income_gross_total_base = 0
         outstanding_profit_gross_total_base = 0
-        outstanding_ccy_totals = {}
-        for currency in Currency.objects.all():
-            rate = 1
-            if not currency.iso_code == base_currency:
-                rate = self.get_rate(currency)
-            outstanding_expenses_gross_sum = qs.filter(
-                invoice_type=WITHDRAWAL, currency=currency).aggregate(
-                    Sum('amount_gross'))['amount_gross__sum'] or 0
+        outstanding_ccy_totals = OrderedDict()
+        totals_by_currency = qs.get_totals_by_currency()
+        for currency in Currency.objects.filter(pk__in=totals_by_currency):
+            rate = self.get_rate(currency)
+            outstanding_expenses_gross_sum = \
+                totals_by_currency[currency.pk]['expenses_gross']
             outstanding_expenses_gross_sum_base = \
                 outstanding_expenses_gross_sum * rate
             outstanding_expenses_gross_total_base += \
                 outstanding_expenses_gross_sum_base
 
-            outstanding_income_gross_sum = qs.filter(
-                invoice_type=DEPOSIT, currency=currency).aggregate(
-                    Sum('amount_gross'))['amount_gross__sum'] or 0
+            outstanding_income_gross_sum = \
+                totals_by_currency[currency.pk]['income_gross']
             outstanding_income_gross_sum_base = \
                 outstanding_income_gross_sum * rate
             outstanding_income_gross_total_base += \
@@ -224,10 +234,21 @@ class AccountsViewMixin(object):
         """
         raise NotImplementedError('Method not implemented')  # pragma: no cover
 
-    def get_transactions(self, account):
+    def get_transactions(self):
         """
         Returns the transactions that should be shown in this view.
 
+        The queryset should contain the top-level transactions of all
+        accounts, it will be filtered and grouped by account in
+        ``get_context_data``.
+
+        """
+        raise NotImplementedError('Method not implemented')  # pragma: no cover
+
+    def get_transactions_url(self, account):
+        """
+        Returns the URL, that loads the transactions of an account tab.
+
         """
         raise NotImplementedError('Method not implemented')  # pragma: no cover
 
@@ -262,7 +283,8 @@ class IndexView(BranchMixin, generic.TemplateView):
 
     def get_context_data(self, **kwargs):
         ctx = super(IndexView, self).get_context_data(**kwargs)
-        invoices_without_pdf = models.Invoice.objects.get_without_pdf()
+        invoices_without_pdf = \
+            models.Invoice.objects.get_without_pdf().with_balance()
         transactions_without_invoice = \
             models.Transaction.objects.get_without_invoice()
         if self.branch:
@@ -271,6 +293,7 @@ class IndexView(BranchMixin, generic.TemplateView):
             transactions_without_invoice = transactions_without_invoice.filter(
                 Q(account__branch=self.branch) | Q(invoice__branch=self.branch)
             )
+        transactions_without_invoice = transactions_without_invoice.for_table()
         ctx.update({
             'invoices_without_pdf': invoices_without_pdf,
             'transactions_without_invoice': transactions_without_invoice,
@@ -297,23 +320,17 @@ class AllTimeView(BranchMixin, AccountsViewMixin, generic.TemplateView):
         )
         if self.branch:
             invoices = invoices.filter(branch=self.branch)
-        return invoices
+        return invoices.prefetch_related('transactions').with_balance()
 
     def get_rate(self, currency):
-        if self.branch:
-            base_currency = self.branch.currency.iso_code
-        else:
-            base_currency = getattr(settings, 'BASE_CURRENCY', 'EUR')
-        return decimal.Decimal(CurrencyRateHistory.objects.filter(
-            rate__from_currency=currency,
-            rate__to_currency__iso_code=base_currency,
-        )[0].value)
+        return self.rates.get_rate(currency)
 
-    def get_transactions(self, account):
-        return models.Transaction.objects.filter(
-            account=account,
-            parent__isnull=True,
-        )
+    def get_transactions(self):
+        return models.Transaction.objects.filter(parent__isnull=True)
+
+    def get_transactions_url(self, account):
+        return reverse('account_keeping_account_transactions',
+                       kwargs={'pk': account.pk})
 
 
 class CurrentMonthRedirectView(generic.View):
@@ -365,34 +382,82 @@ class MonthView(BranchMixin, AccountsViewMixin, generic.TemplateView):
         )
         if self.branch:
             invoices = invoices.filter(branch=self.branch)
-        return invoices.prefetch_related('transactions')
+        # Like the invoice balances everywhere else, with the latest rates
+        return invoices.prefetch_related('transactions').with_balance()
 
     def get_rate(self, currency):
-        if self.branch:
-            base_currency = self.branch.currency.iso_code
-        else:
-            base_currency = getattr(settings, 'BASE_CURRENCY', 'EUR')
-        rates = CurrencyRateHistory.objects.filter(
-            rate__from_currency=currency,
-            rate__to_currency__iso_code=base_currency,
-        )
-        try:
-            return decimal.Decimal(rates.filter(
-                date__year=self.month.year,
-                date__month=self.month.month,
-            )[0].value)
-        except IndexError:
-            # Get latest rate history record
-            return decimal.Decimal(rates[0].value)
-
-    def get_transactions(self, account):
+        # Falls back to the latest rate if there is none for this month
+        return self.rates.get_rate(currency, self.month)
+
+    def get_transactions(self):
         return models.Transaction.objects.filter(
-            account=account,
             parent__isnull=True,
             transaction_date__year=self.month.year,
             transaction_date__month=self.month.month,
         )
 
+    def get_transactions_url(self, account):
+        return reverse('account_keeping_account_transactions', kwargs={
+            'pk': account.pk,
+            'year': self.month.year,
+            'month': self.month.month,
+        })
+
+
+class AccountTransactionsView(BranchMixin, generic.TemplateView):
+    """
+    Returns one page of the transactions of an account as table rows.
+
+    The account tabs of the month and all time views load their transactions
+    with this view. Pages use keyset pagination on ``(transaction_date, pk)``,
+    so later pages are as cheap as the first one. The running balances are
+    stored on the transactions and therefore correct on every page.
+
+    """
+    template_name = 'account_keeping/partials/account_transactions.html'
+
+    def get_context_data(self, **kwargs):
+        ctx = super(AccountTransactionsView, self).get_context_data(**kwargs)
+        accounts = models.Account.objects.all()
+        if self.branch:
+            accounts = accounts.filter(branch=self.branch)
+        self.account = get_object_or_404(accounts, pk=kwargs.get('pk'))
+        transactions = self.account.transactions.filter(parent__isnull=True)
+        if kwargs.get('year'):
+            transactions = transactions.filter(
+                transaction_date__year=kwargs.get('year'),
+                transaction_date__month=kwargs.get('month'),
+            )
+        if self.request.GET.get('before'):
+            try:
+                before_date, before_pk = self.request.GET['before'].split('_')
+                before_date = datetime.datetime.strptime(
+                    before_date, '%Y-%m-%d').date()
+                before_pk = int(before_pk)
+            except ValueError:
+                raise Http404
+            transactions = transactions.filter(
+                Q(transaction_date__lt=before_date) |
+                Q(transaction_date=before_date, pk__lt=before_pk))
+        page_size = getattr(
+            settings, 'ACCOUNT_KEEPING_TRANSACTIONS_PAGE_SIZE', 100)
+        transactions = list(transactions.order_by(
+            '-transaction_date', '-pk').for_table()[:page_size + 1])
+        next_url = None
+        if len(transactions) > page_size:
+            transactions = transactions[:page_size]
+            next_url = '{0}?{1}'.format(self.request.path, urlencode({
+                'before': '{0:%Y-%m-%d}_{1}'.format(
+                    transactions[-1].transaction_date, transactions[-1].pk),
+            }))
+        ctx.update({
+            'account': self.account,
+            'transactions': transactions,
+            'transaction_types': models.Transaction.TRANSACTION_TYPES,
+            'next_url': next_url,
+        })
+        return ctx
+
 
 class YearOverviewView(BranchMixin, generic.TemplateView):
     template_name = 'account_keeping/year_view.html'
@@ -410,225 +475,32 @@ class YearOverviewView(BranchMixin, generic.TemplateView):
         if next_year > datetime.date.today().year:
             next_year = None
 
-        truncate_date = connection.ops.date_trunc_sql(
-            'month', 'transaction_date')
-
-        txns = models.Transaction.objects.filter(
-            parent__isnull=True, transaction_date__year=self.year)
-        if self.branch:
-            txns = txns.filter(
-                Q(invoice__branch=self.branch) |
-                Q(account__branch=self.branch))
-        qs_year = txns.extra({'month': truncate_date})
-
-        qs_income = qs_year.filter(
-            transaction_type=DEPOSIT).values(
-                'month', 'currency').annotate(
-                    Sum('amount_gross')).order_by('currency', 'month')
-
         months = []
         for i in range(1, 13):
             months.append(datetime.date(self.year, i, 1))
 
-        month_rates = {}
-        if self.branch:
-            base_currency = self.branch.currency.iso_code
-        else:
-            base_currency = getattr(settings, 'BASE_CURRENCY', 'EUR')
-        for month in months:
-            for currency in Currency.objects.all():
-                rate = 1
-                if not currency.iso_code == base_currency:
-                    rates = CurrencyRateHistory.objects.filter(
-                        rate__from_currency=currency,
-                        rate__to_currency__iso_code=base_currency,
-                    )
-                    try:
-                        rate = decimal.Decimal(rates.filter(
-                            date__year=month.year,
-                            date__month=month.month,
-                        )[0].value)
-                    except IndexError:
-                        # Get latest rate history record
-                        rate = decimal.Decimal(rates[0].value)
-                if month not in month_rates:
-                    month_rates[month] = {}
-                month_rates[month][currency.pk] = decimal.Decimal(rate)
-
-        for row in qs_income:
-            row['month'] = d(row['month']).date()
-            row['amount_gross__sum'] = \
-                row['amount_gross__sum'] \
-                * month_rates[row['month']][row['currency']]
-
+        summaries = reports.get_month_summaries(
+            months, self.get_base_currency(), self.branch,
+            past_months_of_year)
         income_total = {}
-        for row in qs_income:
-            if row['month'] not in income_total:
-                income_total[row['month']] = 0
-            income_total[row['month']] += row['amount_gross__sum']
-
-        qs_expenses = qs_year.filter(
-            transaction_type=WITHDRAWAL).values(
-                'month', 'currency').annotate(
-                    Sum('amount_gross')).order_by('currency', 'month')
-
-        for row in qs_expenses:
-            row['month'] = d(row['month']).date()
-            row['amount_gross__sum'] = \
-                row['amount_gross__sum'] \
-                * month_rates[row['month']][row['currency']]
-
         expenses_total = {}
-        for row in qs_expenses:
-            if row['month'] not in expenses_total:
-                expenses_total[row['month']] = 0
-            expenses_total[row['month']] += row['amount_gross__sum']
-
         profit_total = {}
-        for month in months:
-            try:
-                profit_total[month] = \
-                    income_total[month] - expenses_total[month]
-            except KeyError:
-                pass
-
-        # This adds a new column to the query which only holds the month
-        # of the invoice_date and payment_date
-        truncate_invoice_date = connection.ops.date_trunc_sql(
-            'month', 'invoice_date')
-        truncate_transaction_date = connection.ops.date_trunc_sql(
-            'month', 'transaction_date')
-        truncate_payment_date = connection.ops.date_trunc_sql(
-            'payment_month', 'payment_date')
-        invoices = models.Invoice.objects.filter(invoice_date__year=self.year)
-        if self.branch:
-            invoices = invoices.filter(branch=self.branch)
-        qs_invoices_year = invoices.extra({
-            'month': truncate_invoice_date,
-            'payment_month': truncate_payment_date,
-        })
-
-        qs_new = qs_invoices_year.filter(invoice_type=DEPOSIT)
-        qs_new = qs_new.values('month', 'currency')
-        qs_new = qs_new.annotate(Sum('value_gross'))
-        qs_new = qs_new.order_by('currency', 'month')
-
-        for row in qs_new:
-            row['month'] = d(row['month']).date()
-            row['value_gross__sum'] = \
-                row['value_gross__sum'] \
-                * month_rates[row['month']][row['currency']]
-
         new_total = {}
-        for row in qs_new:
-            if row['month'] not in new_total:
-                new_total[row['month']] = 0
-            new_total[row['month']] += row['value_gross__sum']
-        for month in months:
-            if month not in new_total:
-                new_total[month] = 0
-
         outstanding_total = {}
-        for month in months:
-            # for each month, we want to Sum the invoices, that were still
-            # outstanding as of that month. An invoice sent in February and
-            # paid in May would appear as outstanding on the months February,
-            # March, April.
-            if month.month > past_months_of_year:
-                # In the current year, we don't want to save values for future
-                # months
-                break
-
-            next_month = month + relativedelta.relativedelta(months=1)
-
-            # TODO: Centralise this, we have this select in
-            # get_outstanding_invoices already
-            invoices = models.Invoice.objects.filter(
-                Q(invoice_date__lt=next_month),
-                Q(payment_date__isnull=True) | Q(payment_date__gte=next_month))
-            if self.branch:
-                invoices = invoices.filter(branch=self.branch)
-            invoices = invoices.prefetch_related('transactions')
-            invoices = invoices.extra({'month': truncate_invoice_date, })
-            invoices = invoices.values('currency')
-            qs = invoices.annotate(value_sum=Sum('value_gross'))
-            qs_outstanding_month = qs.order_by('currency')
-
-            for row in qs_outstanding_month:
-                row['value_sum'] = row['value_sum'] * month_rates[month][
-                    row['currency']]
-                try:
-                    outstanding_total[month] += row['value_sum']
-                except KeyError:
-                    outstanding_total[month] = row['value_sum']
-
-        partial_payments_total = {}
-        for month in months:
-            if month.month > past_months_of_year:
-                # In the current year, we don't want to save values for future
-                # months
-                break
-
-            next_month = month + relativedelta.relativedelta(months=1)
-
-            txns = models.Transaction.objects.filter(
-                invoice__invoice_date__lt=next_month,
-                transaction_date__lt=next_month,
-                invoice__payment_date__isnull=True)
-            if self.branch:
-                txns = txns.filter(
-                    Q(invoice__branch=self.branch) |
-                    Q(account__branch=self.branch))
-            txns = txns.extra({'month': truncate_transaction_date, })
-            txns = txns.values('currency')
-            qs = txns.annotate(value_sum=Sum('value_gross'))
-            qs_partial_payments_month = qs.order_by('currency')
-
-            for row in qs_partial_payments_month:
-                row['value_sum'] = row['value_sum'] * month_rates[month][
-                    row['currency']]
-                try:
-                    partial_payments_total[month] += row['value_sum']
-                except KeyError:
-                    partial_payments_total[month] = row['value_sum']
-            if partial_payments_total.get(month):
-                try:
-                    outstanding_total[month] -= partial_payments_total[month]
-                except KeyError:
-                    outstanding_total[month] = \
-                        0 - partial_payments_total[month]
-
         balance_total = {}
-        for month in months:
-            if month.month > past_months_of_year:
-                # In the current year, we don't want to save values for future
-                # months
-                break
-
-            month_end = month + relativedelta.relativedelta(
-                months=1, seconds=-1)
-            accounts = models.Account.objects.filter(active=True)
-            if self.branch:
-                accounts = accounts.filter(branch=self.branch)
-            for account in accounts:
-                qs_balance = models.Transaction.objects.filter(
-                    account=account,
-                    parent__isnull=True,
-                    transaction_date__lte=month_end,
-                ).aggregate(Sum('value_gross'))
-                try:
-                    qs_balance['value_gross__sum'] += account.initial_amount
-                except TypeError:
-                    # happens when there are no Transactions for that month
-                    qs_balance['value_gross__sum'] = 0
-                    qs_balance['value_gross__sum'] += account.initial_amount
-                if not account.currency.iso_code == base_currency:
-                    qs_balance['value_gross__sum'] = \
-                        qs_balance['value_gross__sum'] \
-                        * month_rates[month][account.currency.pk]
-                if month not in balance_total:
-                    balance_total[month] = 0
-                balance_total[month] += qs_balance['value_gross__sum']
+        for summary in summaries:
+            month = summary.month
+            if summary.income is not None:
+                income_total[month] = summary.income
+            if summary.expenses is not None:
+                expenses_total[month] = summary.expenses
+            if summary.income is not None and summary.expenses is not None:
+                profit_total[month] = summary.income - summary.expenses
+            new_total[month] = summary.new
+            if summary.outstanding is not None:
+                outstanding_total[month] = summary.outstanding
+            if summary.balance is not None:
+                balance_total[month] = summary.balance
 
         equity_total = {}
         income_total_total = 0
@@ -739,6 +611,25 @@ class PayeeUpdateView(PayeeMixin, generic.UpdateView):
 class AccountListView(BranchMixin, generic.ListView):
     model = models.Account
 
+    def get_queryset(self):
+        return super(AccountListView, self).get_queryset().select_related(
+            'currency')
+
+    def get_context_data(self, **kwargs):
+        ctx = super(AccountListView, self).get_context_data(**kwargs)
+        # The balances up until today are the live total amounts without the
+        # transactions, that are dated in the future
+        accounts = list(ctx['object_list'])
+        future = dict(models.Transaction.objects.filter(
+            account__in=accounts, parent__isnull=True,
+            transaction_date__gt=now().date(),
+        ).order_by().values_list('account').annotate(Sum('value_gross')))
+        for account in accounts:
+            account.current_balance = account.total_amount - future.get(
+                account.pk, 0)
+        ctx.update({'object_list': accounts, 'account_list': accounts})
+        return ctx
+
 
 class InvoiceMixin(object):
     model = models.Invoice
@@ -827,20 +718,73 @@ class TransactionExportView(BranchMixin, generic.FormView):
         return kwargs
 
     def form_valid(self, form):
-        txns = models.Transaction.objects.filter(
-            transaction_date__gte=form.cleaned_data['start'],
-            transaction_date__lte=form.cleaned_data['end'],
-        )
-        if self.branch:
-            txns = txns.filter(
-                Q(account__branch=self.branch) |
-                Q(invoice__branch=self.branch))
-        dataset = models.TransactionResource().export(
-            queryset=txns.order_by('-transaction_date', '-pk')
-        )
-        response = HttpResponse(dataset.xls, content_type="application/csv")
+        if form.cleaned_data.get('background'):
+            job = models.ExportJob.objects.create(
+                user=self.request.user,
+                branch=self.branch,
+                start=form.cleaned_data['start'],
+                end=form.cleaned_data['end'],
+                export_format=form.cleaned_data['format'],
+            )
+            jobs.get_runner()(job)
+            return redirect('account_keeping_export_job', pk=job.pk)
+        txns = exports.get_transactions(
+            form.cleaned_data['start'], form.cleaned_data['end'], self.branch)
+        export_format = form.cleaned_data['format']
+        if export_format == 'csv':
+            response = StreamingHttpResponse(
+                exports.stream_csv(txns), content_type='text/csv')
+        elif export_format == 'xlsx':
+            response = FileResponse(
+                exports.write_xlsx(txns),
+                content_type=('application/vnd.openxmlformats-officedocument'
+                              '.spreadsheetml.sheet'))
+        elif export_format == 'parquet':
+            output = tempfile.TemporaryFile()
+            exports.write_parquet(txns, exports.TRANSACTION_COLUMNS, output)
+            output.seek(0)
+            response = FileResponse(
+                output, content_type='application/octet-stream')
+        else:
+            txns = txns.select_related(
+                'parent', 'invoice', 'payee', 'category', 'currency')
+            dataset = models.TransactionResource().export(queryset=txns)
+            response = HttpResponse(
+                dataset.xls, content_type="application/csv")
         response['Content-Disposition'] = \
-            u'attachment; filename="{} - {}.xls"'.format(
+            u'attachment; filename="{} - {}.{}"'.format(
                 form.cleaned_data['start'],
-                form.cleaned_data['end'])
+                form.cleaned_data['end'],
+                export_format)
+        return response
+
+
+class ExportJobMixin(object):
+    """Limits the export jobs to the ones of the current user."""
+    model = models.ExportJob
+
+    def get_queryset(self):
+        return super(ExportJobMixin, self).get_queryset().filter(
+            user=self.request.user)
+
+
+class ExportJobView(BranchMixin, ExportJobMixin, generic.DetailView):
+    """Shows the progress and the download link of an export job."""
+    pass
+
+
+class ExportJobDownloadView(BranchMixin, ExportJobMixin, generic.DetailView):
+    """Serves the file of a finished export job to its user."""
+    def get_queryset(self):
+        return super(ExportJobDownloadView, self).get_queryset().filter(
+            status='done').exclude(file='')
+
+    def render_to_response(self, context, **response_kwargs):
+        job = self.object
+        response = FileResponse(
+            job.file.storage.open(job.file.name, 'rb'),
+            content_type='application/octet-stream')
+        response['Content-Disposition'] = \
+            u'attachment; filename="{} - {}.{}"'.format(
+                job.start, job.end, job.export_format)
         return response
@@ -33,7 +33,7 @@ import account_keeping as app
 
 
 install_requires = [
-    'django',
+    'django>=1.11,<2.0',
     'django-libs>=1.61.1',
     'python-dateutil',
     'django-currency-history',